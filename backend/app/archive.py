@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# -----------------------------
+# 冷数据归档：过了 ARCHIVE_AFTER_DAYS 的 raw_logs 搬出 MySQL，写成不可变的列式段文件
+#   段文件 seg-<min_id>-<max_id>.lvc：
+#     [MAGIC][列块...][footer JSON][4 字节 footer 长度][MAGIC]
+#   列编码（全部 zlib 压缩）：
+#     id / created_at：int64 差分（相邻行差值很小，压缩后每行 1~2 字节）
+#     source / host / level：字典编码，字典放 footer，列里只存 uint8/uint16 下标
+#     message：每 ARCHIVE_BLOCK_ROWS 行一个块（长度数组 + 拼接的 utf-8），按需解压
+#   footer 里有段级索引：min/max id、min/max 时间（q 是子串匹配，不按 IP 集合裁剪段）
+# 读取走 mmap，查询先用 footer 裁剪段，再只解压命中的列 / 消息块。
+# -----------------------------
+ARCHIVE_DIR = os.getenv(
+    "ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "archive")
+)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))  # 0 = 不归档
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "365"))
+ARCHIVE_SEGMENT_ROWS = int(os.getenv("ARCHIVE_SEGMENT_ROWS", "200000"))
+ARCHIVE_BLOCK_ROWS = int(os.getenv("ARCHIVE_BLOCK_ROWS", "4096"))
+ARCHIVE_CACHE_SEGMENTS = int(os.getenv("ARCHIVE_CACHE_SEGMENTS", "8"))
+
+MAGIC = b"LVCOL001"
+_TAIL = struct.Struct("<I")
+_DICT_COLUMNS = ("source", "host", "level")
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_secs(dt: Optional[datetime]) -> int:
+    # created_at 是 naive 的库时间，按原样存“墙上时间”秒数，读回来还是同一个 naive datetime
+    return int((dt - _EPOCH).total_seconds()) if dt else 0
+
+
+def _from_secs(s: int) -> datetime:
+    return _EPOCH + timedelta(seconds=s)
+
+
+def _code_type(n: int) -> str:
+    return "B" if n <= 0xFF else ("H" if n <= 0xFFFF else "I")
+
+
+class ColdRow:
+    """和 RawLog ORM 对象同名属性，/logs/recent 和溯源代码可以直接混用"""
+    __slots__ = ("id", "created_at", "source", "host", "level", "message")
+
+    def __init__(self, id: int, created_at: datetime, source: str, host: str, level: str, message: str):
+        self.id = id
+        self.created_at = created_at
+        self.source = source
+        self.host = host
+        self.level = level
+        self.message = message
+
+
+# -----------------------------
+# 写
+# -----------------------------
+def write_segment(directory: str, rows: Sequence[Tuple[int, datetime, str, str, str, str]],
+                  block_rows: int = ARCHIVE_BLOCK_ROWS) -> str:
+    """rows 按 id 升序：(id, created_at, source, host, level, message)。先写 tmp 再 rename，半截文件不会被读到。"""
+    if not rows:
+        raise ValueError("empty segment")
+    os.makedirs(directory, exist_ok=True)
+    body = bytearray(MAGIC)
+    columns: Dict[str, Any] = {}
+
+    def put(name: str, raw: bytes, **meta: Any) -> None:
+        data = zlib.compress(raw, 6)
+        columns[name] = {"off": len(body), "len": len(data), **meta}
+        body.extend(data)
+
+    ids = [r[0] for r in rows]
+    secs = [_to_secs(r[1]) for r in rows]
+    put("id", array("q", [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]).tobytes())
+    put("ts", array("q", [secs[0]] + [b - a for a, b in zip(secs, secs[1:])]).tobytes())
+
+    dicts: Dict[str, List[str]] = {}
+    for ci, name in enumerate(_DICT_COLUMNS, start=2):
+        values: Dict[str, int] = {}
+        codes = [values.setdefault(r[ci] or "", len(values)) for r in rows]
+        dicts[name] = list(values)
+        tc = _code_type(len(values))
+        put(name, array(tc, codes).tobytes(), type=tc)
+
+    blocks = []
+    for start in range(0, len(rows), block_rows):
+        chunk = [(r[5] or "").encode("utf-8") for r in rows[start:start + block_rows]]
+        raw = array("I", [len(m) for m in chunk]).tobytes() + b"".join(chunk)
+        data = zlib.compress(raw, 6)
+        blocks.append({"off": len(body), "len": len(data), "start": start, "rows": len(chunk)})
+        body.extend(data)
+
+    footer = json.dumps({
+        "version": 1,
+        "rows": len(rows),
+        "min_id": ids[0],
+        "max_id": ids[-1],
+        "min_ts": min(secs),
+        "max_ts": max(secs),
+        "dicts": dicts,
+        "columns": columns,
+        "msg_blocks": blocks,
+    }, separators=(",", ":")).encode("utf-8")
+    body.extend(footer)
+    body.extend(_TAIL.pack(len(footer)))
+    body.extend(MAGIC)
+
+    name = f"seg-{ids[0]:012d}-{ids[-1]:012d}.lvc"
+    path = os.path.join(directory, name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+# -----------------------------
+# 读（mmap）
+# -----------------------------
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(MAGIC)] != MAGIC or mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"bad segment: {path}")
+        flen = _TAIL.unpack(mm[-len(MAGIC) - _TAIL.size:-len(MAGIC)])[0]
+        fend = len(mm) - len(MAGIC) - _TAIL.size
+        self.meta: Dict[str, Any] = json.loads(mm[fend - flen:fend].decode("utf-8"))
+        self._cols: Dict[str, Any] = {}
+        # ColdArchive 的 LRU 引用计数：扫描中被淘汰的段等最后一个读者放手再关 mmap
+        self.refs = 0
+        self.evicted = False
+
+    # footer 里的段级信息
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"]
+
+    @property
+    def min_id(self) -> int:
+        return self.meta["min_id"]
+
+    @property
+    def max_id(self) -> int:
+        return self.meta["max_id"]
+
+    def close(self) -> None:
+        try:
+            self._mm.close()
+        finally:
+            self._f.close()
+
+    def _raw(self, c: Dict[str, Any]) -> bytes:
+        return zlib.decompress(self._mm[c["off"]:c["off"] + c["len"]])
+
+    def _delta(self, name: str) -> List[int]:
+        out = array("q", self._raw(self.meta["columns"][name])).tolist()
+        for i in range(1, len(out)):
+            out[i] += out[i - 1]
+        return out
+
+    def column(self, name: str) -> Any:
+        """id / ts 解码成 list[int]；字典列解码成下标 array（和 dicts[name] 对应）"""
+        col = self._cols.get(name)
+        if col is None:
+            if name in ("id", "ts"):
+                col = self._delta(name)
+            else:
+                c = self.meta["columns"][name]
+                col = array(c["type"], self._raw(c))
+            self._cols[name] = col
+        return col
+
+    def message_block(self, bi: int) -> List[str]:
+        b = self.meta["msg_blocks"][bi]
+        raw = self._raw(b)
+        n = b["rows"]
+        lens = array("I", raw[:4 * n])
+        out, pos = [], 4 * n
+        for ln in lens:
+            out.append(raw[pos:pos + ln].decode("utf-8", errors="replace"))
+            pos += ln
+        return out
+
+    def _codes_for(self, name: str, wanted: Optional[Sequence[str]]) -> Optional[frozenset]:
+        """过滤值 -> 字典下标；返回空集表示本段不可能命中；None 表示不过滤（不区分大小写，同 dims.ids_matching）"""
+        want = {w.strip().casefold() for w in wanted or () if w and w.strip()}
+        if not want:
+            return None
+        return frozenset(i for i, v in enumerate(self.meta["dicts"][name]) if v.casefold() in want)
+
+    def scan(self, before_id: Optional[int] = None, after_id: Optional[int] = None,
+             t0: Optional[datetime] = None, t1: Optional[datetime] = None, t1_inclusive: bool = False,
+             source: Optional[Sequence[str]] = None, host: Optional[Sequence[str]] = None,
+             level: Optional[Sequence[str]] = None, q: Optional[str] = None,
+             newest_first: bool = True) -> Iterator[ColdRow]:
+        m = self.meta
+        lo_s = _to_secs(t0) if t0 else None
+        hi_s = _to_secs(t1) if t1 else None
+        if before_id is not None and m["min_id"] >= before_id:
+            return
+        if after_id is not None and m["max_id"] <= after_id:
+            return
+        if lo_s is not None and m["max_ts"] < lo_s:
+            return
+        if hi_s is not None and (m["min_ts"] > hi_s or (m["min_ts"] == hi_s and not t1_inclusive)):
+            return
+
+        filters = []
+        for name, wanted in (("source", source), ("host", host), ("level", level)):
+            codes = self._codes_for(name, wanted)
+            if codes is not None:
+                if not codes:
+                    return
+                filters.append((self.column(name), codes))
+
+        ids = self.column("id")
+        ts = self.column("ts")
+        kw = q.lower() if q else ""
+        block_rows = m["msg_blocks"][0]["rows"] if m["msg_blocks"] else 1
+        cur_block, msgs = -1, []
+        dicts = m["dicts"]
+        src_c, host_c, lvl_c = self.column("source"), self.column("host"), self.column("level")
+
+        rng = range(len(ids) - 1, -1, -1) if newest_first else range(len(ids))
+        for i in rng:
+            rid = ids[i]
+            if before_id is not None and rid >= before_id:
+                continue
+            if after_id is not None and rid <= after_id:
+                continue
+            s = ts[i]
+            if lo_s is not None and s < lo_s:
+                continue
+            if hi_s is not None and (s > hi_s or (s == hi_s and not t1_inclusive)):
+                continue
+            if any(col[i] not in codes for col, codes in filters):
+                continue
+            bi = i // block_rows
+            if bi != cur_block:
+                msgs, cur_block = self.message_block(bi), bi
+            msg = msgs[i - bi * block_rows]
+            if kw and kw not in msg.lower():
+                continue
+            yield ColdRow(rid, _from_secs(s), dicts["source"][src_c[i]], dicts["host"][host_c[i]],
+                          dicts["level"][lvl_c[i]], msg)
+
+
+class ColdArchive:
+    """段目录的只读视图；目录有变化（归档任务 / 其他 worker 写了新段）时重新加载 footer"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, cache_segments: int = ARCHIVE_CACHE_SEGMENTS):
+        self.directory = directory
+        self.cache_segments = max(1, cache_segments)
+        self._lock = threading.Lock()
+        self._catalog: List[Dict[str, Any]] = []  # footer 摘要，按 max_id 降序
+        self._dir_mtime: Optional[float] = None
+        self._open: "OrderedDict[str, Segment]" = OrderedDict()
+        self.queries = 0
+        self.segments_scanned = 0
+
+    def _refresh(self) -> None:
+        try:
+            mtime = os.stat(self.directory).st_mtime
+        except FileNotFoundError:
+            self._catalog, self._dir_mtime = [], None
+            return
+        if mtime == self._dir_mtime:
+            return
+        catalog = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith("seg-") and name.endswith(".lvc")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                seg = self._segment(path)
+            except Exception:
+                continue
+            m = seg.meta
+            catalog.append({"path": path, "rows": m["rows"], "min_id": m["min_id"], "max_id": m["max_id"],
+                            "min_ts": m["min_ts"], "max_ts": m["max_ts"], "bytes": os.path.getsize(path)})
+        catalog.sort(key=lambda c: c["max_id"], reverse=True)
+        live = {c["path"] for c in catalog}
+        for p in [p for p in self._open if p not in live]:
+            self._evict(self._open.pop(p))
+        self._catalog, self._dir_mtime = catalog, mtime
+
+    @staticmethod
+    def _evict(seg: Segment) -> None:
+        if seg.refs:
+            seg.evicted = True  # 还有查询在扫，_release 时再关
+        else:
+            seg.close()
+
+    def _segment(self, path: str) -> Segment:
+        seg = self._open.get(path)
+        if seg is not None:
+            self._open.move_to_end(path)
+            return seg
+        seg = Segment(path)
+        self._open[path] = seg
+        while len(self._open) > self.cache_segments:
+            self._evict(self._open.popitem(last=False)[1])
+        return seg
+
+    def _acquire(self, path: str) -> Segment:
+        with self._lock:
+            seg = self._segment(path)
+            seg.refs += 1
+            return seg
+
+    def _release(self, seg: Segment) -> None:
+        with self._lock:
+            seg.refs -= 1
+            if seg.refs == 0 and seg.evicted:
+                seg.close()
+
+    def max_id(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._catalog[0]["max_id"] if self._catalog else 0
+
+    def empty(self) -> bool:
+        with self._lock:
+            self._refresh()
+            return not self._catalog
+
+    def query(self, limit: int, before_id: Optional[int] = None, newest_first: bool = True,
+              **filters: Any) -> List[ColdRow]:
+        """
+        /logs/recent 同款过滤：before_id/after_id、t0/t1、source/host/level（列表）、q（子串，不区分大小写）。
+        newest_first=True 从新到旧取 limit 条；False 从旧到新（溯源时间窗口）。
+        """
+        # 锁只保护 catalog / LRU：段列表拷贝出来，扫描在锁外进行，慢查询不挡其他查询
+        out: List[ColdRow] = []
+        with self._lock:
+            self._refresh()
+            self.queries += 1
+            catalog = list(self._catalog if newest_first else reversed(self._catalog))
+        for c in catalog:
+            if len(out) >= limit:
+                break
+            if before_id is not None and c["min_id"] >= before_id:
+                continue
+            try:
+                seg = self._acquire(c["path"])
+            except FileNotFoundError:
+                continue  # 刚被保留任务删掉
+            try:
+                self.segments_scanned += 1
+                for row in seg.scan(before_id=before_id, newest_first=newest_first, **filters):
+                    out.append(row)
+                    if len(out) >= limit:
+                        break
+            finally:
+                self._release(seg)
+        return out
+
+    def iter_rows(self, newest_first: bool = False, **filters: Any) -> Iterator[ColdRow]:
+        """
+        导出用：不限条数，逐段流式读出（同一时刻只解码一个段）。
+        段单独打开、读完即关，不进 LRU 缓存——长时间导出既不占查询的缓存槽，也不会被淘汰关掉 mmap
+        """
+        with self._lock:
+            self._refresh()
+            self.queries += 1
+            catalog = list(self._catalog if newest_first else reversed(self._catalog))
+        for c in catalog:
+            try:
+                seg = Segment(c["path"])
+            except FileNotFoundError:
+                continue  # 导出期间被保留任务删掉了
+            try:
+                self.segments_scanned += 1
+                yield from seg.scan(newest_first=newest_first, **filters)
+            finally:
+                seg.close()
+
+    def drop_older_than(self, cutoff: datetime) -> List[str]:
+        """段内最新一条都早于 cutoff 才删（段是不可变的，不做段内删除）"""
+        cut = _to_secs(cutoff)
+        removed = []
+        with self._lock:
+            self._refresh()
+            for c in self._catalog:
+                if c["max_ts"] < cut:
+                    seg = self._open.pop(c["path"], None)
+                    if seg is not None:
+                        self._evict(seg)
+                    os.remove(c["path"])
+                    removed.append(os.path.basename(c["path"]))
+            self._dir_mtime = None
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            cat = self._catalog
+            return {
+                "directory": self.directory,
+                "segments": len(cat),
+                "rows": sum(c["rows"] for c in cat),
+                "bytes": sum(c["bytes"] for c in cat),
+                "min_id": cat[-1]["min_id"] if cat else None,
+                "max_id": cat[0]["max_id"] if cat else None,
+                "oldest": _from_secs(min(c["min_ts"] for c in cat)).isoformat(sep=" ") if cat else None,
+                "newest": _from_secs(max(c["max_ts"] for c in cat)).isoformat(sep=" ") if cat else None,
+                "open_segments": len(self._open),
+                "queries": self.queries,
+                "segments_scanned": self.segments_scanned,
+            }
+
+
+cold_archive = ColdArchive()
+
+
+def archive_enabled() -> bool:
+    return ARCHIVE_AFTER_DAYS > 0 or not cold_archive.empty()
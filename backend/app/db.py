@@ -1,7 +1,13 @@
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import DateTime, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()  # 读取 backend/.env
 
@@ -11,17 +17,138 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "root")
 MYSQL_DB = os.getenv("MYSQL_DB", "bishe")
 
-DATABASE_URL = (
+# DATABASE_URL 优先；没设置时按 MYSQL_* 拼 MySQL 地址
+# 单机 / 边缘部署：DATABASE_URL=sqlite:///./data/logvision.db（WAL，无外部依赖）
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
     "?charset=utf8mb4"
 )
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600)
+# 连接池：同步 engine 给 ingest / 后台任务 / tools 用；异步 engine 给历史查询接口用
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "20"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "20"))
+
+# SQLite：WAL 下读写互不阻塞；synchronous=NORMAL 时提交不 fsync（只在 checkpoint 时刷盘），
+# 断电最多丢最后几个事务、不会损坏库
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": str(-int(os.getenv("SQLITE_CACHE_MB", "64")) * 1024),
+    "mmap_size": str(int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024),
+    "temp_store": "MEMORY",
+    "wal_autocheckpoint": "1000",
+}
+
+
+def _engine_kwargs(url: str) -> dict:
+    if url.startswith("sqlite"):
+        kw = {"connect_args": {"check_same_thread": False, "timeout": 30}}
+        if ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite+aiosqlite:"):
+            kw.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        return kw
+    return dict(
+        pool_pre_ping=True,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+
+def _ensure_sqlite_dir(url: str) -> None:
+    path = make_url(url).database
+    if path and path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    for k, v in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {k}={v}")
+    cur.close()
+
+
+def _read_only(url: str):
+    # 只读库连接上兜底：误把写操作发到只读 engine 时直接报错，而不是写进从库造成主从不一致
+    sql = "PRAGMA query_only=1" if url.startswith("sqlite") else "SET SESSION TRANSACTION READ ONLY"
+
+    def on_connect(dbapi_conn, _record) -> None:
+        cur = dbapi_conn.cursor()
+        cur.execute(sql)
+        cur.close()
+
+    return on_connect
+
+
+def _build_engine(url: str, read_only: bool = False):
+    sqlite = url.startswith("sqlite")
+    if sqlite:
+        _ensure_sqlite_dir(url)
+    e = create_engine(url, **_engine_kwargs(url))
+    if sqlite:
+        event.listen(e, "connect", _sqlite_pragmas)
+    if read_only:
+        event.listen(e, "connect", _read_only(url))
+    return e
+
+
+engine = _build_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+
+# -----------------------------
+# 读写分离：历史查询（/logs/recent、/alerts、evidence、trace case、溯源窗口扫描）走只读库，
+# ingest / 告警 / case 写入始终走主库
+#   DATABASE_READ_URL：只读库地址；或只设 MYSQL_READ_HOST / MYSQL_READ_PORT，其余沿用 MYSQL_*
+#   都不设：读写共用同一个 engine（和拆分前完全一样）；
+#   DATABASE_READ_URL 设成和主库同一个地址：同一台服务器，但读查询用独立连接池，不和写入抢连接
+# 复制延迟的兜底（read-your-writes）：
+#   - 按 id 查单条（刚推送出去的告警的 evidence / trace）：只读库没查到再去主库查一次
+#   - 溯源窗口扫描：窗口结束时间超过只读库已复制到的最新日志时间，直接在主库扫（见 trace/builder.py）
+# -----------------------------
+MYSQL_READ_HOST = os.getenv("MYSQL_READ_HOST", "").strip()
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or (
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_READ_HOST}:{os.getenv('MYSQL_READ_PORT', str(MYSQL_PORT))}"
+    f"/{MYSQL_DB}?charset=utf8mb4" if MYSQL_READ_HOST else ""
+)
+HAS_READ_REPLICA = bool(DATABASE_READ_URL)
+
+read_engine = _build_engine(DATABASE_READ_URL, read_only=True) if HAS_READ_REPLICA else engine
+ReadSessionLocal = (
+    sessionmaker(bind=read_engine, autocommit=False, autoflush=False) if HAS_READ_REPLICA else SessionLocal
+)
+read_stats = {"primary_fallbacks": 0, "window_scans_replica": 0, "window_scans_primary": 0}
+
 class Base(DeclarativeBase):
     pass
 
+
+class db_now(FunctionElement):
+    """
+    created_at 的 server_default / 过期时间计算：数据库当前的本地时间。
+    MySQL 的 CURRENT_TIMESTAMP 就是会话时区；SQLite 的 CURRENT_TIMESTAMP 是 UTC，要换成 localtime，
+    否则两种后端存进去的时间差 8 小时。
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(db_now)
+def _db_now_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(db_now, "sqlite")
+def _db_now_sqlite(element, compiler, **kw):
+    return "(datetime('now', 'localtime'))"
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -29,3 +156,128 @@ def get_db():
     finally:
         db.close()
 
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def read_with_fallback(fn, db, *args):
+    """fn(db, *args) 在只读库上返回 None 时（复制还没追上），用主库再查一次"""
+    out = fn(db, *args)
+    if out is None and HAS_READ_REPLICA:
+        read_stats["primary_fallbacks"] += 1
+        with SessionLocal() as p:
+            out = fn(p, *args)
+    return out
+
+
+# -----------------------------
+# 异步 DB 层（aiomysql）：历史查询接口在事件循环里直接 await，不占线程池
+# 驱动没装 / DB_ASYNC=0 时 get_async_db 给出同步 Session 的包装，
+# execute 丢进线程池执行，接口代码不用区分两种情况
+# -----------------------------
+_ASYNC_DRIVERS = {"mysql+pymysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def _build_async_engine(sync_url: str, read_only: bool = False):
+    if not DB_ASYNC:
+        return None, "disabled"
+    try:
+        url = _async_url(sync_url)
+        kw = _engine_kwargs(url)
+        if "pool_size" in kw:
+            kw.update(pool_size=DB_ASYNC_POOL_SIZE, max_overflow=DB_ASYNC_MAX_OVERFLOW)
+        e = create_async_engine(url, **kw)
+        if url.startswith("sqlite"):
+            event.listen(e.sync_engine, "connect", _sqlite_pragmas)
+        if read_only:
+            event.listen(e.sync_engine, "connect", _read_only(url))
+        return e, None
+    except Exception as ex:  # 典型：ModuleNotFoundError: aiomysql
+        return None, repr(ex)
+
+
+def _async_sessionmaker(e):
+    return async_sessionmaker(bind=e, expire_on_commit=False, autoflush=False) if e is not None else None
+
+
+async_engine, async_engine_error = _build_async_engine(DATABASE_URL)
+AsyncSessionLocal = _async_sessionmaker(async_engine)
+if HAS_READ_REPLICA:
+    async_read_engine, async_read_engine_error = _build_async_engine(DATABASE_READ_URL, read_only=True)
+    AsyncReadSessionLocal = _async_sessionmaker(async_read_engine)
+else:
+    async_read_engine, async_read_engine_error = async_engine, async_engine_error
+    AsyncReadSessionLocal = AsyncSessionLocal
+
+
+class ThreadedSession:
+    """同步 Session 的 await 包装：只覆盖历史接口用到的 execute / get"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.session.execute, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.session.get, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.session.close)
+
+
+@asynccontextmanager
+async def _async_session(maker, sync_maker):
+    if maker is not None:
+        async with maker() as db:
+            yield db
+        return
+    db = ThreadedSession(sync_maker())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def async_primary_session():
+    """async with async_primary_session() as db：主库（写入 / 只读库查不到时兜底）"""
+    return _async_session(AsyncSessionLocal, SessionLocal)
+
+
+async def get_async_db():
+    async with _async_session(AsyncSessionLocal, SessionLocal) as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with _async_session(AsyncReadSessionLocal, ReadSessionLocal) as db:
+        yield db
+
+
+def _pool_info(e, e_async, async_error):
+    out = {
+        "sync": {"url": e.url.render_as_string(hide_password=True), "pool": e.pool.status()},
+        "async": {"enabled": e_async is not None, "error": async_error},
+    }
+    if e_async is not None:
+        out["async"]["url"] = e_async.url.render_as_string(hide_password=True)
+        out["async"]["pool"] = e_async.pool.status()
+    return out
+
+
+def db_pool_stats():
+    out = _pool_info(engine, async_engine, async_engine_error)
+    out["read"] = {"replica": HAS_READ_REPLICA, **read_stats}
+    if HAS_READ_REPLICA:
+        out["read"].update(_pool_info(read_engine, async_read_engine, async_read_engine_error))
+    return out
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db import engine as default_engine
+from .models import LogHost, LogLevel, LogSource, RawLog
+
+
+# -----------------------------
+# raw_logs 的维度表（log_sources / log_hosts / log_levels）：name <-> id 进程内缓存
+# - 写：flush 前把 RawLog 上的名字换成 id；命中缓存不访问数据库，
+#       新名字用单独的短事务插入维度表（不跟着业务事务回滚，缓存里的 id 始终有效）
+# - 读：id -> name 查缓存，缓存里没有（别的 worker 新插入的）就整表重载，维度表只有几十行
+# -----------------------------
+class DimCache:
+    def __init__(self, model: Any, kind: str, max_len: int, default: str):
+        self.model = model
+        self.kind = kind
+        self.max_len = max_len
+        self.default = default
+        self._lock = threading.Lock()
+        self._by_name: Dict[str, int] = {}
+        self._by_id: Dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _reload(self, bind: Engine) -> None:
+        with bind.connect() as conn:
+            rows = conn.execute(select(self.model.id, self.model.name)).all()
+        for i, name in rows:
+            self._by_id[i] = name
+            self._by_name.setdefault(name, i)
+        self.reloads += 1
+
+    def id_for(self, bind: Engine, name: Optional[str]) -> int:
+        name = (name if name is not None else self.default)[:self.max_len]
+        i = self._by_name.get(name)
+        if i is not None:
+            self.hits += 1
+            return i
+        with self._lock:
+            i = self._by_name.get(name)
+            if i is not None:
+                return i
+            self.misses += 1
+            model = self.model
+            with bind.begin() as conn:
+                row = conn.execute(select(model.id, model.name).where(model.name == name)).first()
+                if row is None:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(insert(model).values(name=name))
+                    except IntegrityError:
+                        pass  # 别的 worker 刚插入
+                    row = conn.execute(select(model.id, model.name).where(model.name == name)).first()
+            # MySQL *_ci 排序规则下 "WEB" 会命中已有的 "web"：两个名字都指向同一个 id
+            self._by_name[name] = row.id
+            self._by_id.setdefault(row.id, row.name)
+            return row.id
+
+    def name(self, dim_id: Optional[int], bind: Optional[Engine] = None) -> str:
+        if dim_id is None:
+            return ""
+        name = self._by_id.get(dim_id)
+        if name is None:
+            with self._lock:
+                if dim_id not in self._by_id:
+                    self._reload(bind or _bind)
+            name = self._by_id.get(dim_id, "")
+        return name
+
+    def missing(self, ids: Iterable[Optional[int]]) -> bool:
+        """有没有缓存里还没有的 id（纯内存判断，可以在事件循环里调用）"""
+        return any(i is not None and i not in self._by_id for i in ids)
+
+    def ensure(self, ids: Iterable[Optional[int]], bind: Optional[Engine] = None) -> None:
+        """批量补缓存：有不认识的 id 就整表 reload 一次；会查库，async 调用方放到线程池里跑"""
+        ids = [i for i in ids if i is not None]
+        if self.missing(ids):
+            with self._lock:
+                if self.missing(ids):
+                    self._reload(bind or _bind)
+
+    def ids_matching(self, names: Iterable[str], bind: Optional[Engine] = None) -> List[int]:
+        """查询过滤用：名字 -> id 列表（不区分大小写，和原来字符串列在 MySQL 上的比较语义一致）；不存在的名字不插入"""
+        wanted = {n.strip().casefold() for n in names if n and n.strip()}
+        if not wanted:
+            return []
+        found = {i for i, n in self._by_id.items() if n.casefold() in wanted}
+        if len({self._by_id[i].casefold() for i in found}) < len(wanted):
+            with self._lock:
+                self._reload(bind or _bind)
+            found = {i for i, n in self._by_id.items() if n.casefold() in wanted}
+        return sorted(found)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._by_id), "hits": self.hits, "misses": self.misses, "reloads": self.reloads}
+
+
+dims: Dict[str, DimCache] = {
+    "source": DimCache(LogSource, "source", 64, "manual"),
+    "host": DimCache(LogHost, "host", 128, "unknown"),
+    "level": DimCache(LogLevel, "level", 16, "INFO"),
+}
+
+_bind: Engine = default_engine
+
+
+def bind_engine(e: Engine) -> None:
+    """维度缓存重载用的 engine（默认 db.engine；脚本 / 其他后端可替换）"""
+    global _bind
+    _bind = e
+    for c in dims.values():
+        c._by_name.clear()
+        c._by_id.clear()
+
+
+def dim_stats() -> Dict[str, Any]:
+    return {k: c.stats() for k, c in dims.items()}
+
+
+@event.listens_for(Session, "before_flush")
+def _resolve_rawlog_dims(session: Session, flush_context: Any, instances: Any) -> None:
+    new_rows = [o for o in session.new if isinstance(o, RawLog)]
+    if not new_rows:
+        return
+    bind = session.get_bind()
+    bind = getattr(bind, "engine", bind)
+    for row in new_rows:
+        for kind, cache in dims.items():
+            pending = f"_pending_{kind}"
+            if pending in row.__dict__ or getattr(row, f"{kind}_id", None) is None:
+                setattr(row, f"{kind}_id", cache.id_for(bind, row.__dict__.pop(pending, None)))
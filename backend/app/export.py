@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+from .db import read_engine
+
+
+# -----------------------------
+# 流式导出（/export/logs、/export/alerts）：NDJSON / CSV
+#   查询走只读库的服务端游标（stream_results + yield_per）：MySQL 用 SSCursor 边读边发，
+#   内存里同时只有一批 EXPORT_YIELD_PER 行 + 一个 EXPORT_CHUNK_BYTES 的输出缓冲，和导出总量无关
+#   客户端中途断开：直接断掉这条连接（invalidate），不把服务端游标里剩下的行读完再还给连接池
+# 吞吐（行数 / 字节 / 耗时）导出结束时累计在 /debug/export（last = 最近一次导出）
+# -----------------------------
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+class ExportStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.active = 0
+        self.exports_total = 0
+        self.aborted_total = 0
+        self.rows_total = 0
+        self.bytes_total = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    def begin(self) -> None:
+        with self._lock:
+            self.active += 1
+
+    def end(self, kind: str, fmt: str, rows: int, nbytes: int, secs: float, aborted: bool) -> Dict[str, Any]:
+        rec = {
+            "kind": kind,
+            "format": fmt,
+            "rows": rows,
+            "bytes": nbytes,
+            "seconds": round(secs, 3),
+            "rows_per_s": round(rows / secs, 1) if secs > 0 else None,
+            "mb_per_s": round(nbytes / secs / 1048576, 2) if secs > 0 else None,
+            "aborted": aborted,
+        }
+        with self._lock:
+            self.active -= 1
+            self.exports_total += 1
+            self.aborted_total += int(aborted)
+            self.rows_total += rows
+            self.bytes_total += nbytes
+            self.last = rec
+        return rec
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "exports_total": self.exports_total,
+                "aborted_total": self.aborted_total,
+                "rows_total": self.rows_total,
+                "bytes_total": self.bytes_total,
+                "last": self.last,
+                "yield_per": EXPORT_YIELD_PER,
+                "chunk_bytes": EXPORT_CHUNK_BYTES,
+            }
+
+
+export_stats = ExportStats()
+
+
+def stream_query(stmt: Any, yield_per: int = EXPORT_YIELD_PER) -> Iterator[Any]:
+    """只读库上用服务端游标逐批取行（Core Row）"""
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=yield_per).execute(stmt)
+        try:
+            for part in result.partitions():
+                yield from part
+        except GeneratorExit:
+            # 服务端游标没读完：断开连接，不逐行排空剩余结果
+            conn.invalidate()
+            raise
+
+
+def _csv_cell(v: Any) -> Any:
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False, default=str)
+    return "" if v is None else v
+
+
+def encode_stream(kind: str, fmt: str, fields: Sequence[str],
+                  rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """行 dict -> 按 EXPORT_CHUNK_BYTES 攒块的字节流；结束（或客户端断开）时记吞吐"""
+    export_stats.begin()
+    t0 = time.perf_counter()
+    n_rows = n_bytes = 0
+    aborted = True
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(fields)
+    try:
+        for d in rows:
+            n_rows += 1
+            if writer is None:
+                buf.write(json.dumps(d, ensure_ascii=False, default=str))
+                buf.write("\n")
+            else:
+                writer.writerow([_csv_cell(d.get(f)) for f in fields])
+            if buf.tell() >= EXPORT_CHUNK_BYTES:
+                chunk = buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+                n_bytes += len(chunk)
+                yield chunk
+        chunk = buf.getvalue().encode("utf-8")
+        if chunk:
+            n_bytes += len(chunk)
+            yield chunk
+        aborted = False
+    finally:
+        export_stats.end(kind, fmt, n_rows, n_bytes, time.perf_counter() - t0, aborted)
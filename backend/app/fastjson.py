@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Response
+
+try:
+    import orjson  # 可选依赖：没装时退回标准库 json，输出一致
+except ImportError:
+    orjson = None
+
+
+# -----------------------------
+# 历史接口的序列化快路径：
+#   接口直接返回 JSONBytes（Response），FastAPI 跳过 response_model 的逐行校验和 jsonable_encoder；
+#   decorator 上的 response_model 保留，只用来生成 OpenAPI 文档——行结构由调用方按同样的字段构造
+#   编码用 orjson（C 实现，直接出 bytes），时间字段在构造行时就格式化成字符串
+# -----------------------------
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str)
+        except TypeError:
+            pass  # 超过 64 位的整数、非字符串 key 等：交给标准库
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def loads(s: Any) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            pass  # NaN / Infinity 这类标准库能解析的非严格 JSON
+    return json.loads(s)
+
+
+class JSONBytes(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def ts_formatter(empty: Optional[str]) -> Callable[[Optional[datetime]], Optional[str]]:
+    """一次响应内复用的时间格式化：同一秒的行很多，命中缓存就不再 strftime"""
+    cache: Dict[datetime, str] = {}
+
+    def fmt(dt: Optional[datetime]) -> Optional[str]:
+        if not dt:
+            return empty
+        s = cache.get(dt)
+        if s is None:
+            s = cache[dt] = dt.strftime("%Y-%m-%d %H:%M:%S")
+        return s
+
+    return fmt
+
+
+def encoder_name() -> str:
+    return "orjson" if orjson is not None else "json"
@@ -2,25 +2,61 @@ from datetime import datetime, timezone, timedelta
 import asyncio
 from typing import Optional, Any, List, Dict
 
-from fastapi import FastAPI, Depends, WebSocket, Query
+from fastapi import FastAPI, Depends, WebSocket, Query, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, and_, false
 from starlette.websockets import WebSocketDisconnect
 
-from .db import engine, Base, get_db
+from .db import (
+    engine, Base, get_db, get_read_db, get_async_read_db, async_primary_session, read_with_fallback,
+    db_pool_stats, HAS_READ_REPLICA, read_stats,
+)
 from .models import RawLog, Alert
+from .migrations import upgrade_schema
+from .search import log_search
+from .retention import setup_partitions, start_retention, retention_stats
+from .archive import archive_enabled, cold_archive
+from .dims import dims, dim_stats
+from .fastjson import JSONBytes, dumps, loads, ts_formatter
+from .export import MEDIA_TYPES as EXPORT_MEDIA_TYPES, encode_stream, export_stats, stream_query
+from .writer import rawlog_writer, start_rawlog_writer, writer_stats
+from .ws_hub import (
+    CLOSE,
+    StreamHub,
+    SubscriptionFilter,
+    Subscriber,
+    rawlog_hub,
+    alert_hub,
+    hub_stats,
+    WS_REPLAY_MAX,
+    WS_REPLAY_CHUNK,
+    SEVERITY_RANK,
+)
+from .ws_proto import (
+    WireOptions,
+    collect_batch,
+    WS_BATCH_MAX,
+    WS_BATCH_MAX_LIMIT,
+    WS_BATCH_MAX_MS,
+    WS_BATCH_MAX_MS_LIMIT,
+)
 from .schemas import IngestLogIn, AlertOut, RawLogOut
 from .stream import (
-    RAWLOG_STREAM_KEY,
-    ALERT_STREAM_KEY,
     publish_rawlog,
     publish_alert,
-    stream_xread,
     get_redis,
     redis_info,
     stream_lengths,
     ensure_streams,
+    async_pool_stats,
+    publish_stats,
+    spool_stats,
+    start_spool_drainer,
+    redis_breaker_stats,
 )
 
 from .services.parser.ssh import parse_ssh_failed
@@ -39,10 +75,16 @@ print("[DEBUG] parse_ssh_failed from:", inspect.getfile(parse_ssh_failed))
 import os
 import time
 import json
+import hashlib
 
 from .services.detection.engine import DetectionEngine
 from .services.detection.state_store import StateStore
 from .services.trace.integrate import integrate_trace_into_alert
+from .services.trace.case_cache import case_cache
+from .services.trace.linker import fp_index
+from .services.trace.similarity import lsh_index
+from .services.correlation.graph import corr_graph
+from .services.trace.store import load_case, load_case_by_alert
 
 app = FastAPI(
     title="LogVision IDS API",
@@ -139,12 +181,63 @@ def evidence_to_obj(v: Any) -> Any:
         if not s:
             return {}
         try:
-            obj = json.loads(s)
+            obj = loads(s)
             return obj
         except Exception:
             return {"evidence_text": v}
     return {"evidence_value": str(v)}
 
+# ✅ ids:alert 默认只推精简通知；完整 evidence 走 /alerts/{id}/evidence 按需拉取
+# ALERT_STREAM_EVIDENCE=1 恢复旧行为（evidence 随告警整体下发）
+ALERT_STREAM_EVIDENCE = os.getenv("ALERT_STREAM_EVIDENCE", "0") == "1"
+ALERT_SUMMARY_MAX_CHARS = int(os.getenv("ALERT_SUMMARY_MAX_CHARS", "200"))
+
+
+def _evidence_text(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return v
+    return safe_evidence(v) or ""
+
+
+def evidence_etag(v: Any) -> str:
+    return '"' + hashlib.sha1(_evidence_text(v).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def alert_short_summary(a: Any, ev: Any) -> str:
+    text = ""
+    if isinstance(ev, dict):
+        text = str(ev.get("human_summary_cn") or ev.get("summary") or "")
+    if not text:
+        text = f"{a.alert_type} from {a.attack_ip or '-'} x{a.count}"
+    return text[:ALERT_SUMMARY_MAX_CHARS]
+
+
+def alert_notification(a: Any) -> Dict[str, Any]:
+    """
+    推到 ids:alert 的告警消息：列表/通知需要的字段 + 摘要 + evidence 大小，
+    详情面板打开时再调 /alerts/{id}/evidence（带 ETag）。
+    """
+    ev = evidence_to_obj(a.evidence)
+    out: Dict[str, Any] = {
+        "id": str(a.id),
+        "alert_type": a.alert_type,
+        "severity": a.severity,
+        "attack_ip": a.attack_ip,
+        "host": a.host,
+        "count": str(a.count),
+        "window_seconds": str(a.window_seconds),
+        "summary": alert_short_summary(a, ev),
+        "evidence_size": str(len(_evidence_text(a.evidence).encode("utf-8"))),
+        "case_id": a.case_id or "",
+        "created_at": fmt_cn(getattr(a, "created_at", None)),
+    }
+    if ALERT_STREAM_EVIDENCE:
+        out["evidence"] = ev
+    return out
+
+
 # -----------------------------
 # ✅ NEW: Detection Engine (Rule-as-Code)
 # -----------------------------
@@ -198,10 +291,19 @@ def build_event_from_ssh_failed(parsed: dict, row: Any) -> dict:
 @app.on_event("startup")
 def startup():
     Base.metadata.create_all(bind=engine)
+    try:
+        print("[SCHEMA] upgrade:", upgrade_schema(engine))
+    except Exception as e:
+        print("[SCHEMA] upgrade failed:", repr(e))
+    print("[RETENTION] partitions:", setup_partitions(engine))
+    print("[SEARCH] raw_logs message search:", log_search.configure(engine))
     try:
         ensure_streams()
     except Exception:
         pass
+    start_spool_drainer()
+    start_retention(engine)
+    start_rawlog_writer(engine)
 
 
 @app.get("/health", tags=["System"], summary="Health check")
@@ -217,11 +319,44 @@ def health():
 def debug_redis():
     return {
         "redis": redis_info(),
+        **redis_breaker_stats(),
         "streams": stream_lengths(),
+        "publish": publish_stats(),
+        "spool": spool_stats(),
         "ensure": ensure_streams(),
     }
 
 
+@app.get("/debug/ws", tags=["System"], summary="WebSocket hub stats")
+async def debug_ws():
+    return {**hub_stats(), "async_pool": async_pool_stats()}
+
+
+@app.get("/debug/db", tags=["System"], summary="Sync / async DB pool status")
+def debug_db():
+    return {**db_pool_stats(), "write_batch": writer_stats()}
+
+
+@app.get("/debug/dims", tags=["System"], summary="raw_logs dimension cache stats")
+def debug_dims():
+    return dim_stats()
+
+
+@app.get("/debug/retention", tags=["System"], summary="Partition / retention / cold archive stats")
+def debug_retention():
+    return {**retention_stats(), "archive": cold_archive.stats()}
+
+
+@app.get("/debug/trace", tags=["System"], summary="Trace cache / fingerprint index stats")
+def debug_trace():
+    return {
+        "case_cache": case_cache.stats(),
+        "fp_index": fp_index.stats(),
+        "lsh_index": lsh_index.stats(),
+        "correlation": corr_graph.stats(),
+    }
+
+
 # -----------------------------
 # Docs
 # -----------------------------
@@ -238,31 +373,61 @@ def ws_docs():
             "description": (
                 "Real-time raw logs stream.\n"
                 "- The server starts reading from the latest Redis Stream ID at connect time (no DB replay).\n"
+                "- Every stream message carries stream_id. To resume after a reconnect, connect with "
+                "?last_id=<last stream_id seen>: the server replays newer entries from the Redis Stream, then "
+                "switches to live without duplicates. If last_id was already trimmed (stream maxlen) it first sends "
+                "{type: gap, data: {reason: trimmed}} and replays from the oldest retained entry; replay stops after "
+                "WS_REPLAY_MAX entries with {type: gap, data: {reason: replay_limit}}.\n"
                 "- On idle, server sends {type: ping}.\n"
                 "- On Redis errors, server sends {type: status, data: {...}}.\n"
+                "- All clients share one Redis reader per process; a client whose queue overflows either loses the "
+                "oldest queued messages (WS_SLOW_POLICY=drop) or gets {type: status, data: {ws: closed}} and is "
+                "disconnected (WS_SLOW_POLICY=disconnect).\n"
+                "- Filters (host, source, level, q = substring of message) are applied on the server before "
+                "sending; set them via query string or a subscribe message. Each subscribe replaces the previous filters.\n"
+                "- Rate budget (?budget= or subscribe.budget, default WS_RATE_BUDGET lines/s, 0 = off): above it the "
+                "server forwards a sample of lines plus one {type: summary} per window; lines with a non-empty "
+                "parsed field always pass. Per-line delivery resumes when the rate drops back under budget.\n"
+                "- With RAWLOG_SLIM=1 the server publishes slim entries: data has only id, source, host, level, parsed "
+                "and message truncated to RAWLOG_SLIM_MAX_CHARS (truncated=\"1\" when cut); created_at is absent.\n"
+                "- With RAWLOG_PUBLISH=auto (default) raw logs are only written to the stream while some WS client "
+                "or consumer group is live (heartbeat key ids:live:rawlog, LIVE_HEARTBEAT_TTL seconds).\n"
             ),
-            "start_position": "latest_stream_id",
+            "start_position": "latest_stream_id | last_id (resume)",
+            "client_messages": {
+                "subscribe": {
+                    "schema": {"type": "subscribe", "filters": {"host": "string|list", "source": "string|list",
+                                "level": "string|list", "severity": "list | 'HIGH+'", "alert_type": "string|list",
+                                "q": "string"}, "budget": "int(lines/s, optional; /ws/logs only)"},
+                    "example": {"type": "subscribe",
+                                "filters": {"host": ["srv-01"], "level": ["ERROR", "WARN"], "q": "failed password"}},
+                },
+            },
             "message_types": {
                 "log": {
                     "schema": {
                         "type": "log",
+                        "stream_id": "string(Redis Stream entry id)",
                         "data": {
                             "id": "string",
                             "source": "string",
                             "host": "string",
                             "level": "string",
                             "message": "string",
+                            "parsed": "string(http|ssh when a parser matched, else empty)",
                             "created_at": "string(China time, YYYY-MM-DD HH:MM:SS)",
                         },
                     },
                     "example": {
                         "type": "log",
+                        "stream_id": "1735473600000-0",
                         "data": {
                             "id": "123",
                             "source": "auth.log",
                             "host": "srv-01",
                             "level": "INFO",
                             "message": "Failed password for invalid user root from 192.168.1.10 port 22 ssh2",
+                            "parsed": "ssh",
                             "created_at": "2025-12-29 20:00:00",
                         },
                     },
@@ -275,6 +440,30 @@ def ws_docs():
                     "schema": {"type": "status", "data": {"redis": "down", "stream": "rawlog"}},
                     "example": {"type": "status", "data": {"redis": "down", "stream": "rawlog"}},
                 },
+                "gap": {
+                    "schema": {"type": "gap", "data": {"stream": "rawlog", "last_id": "string", "first_id": "string|null",
+                                                       "reason": "trimmed|replay_limit"}},
+                    "example": {"type": "gap", "data": {"stream": "rawlog", "last_id": "1735473000000-0",
+                                                        "first_id": "1735473500000-0", "reason": "trimmed"}},
+                },
+                "summary": {
+                    "schema": {"type": "summary", "data": {"window_ms": "int", "rate": "float(lines/s)", "budget": "int",
+                                                           "sample_every": "int", "total": "int", "passed": "int",
+                                                           "suppressed": "int", "by_host": "{host: count}",
+                                                           "by_source": "{source: count}", "by_level": "{level: count}",
+                                                           "top_messages": "[{message (digits -> #), count}]"}},
+                    "example": {"type": "summary", "data": {"window_ms": 1000, "rate": 2400.0, "budget": 200,
+                                                            "sample_every": 24, "total": 2400, "passed": 103,
+                                                            "suppressed": 2297, "by_host": {"srv-01": 2297},
+                                                            "by_source": {"nginx": 2297}, "by_level": {"INFO": 2297},
+                                                            "top_messages": [{"message": "GET /health #", "count": 2297}]}},
+                },
+                "subscribed": {
+                    "schema": {"type": "subscribed", "data": "effective filters (null = not filtered) + budget"},
+                    "example": {"type": "subscribed", "data": {"host": ["SRV-01"], "source": None, "level": None,
+                                                               "severity": "HIGH+", "alert_type": None, "q": None,
+                                                               "budget": 0}},
+                },
             },
         },
         "ws_alerts": {
@@ -282,14 +471,33 @@ def ws_docs():
             "description": (
                 "Real-time alerts stream.\n"
                 "- The server starts reading from the latest Redis Stream ID at connect time (no DB replay).\n"
+                "- Every stream message carries stream_id. To resume after a reconnect, connect with "
+                "?last_id=<last stream_id seen>: the server replays newer entries from the Redis Stream, then "
+                "switches to live without duplicates. If last_id was already trimmed (stream maxlen) it first sends "
+                "{type: gap, data: {reason: trimmed}} and replays from the oldest retained entry; replay stops after "
+                "WS_REPLAY_MAX entries with {type: gap, data: {reason: replay_limit}}.\n"
                 "- On idle, server sends {type: ping}.\n"
                 "- On Redis errors, server sends {type: status, data: {...}}.\n"
+                "- All clients share one Redis reader per process; a client whose queue overflows either loses the "
+                "oldest queued messages (WS_SLOW_POLICY=drop) or gets {type: status, data: {ws: closed}} and is "
+                "disconnected (WS_SLOW_POLICY=disconnect).\n"
+                "- Filters (host, severity, alert_type, q = substring of alert_type/attack_ip/host/summary) are "
+                "applied on the server before sending; set them via query string or a subscribe message. Each subscribe replaces the previous filters.\n"
             ),
-            "start_position": "latest_stream_id",
+            "start_position": "latest_stream_id | last_id (resume)",
+            "client_messages": {
+                "subscribe": {
+                    "schema": {"type": "subscribe", "filters": {"host": "string|list", "source": "string|list",
+                                "level": "string|list", "severity": "list | 'HIGH+'", "alert_type": "string|list",
+                                "q": "string"}, "budget": "int(lines/s, optional; /ws/logs only)"},
+                    "example": {"type": "subscribe", "filters": {"severity": "HIGH+", "alert_type": ["SSH_BRUTE_FORCE"]}},
+                },
+            },
             "message_types": {
                 "alert": {
                     "schema": {
                         "type": "alert",
+                        "stream_id": "string(Redis Stream entry id)",
                         "data": {
                             "id": "string",
                             "alert_type": "string",
@@ -298,12 +506,16 @@ def ws_docs():
                             "host": "string",
                             "count": "string(int)",
                             "window_seconds": "string(int)",
-                            "evidence": "any",
+                            "summary": "string(short human-readable summary)",
+                            "evidence_size": "string(int, bytes; full evidence via /alerts/{id}/evidence)",
+                            "evidence": "any (only when ALERT_STREAM_EVIDENCE=1)",
+                            "case_id": "string(trace case id, load via /trace/cases/{case_id})",
                             "created_at": "string(China time, YYYY-MM-DD HH:MM:SS)",
                         },
                     },
                     "example": {
                         "type": "alert",
+                        "stream_id": "1735473690000-0",
                         "data": {
                             "id": "9",
                             "alert_type": "SSH_BRUTE_FORCE",
@@ -312,7 +524,8 @@ def ws_docs():
                             "host": "srv-01",
                             "count": "6",
                             "window_seconds": "60",
-                            "evidence": {"users": ["root", "admin"], "fail_count": 6},
+                            "summary": "SSH_BRUTE_FORCE from 192.168.1.10 x6",
+                            "evidence_size": "48",
                             "created_at": "2025-12-29 20:01:30",
                         },
                     },
@@ -325,6 +538,51 @@ def ws_docs():
                     "schema": {"type": "status", "data": {"redis": "down", "stream": "alert"}},
                     "example": {"type": "status", "data": {"redis": "down", "stream": "alert"}},
                 },
+                "gap": {
+                    "schema": {"type": "gap", "data": {"stream": "alert", "last_id": "string", "first_id": "string|null",
+                                                       "reason": "trimmed|replay_limit"}},
+                    "example": {"type": "gap", "data": {"stream": "alert", "last_id": "1735473000000-0",
+                                                        "first_id": "1735473500000-0", "reason": "trimmed"}},
+                },
+                "subscribed": {
+                    "schema": {"type": "subscribed", "data": "effective filters (null = not filtered) + budget"},
+                    "example": {"type": "subscribed", "data": {"host": ["SRV-01"], "source": None, "level": None,
+                                                               "severity": "HIGH+", "alert_type": None, "q": None,
+                                                               "budget": 0}},
+                },
+            },
+        },
+        "wire_protocols": {
+            "description": (
+                "Applies to both /ws/logs and /ws/alerts. v1 is the default; batch is opt-in at connect time.\n"
+                "- v1: one JSON text frame per message, exactly as documented above.\n"
+                "- batch (?proto=batch): the first frame is {type: hello} (always JSON text) with the effective "
+                "settings; after that, messages are coalesced per tick into {type: batch, data: [msg, ...]}. "
+                "A tick ends after batch_max messages or batch_ms after its first message. "
+                "The final {type: status, data: {ws: closed}} is sent as its own frame.\n"
+                "- enc=json sends text frames; permessage-deflate is negotiated in the WebSocket handshake when the "
+                "client supports it, and compresses batched frames far better than single messages.\n"
+                "- enc=msgpack sends binary frames. It needs the msgpack package on the server; without it the "
+                "server falls back to json and hello.data.enc says so.\n"
+            ),
+            "query_params": {
+                "proto": "v1 | batch (default v1)",
+                "enc": "json | msgpack (batch only, default json)",
+                "batch_ms": f"max latency per tick in ms (default {WS_BATCH_MAX_MS}, max {WS_BATCH_MAX_MS_LIMIT})",
+                "batch_max": f"max messages per frame (default {WS_BATCH_MAX}, max {WS_BATCH_MAX_LIMIT})",
+            },
+            "message_types": {
+                "hello": {
+                    "schema": {"type": "hello", "data": {"proto": "batch", "enc": "json|msgpack", "batch_ms": "int",
+                                                         "batch_max": "int", "msgpack_available": "bool"}},
+                    "example": {"type": "hello", "data": {"proto": "batch", "enc": "json", "batch_ms": 100,
+                                                          "batch_max": 500, "msgpack_available": False}},
+                },
+                "batch": {
+                    "schema": {"type": "batch", "data": "list of v1 messages (log/alert/ping/status/subscribed)"},
+                    "example": {"type": "batch", "data": [{"type": "log", "data": {"id": "123", "host": "srv-01"}},
+                                                          {"type": "log", "data": {"id": "124", "host": "srv-01"}}]},
+                },
             },
         },
         "openapi": {
@@ -354,15 +612,33 @@ def ingest(
     debug: bool = Query(False, description="调试模式：返回 parsed/alert_data，便于定位为何不出告警"),
 ):
     # ✅ 不手动传 created_at，让 models.py 的 default（中国时间）生效
-    row = RawLog(
-        source=payload.source,
-        host=payload.host,
-        level=payload.level,
-        message=payload.message,
-    )
-    db.add(row)
-    db.commit()
-    db.refresh(row)
+    writer = rawlog_writer()
+    if writer is not None:
+        # 组提交（SQLite 默认开启，见 writer.py）：和并发请求合并成一个事务
+        row = writer.write(payload.source, payload.host, payload.level, payload.message)
+    else:
+        row = RawLog(
+            source=payload.source,
+            host=payload.host,
+            level=payload.level,
+            message=payload.message,
+        )
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+
+    try:
+        parsed_http = parse_http_access(row.message)
+    except Exception:
+        parsed_http = None
+
+    # parser 命中标记：实时日志降采样时这些行永远逐条推送
+    if parsed_http:
+        parsed_tag = "http"
+    elif "Failed password" in (row.message or ""):
+        parsed_tag = "ssh"
+    else:
+        parsed_tag = ""
 
     # 推送实时日志到 Redis Stream（失败不影响主流程）
     try:
@@ -373,6 +649,7 @@ def ingest(
                 "host": row.host,
                 "level": row.level,
                 "message": row.message,
+                "parsed": parsed_tag,
                 "created_at": fmt_cn(getattr(row, "created_at", None)),
             }
         )
@@ -392,11 +669,6 @@ def ingest(
     # =============================
     # HTTP access log → Rule Engine
     # =============================
-    try:
-        parsed_http = parse_http_access(row.message)
-    except Exception:
-        parsed_http = None
-
     if debug:
         debug_engine["http_parser_raw"] = parsed_http
 
@@ -501,19 +773,7 @@ def ingest(
             debug_engine["engine_alert_ids"].append(ra.id)
 
             try:
-                publish_alert(
-                    {
-                        "id": str(ra.id),
-                        "alert_type": ra.alert_type,
-                        "severity": ra.severity,
-                        "attack_ip": ra.attack_ip,
-                        "host": ra.host,
-                        "count": str(ra.count),
-                        "window_seconds": str(ra.window_seconds),
-                        "evidence": evidence_to_obj(ra.evidence),
-                        "created_at": fmt_cn(getattr(ra, "created_at", None)),
-                    }
-                )
+                publish_alert(alert_notification(ra))
             except Exception:
                 pass
 
@@ -649,19 +909,7 @@ def ingest(
                         rule_alert_ids.append(ra.id)
 
                         try:
-                            publish_alert(
-                                {
-                                    "id": str(ra.id),
-                                    "alert_type": ra.alert_type,
-                                    "severity": ra.severity,
-                                    "attack_ip": ra.attack_ip,
-                                    "host": ra.host,
-                                    "count": str(ra.count),
-                                    "window_seconds": str(ra.window_seconds),
-                                    "evidence": evidence_to_obj(ra.evidence),
-                                    "created_at": fmt_cn(getattr(ra, "created_at", None)),
-                                }
-                            )
+                            publish_alert(alert_notification(ra))
                         except Exception:
                             pass
 
@@ -738,19 +986,7 @@ def ingest(
                 db.refresh(alert)
 
                 try:
-                    publish_alert(
-                        {
-                            "id": str(alert.id),
-                            "alert_type": alert.alert_type,
-                            "severity": alert.severity,
-                            "attack_ip": alert.attack_ip,
-                            "host": alert.host,
-                            "count": str(alert.count),
-                            "window_seconds": str(alert.window_seconds),
-                            "evidence": evidence_to_obj(alert.evidence),
-                            "created_at": fmt_cn(getattr(alert, "created_at", None)),
-                        }
-                    )
+                    publish_alert(alert_notification(alert))
                 except Exception:
                     pass
 
@@ -790,6 +1026,63 @@ def ingest(
 # -----------------------------
 # ✅ 历史日志：分页 + 过滤（只查库，不影响实时）
 # -----------------------------
+def _split_param(v: Optional[str]) -> List[str]:
+    return [x.strip() for x in str(v or "").split(",") if x.strip()]
+
+
+def _parse_time_param(name: str, v: Optional[str]) -> Optional[datetime]:
+    """since/until：'YYYY-MM-DD HH:MM:SS' 或 ISO 格式，按中国时间理解（和库里的 naive DATETIME 一致）"""
+    if not v or not v.strip():
+        return None
+    try:
+        dt = datetime.fromisoformat(v.strip().replace("T", " ").replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"invalid {name}: {v!r}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(CHINA_TZ).replace(tzinfo=None)
+    return dt
+
+
+class _LogFilters:
+    """/logs/recent 和 /export/logs 共用的过滤：热表 WHERE 条件 + 冷归档 scan 参数"""
+
+    def __init__(self, conds: List[Any], cold: Dict[str, Any]):
+        self.conds = conds
+        self.cold = cold
+
+
+async def _rawlog_filters(source: Optional[str], host: Optional[str], level: Optional[str], q: Optional[str],
+                          since: Optional[str], until: Optional[str]) -> _LogFilters:
+    conds = []
+    # source/host/level 先在维度缓存里换成 id，直接走 *_id 索引；名字不存在时整个查询为空
+    levels = [x.upper() for x in _split_param(level)]
+    for col, kind, names in (
+        (RawLog.source_id, "source", [source] if source and source.strip() else []),
+        (RawLog.host_id, "host", [host] if host and host.strip() else []),
+        (RawLog.level_id, "level", levels),
+    ):
+        if names:
+            ids = await run_in_threadpool(dims[kind].ids_matching, names)
+            conds.append(col.in_(ids) if ids else false())
+    if q and q.strip():
+        conds.append(log_search.condition(q.strip()))
+    t_since = _parse_time_param("since", since)
+    t_until = _parse_time_param("until", until)
+    if t_since is not None:
+        conds.append(RawLog.created_at >= t_since)
+    if t_until is not None:
+        conds.append(RawLog.created_at < t_until)
+    cold = {
+        "source": [source.strip()] if source and source.strip() else None,
+        "host": [host.strip()] if host and host.strip() else None,
+        "level": levels or None,
+        "q": q.strip() if q and q.strip() else None,
+        "t0": t_since,
+        "t1": t_until,
+    }
+    return _LogFilters(conds, cold)
+
+
 @app.get(
     "/logs/recent",
     tags=["Logs"],
@@ -797,84 +1090,451 @@ def ingest(
     description="Query raw logs from database with optional filters and cursor pagination. Returns logs in chronological order (old -> new).",
     response_model=list[RawLogOut],
 )
-def list_recent_logs(
+async def list_recent_logs(
     limit: int = Query(200, ge=1, le=2000),
     before_id: Optional[int] = Query(None, description="分页游标：返回 id < before_id 的更早日志"),
     source: Optional[str] = None,
     host: Optional[str] = None,
-    level: Optional[str] = None,
-    q: Optional[str] = Query(None, description="message 模糊搜索"),
-    db: Session = Depends(get_db),
+    level: Optional[str] = Query(None, description="精确匹配，逗号分隔多个：ERROR,WARN"),
+    q: Optional[str] = Query(None, description="message 包含搜索（MySQL 走 FULLTEXT ngram 索引，SQLite 走 FTS5 trigram）"),
+    since: Optional[str] = Query(None, description="created_at >= since（分区表上只扫相关分区）"),
+    until: Optional[str] = Query(None, description="created_at < until"),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    stmt = select(RawLog)
+    t0 = time.perf_counter()
+    stmt = select(*_RAWLOG_LIST_COLS)
 
-    conds = []
+    f = await _rawlog_filters(source, host, level, q, since, until)
+    conds = list(f.conds)
     if before_id is not None:
         conds.append(RawLog.id < before_id)
-    if source and source.strip():
-        conds.append(RawLog.source == source.strip())
-    if host and host.strip():
-        conds.append(RawLog.host == host.strip())
-    if level and level.strip():
-        lv = level.strip().upper()
-        conds.append(RawLog.level.ilike(f"%{lv}%"))
-    if q and q.strip():
-        kw = q.strip()
-        conds.append(RawLog.message.ilike(f"%{kw}%"))
-
     if conds:
         stmt = stmt.where(and_(*conds))
 
     stmt = stmt.order_by(RawLog.id.desc()).limit(limit)
-    rows = db.execute(stmt).scalars().all()
-    rows.reverse()  # 旧 -> 新
+    rows = (await db.execute(stmt)).all()
+    await ensure_rawlog_dims(rows)
+    items = rawlog_items(rows)
+
+    # 热表不够一页：接着从冷归档往前翻（归档的 id 都小于热表，用最小 id 当游标即可）
+    cold = 0
+    if len(items) < limit and archive_enabled():
+        more = await run_in_threadpool(
+            cold_archive.query,
+            limit - len(items),
+            before_id=items[-1]["id"] if items else before_id,
+            **f.cold,
+        )
+        cold = len(more)
+        items.extend(cold_rawlog_items(more))
+    items.reverse()  # 旧 -> 新
+
+    t1 = time.perf_counter()
+    body = dumps(items)
+    headers = {
+        "X-Query-Ms": f"{(t1 - t0) * 1000:.1f}",
+        "X-Serialize-Ms": f"{(time.perf_counter() - t1) * 1000:.1f}",
+        "X-Search-Backend": log_search.backend if q and q.strip() else "none",
+        "X-Archive-Rows": str(cold),
+    }
+    return JSONBytes(body, headers=headers)
+
+
+# -----------------------------
+# 列表响应的行构造（快路径）：直接从 Core 结果元组拼 dict，字段和 RawLogOut / AlertOut 一致，
+# 不逐行建 Pydantic 模型；维度名查进程内缓存，时间按秒缓存格式化结果
+# -----------------------------
+_RAWLOG_LIST_COLS = (RawLog.id, RawLog.source_id, RawLog.host_id, RawLog.level_id, RawLog.message, RawLog.created_at)
+
 
+# _RAWLOG_LIST_COLS 里维度 id 的位置
+_RAWLOG_DIM_POS = (("source", 1), ("host", 2), ("level", 3))
+
+
+async def ensure_rawlog_dims(rows: Any) -> None:
+    """缓存里没有的维度 id（本 worker 第一次请求 / 别的 worker 刚插入的新名字）先在线程池里 reload，
+    rawlog_items 里的 name() 就全是内存命中，不会在事件循环上同步查库"""
+    need = []
+    for kind, pos in _RAWLOG_DIM_POS:
+        ids = {r[pos] for r in rows}
+        if dims[kind].missing(ids):
+            need.append((dims[kind], ids))
+    if need:
+        await run_in_threadpool(lambda: [d.ensure(ids) for d, ids in need])
+
+
+def rawlog_items(rows: Any) -> List[Dict[str, Any]]:
+    src, hst, lvl = dims["source"].name, dims["host"].name, dims["level"].name
+    ts = ts_formatter(None)
     return [
-        RawLogOut(
-            id=x.id,
-            source=x.source,
-            host=x.host,
-            level=x.level,
-            message=x.message,
-            created_at=fmt_cn(getattr(x, "created_at", None)) if getattr(x, "created_at", None) else None,
-        )
+        {"id": i, "source": src(s), "host": hst(h), "level": lvl(lv), "message": m, "created_at": ts(c)}
+        for i, s, h, lv, m, c in rows
+    ]
+
+
+def cold_rawlog_items(rows: Any) -> List[Dict[str, Any]]:
+    ts = ts_formatter(None)
+    return [
+        {"id": x.id, "source": x.source, "host": x.host, "level": x.level, "message": x.message,
+         "created_at": ts(x.created_at)}
         for x in rows
     ]
 
 
+def alert_items(rows: Any, include_evidence: bool) -> List[Dict[str, Any]]:
+    """AlertOut 的字段顺序；response_model_exclude_unset 语义：不带 evidence 时不出现这个 key"""
+    ts = ts_formatter("")
+    out = []
+    for a in rows:
+        d = {
+            "id": a[0], "alert_type": a[1], "severity": a[2], "attack_ip": a[3], "host": a[4],
+            "count": a[5], "window_seconds": a[6],
+        }
+        if include_evidence:
+            d["evidence"] = evidence_to_obj(a[9])
+        d["case_id"] = a[7]
+        d["created_at"] = ts(a[8])
+        out.append(d)
+    return out
+
+
+# 列表默认的摘要投影：SELECT 里不带 evidence（TEXT，单条可能几十 KB）
+_ALERT_SUMMARY_COLS = (
+    Alert.id, Alert.alert_type, Alert.severity, Alert.attack_ip, Alert.host,
+    Alert.count, Alert.window_seconds, Alert.case_id, Alert.created_at,
+)
+
+
+def _severity_values(v: Optional[str]) -> List[str]:
+    """"HIGH,CRITICAL" 精确匹配；"HIGH+" 展开成该级别及以上（和 WS 订阅过滤同一套写法）"""
+    sev = (v or "").strip().upper()
+    if sev.endswith("+") and sev[:-1] in SEVERITY_RANK:
+        lo = SEVERITY_RANK[sev[:-1]]
+        return [k for k, r in SEVERITY_RANK.items() if r >= lo]
+    return [x.upper() for x in _split_param(sev)]
+
+
+def _alert_conds(severity: Optional[str], alert_type: Optional[str], attack_ip: Optional[str],
+                 host: Optional[str], since: Optional[str], until: Optional[str]) -> List[Any]:
+    """/alerts 和 /export/alerts 共用的过滤条件"""
+    conds = []
+    sevs = _severity_values(severity)
+    if sevs:
+        conds.append(Alert.severity.in_(sevs))
+    types = _split_param(alert_type)
+    if types:
+        conds.append(Alert.alert_type == types[0] if len(types) == 1 else Alert.alert_type.in_(types))
+    if attack_ip and attack_ip.strip():
+        conds.append(Alert.attack_ip == attack_ip.strip())
+    if host and host.strip():
+        conds.append(Alert.host == host.strip())
+    t0 = _parse_time_param("since", since)
+    t1 = _parse_time_param("until", until)
+    if t0 is not None:
+        conds.append(Alert.created_at >= t0)
+    if t1 is not None:
+        conds.append(Alert.created_at < t1)
+    return conds
+
+
 @app.get(
     "/alerts",
     tags=["Alerts"],
-    summary="Query latest alerts",
-    description="Query latest alerts from database (newest first).",
+    summary="Query alerts",
+    description=(
+        "Query alerts from database (newest first) with optional filters and id-cursor pagination. "
+        "before_id pages back to older alerts; after_id returns the oldest `limit` alerts newer than after_id "
+        "(still newest first). By default evidence is not selected; pass include_evidence=true or load "
+        "/alerts/{id}/evidence on demand."
+    ),
     response_model=list[AlertOut],
+    response_model_exclude_unset=True,
+)
+async def list_alerts(
+    limit: int = Query(50, ge=1, le=500),
+    before_id: Optional[int] = Query(None, description="分页游标：返回 id < before_id 的更早告警"),
+    after_id: Optional[int] = Query(None, description="增量游标：返回 id > after_id 的更新告警"),
+    severity: Optional[str] = Query(None, description="LOW/MEDIUM/HIGH/CRITICAL，逗号分隔；或 HIGH+ 表示该级别及以上"),
+    alert_type: Optional[str] = Query(None, description="逗号分隔，精确匹配"),
+    attack_ip: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = Query(None, description="created_at >= since"),
+    until: Optional[str] = Query(None, description="created_at < until"),
+    include_evidence: bool = Query(False, description="是否带完整 evidence（默认摘要投影，不查 evidence 列）"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    cols = _ALERT_SUMMARY_COLS + ((Alert.evidence,) if include_evidence else ())
+    stmt = select(*cols)
+
+    conds = _alert_conds(severity, alert_type, attack_ip, host, since, until)
+    if before_id is not None:
+        conds.append(Alert.id < before_id)
+    if after_id is not None:
+        conds.append(Alert.id > after_id)
+
+    if conds:
+        stmt = stmt.where(and_(*conds))
+
+    # after_id 取紧挨着游标的那一段（升序 limit），再翻转成新 -> 旧，和默认顺序一致
+    if after_id is not None and before_id is None:
+        rows = (await db.execute(stmt.order_by(Alert.id.asc()).limit(limit))).all()
+        rows.reverse()
+    else:
+        rows = (await db.execute(stmt.order_by(Alert.id.desc()).limit(limit))).all()
+
+    return JSONBytes(dumps(alert_items(rows, include_evidence)))
+
+
+@app.get(
+    "/alerts/{alert_id}/evidence",
+    tags=["Alerts"],
+    summary="Load one alert's evidence",
+    description=(
+        "Full evidence of one alert (rule events, assessment, trace summary). The alert stream only carries a short "
+        "summary and evidence_size; clients fetch this when opening the detail panel. Supports ETag / If-None-Match."
+    ),
+)
+async def get_alert_evidence(alert_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    stmt = select(Alert.evidence).where(Alert.id == alert_id)
+    evidence = (await db.execute(stmt)).first()
+    if evidence is None and HAS_READ_REPLICA:
+        # 告警刚推送出去、只读库还没复制到：回主库读
+        read_stats["primary_fallbacks"] += 1
+        async with async_primary_session() as p:
+            evidence = (await p.execute(stmt)).first()
+    if evidence is None:
+        raise HTTPException(status_code=404, detail="alert not found")
+    etag = evidence_etag(evidence[0])
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONBytes(dumps(evidence_to_obj(evidence[0])), headers=headers)
+
+
+# -----------------------------
+# 流式导出：过滤参数和 /logs/recent、/alerts 相同，按 id 从旧到新，不分页、不限条数（limit 可选）
+# 服务端游标逐批读、边读边发，内存占用和导出量无关（见 export.py）
+# -----------------------------
+_EXPORT_LOG_FIELDS = ("id", "source", "host", "level", "message", "created_at")
+_EXPORT_ALERT_FIELDS = ("id", "alert_type", "severity", "attack_ip", "host", "count", "window_seconds", "case_id",
+                        "created_at")
+_EXPORT_FORMAT = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson | csv")
+
+
+def _export_response(kind: str, fmt: str, fields: Any, rows: Any) -> StreamingResponse:
+    filename = f"{kind}-{now_cn().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return StreamingResponse(
+        encode_stream(kind, fmt, fields, rows),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+@app.get(
+    "/export/logs",
+    tags=["Export"],
+    summary="Stream raw logs as NDJSON / CSV",
+    description=(
+        "Same filters as /logs/recent, without pagination: every matching row (archived rows first), ordered by id "
+        "ascending, streamed from a server-side cursor. Optional limit caps the row count."
+    ),
+    response_class=StreamingResponse,
+)
+async def export_logs(
+    fmt: str = _EXPORT_FORMAT,
+    limit: Optional[int] = Query(None, ge=1, description="最多导出多少行，默认全部"),
+    before_id: Optional[int] = Query(None, description="只导出 id < before_id"),
+    after_id: Optional[int] = Query(None, description="只导出 id > after_id（增量导出）"),
+    source: Optional[str] = None,
+    host: Optional[str] = None,
+    level: Optional[str] = Query(None, description="精确匹配，逗号分隔多个：ERROR,WARN"),
+    q: Optional[str] = Query(None, description="message 包含搜索"),
+    since: Optional[str] = Query(None, description="created_at >= since"),
+    until: Optional[str] = Query(None, description="created_at < until"),
+):
+    f = await _rawlog_filters(source, host, level, q, since, until)
+    conds = list(f.conds)
+    if before_id is not None:
+        conds.append(RawLog.id < before_id)
+    if after_id is not None:
+        conds.append(RawLog.id > after_id)
+    stmt = select(
+        RawLog.id, RawLog.source_id, RawLog.host_id, RawLog.level_id, RawLog.message, RawLog.created_at
+    ).order_by(RawLog.id.asc())
+    if conds:
+        stmt = stmt.where(and_(*conds))
+    src, hst, lvl = dims["source"], dims["host"], dims["level"]
+
+    def rows():
+        n = 0
+        if archive_enabled():
+            for r in cold_archive.iter_rows(before_id=before_id, after_id=after_id, **f.cold):
+                if limit is not None and n >= limit:
+                    return
+                n += 1
+                yield {"id": r.id, "source": r.source, "host": r.host, "level": r.level, "message": r.message,
+                       "created_at": fmt_cn(r.created_at)}
+        hot = stmt
+        if limit is not None:
+            if n >= limit:
+                return
+            hot = stmt.limit(limit - n)
+        for r in stream_query(hot):
+            yield {"id": r.id, "source": src.name(r.source_id), "host": hst.name(r.host_id),
+                   "level": lvl.name(r.level_id), "message": r.message, "created_at": fmt_cn(r.created_at)}
+
+    return _export_response("logs", fmt, _EXPORT_LOG_FIELDS, rows())
+
+
+@app.get(
+    "/export/alerts",
+    tags=["Export"],
+    summary="Stream alerts as NDJSON / CSV",
+    description=(
+        "Same filters as /alerts, without pagination, ordered by id ascending and streamed from a server-side cursor. "
+        "include_evidence adds the evidence object (NDJSON) or its JSON text (CSV)."
+    ),
+    response_class=StreamingResponse,
 )
-def list_alerts(limit: int = 50, db: Session = Depends(get_db)):
-    stmt = select(Alert).order_by(Alert.id.desc()).limit(limit)
-    rows = db.execute(stmt).scalars().all()
+async def export_alerts(
+    fmt: str = _EXPORT_FORMAT,
+    limit: Optional[int] = Query(None, ge=1, description="最多导出多少行，默认全部"),
+    before_id: Optional[int] = Query(None, description="只导出 id < before_id"),
+    after_id: Optional[int] = Query(None, description="只导出 id > after_id（增量导出）"),
+    severity: Optional[str] = Query(None, description="LOW/MEDIUM/HIGH/CRITICAL，逗号分隔；或 HIGH+ 表示该级别及以上"),
+    alert_type: Optional[str] = Query(None, description="逗号分隔，精确匹配"),
+    attack_ip: Optional[str] = None,
+    host: Optional[str] = None,
+    since: Optional[str] = Query(None, description="created_at >= since"),
+    until: Optional[str] = Query(None, description="created_at < until"),
+    include_evidence: bool = Query(False, description="是否带完整 evidence"),
+):
+    conds = _alert_conds(severity, alert_type, attack_ip, host, since, until)
+    if before_id is not None:
+        conds.append(Alert.id < before_id)
+    if after_id is not None:
+        conds.append(Alert.id > after_id)
+    stmt = select(*(_ALERT_SUMMARY_COLS + ((Alert.evidence,) if include_evidence else ()))).order_by(Alert.id.asc())
+    if conds:
+        stmt = stmt.where(and_(*conds))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    fields = _EXPORT_ALERT_FIELDS + (("evidence",) if include_evidence else ())
+
+    def rows():
+        for r in stream_query(stmt):
+            d = {k: getattr(r, k) for k in _EXPORT_ALERT_FIELDS}
+            d["created_at"] = fmt_cn(r.created_at)
+            if include_evidence:
+                # CSV 里 evidence 就是原 JSON 文本，不用解析再序列化一遍
+                d["evidence"] = evidence_to_obj(r.evidence) if fmt == "ndjson" else (r.evidence or "")
+            yield d
+
+    return _export_response("alerts", fmt, fields, rows())
+
+
+@app.get("/debug/export", tags=["System"], summary="Export throughput stats")
+def debug_export():
+    return export_stats.stats()
+
+
+# -----------------------------
+# ✅ 溯源 case：按需加载（不再塞在 alerts.evidence 里随列表/WS 下发）
+# -----------------------------
+@app.get(
+    "/trace/cases/{case_id}",
+    tags=["Trace"],
+    summary="Load one trace case",
+    description="Load a stored trace case (timeline, fingerprints, linked cases, evidence raw log ids) by case_id.",
+)
+def get_trace_case(case_id: str, db: Session = Depends(get_read_db)):
+    obj = read_with_fallback(load_case, db, case_id)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="case not found")
+    return obj
+
+
+@app.get(
+    "/alerts/{alert_id}/trace",
+    tags=["Trace"],
+    summary="Load the trace case of one alert",
+    description="Load the trace case referenced by alert.case_id. Older alerts with the case embedded in evidence.trace are served from there.",
+)
+def get_alert_trace(alert_id: int, db: Session = Depends(get_read_db)):
+    obj = read_with_fallback(load_case_by_alert, db, alert_id)
+    if obj is not None:
+        return obj
+
+    # 兼容老数据：case 还内嵌在 evidence.trace 里
+    a = read_with_fallback(lambda s, i: s.get(Alert, i), db, alert_id)
+    if a is None:
+        raise HTTPException(status_code=404, detail="alert not found")
+    ev = evidence_to_obj(a.evidence)
+    tr = ev.get("trace") if isinstance(ev, dict) else None
+    if isinstance(tr, dict) and isinstance(tr.get("case"), dict):
+        return {"alert_id": a.id, "case": tr["case"], "link": tr.get("link") or {}}
+    raise HTTPException(status_code=404, detail="trace not found")
+
+
+# -----------------------------
+# ✅ 攻击者关联（campaign）：增量 union-find，接口只读
+# -----------------------------
+def _alert_briefs(db: Session, ids: List[int]) -> List[Dict[str, Any]]:
+    if not ids:
+        return []
+    rows = db.execute(
+        select(
+            Alert.id, Alert.alert_type, Alert.severity, Alert.attack_ip, Alert.host, Alert.count, Alert.created_at
+        ).where(Alert.id.in_(ids)).order_by(Alert.id.desc())
+    ).all()
     return [
-        AlertOut(
-            id=a.id,
-            alert_type=a.alert_type,
-            severity=a.severity,
-            attack_ip=a.attack_ip,
-            host=a.host,
-            count=a.count,
-            window_seconds=a.window_seconds,
-            evidence=evidence_to_obj(a.evidence),
-            created_at=fmt_cn(getattr(a, "created_at", None)),
-        )
-        for a in rows
+        {
+            "id": x.id,
+            "alert_type": x.alert_type,
+            "severity": x.severity,
+            "attack_ip": x.attack_ip,
+            "host": x.host,
+            "count": x.count,
+            "created_at": fmt_cn(x.created_at),
+        }
+        for x in rows
     ]
 
 
+@app.get(
+    "/campaigns",
+    tags=["Campaigns"],
+    summary="List correlated attack campaigns",
+    description="Campaigns group alerts sharing a src_ip, a specific trace fingerprint or a tool user-agent. Most recently active first.",
+)
+def list_campaigns(
+    limit: int = Query(50, ge=1, le=500),
+    min_size: int = Query(2, ge=1, description="最少成员告警数（默认隐藏单条告警的孤立 campaign）"),
+    db: Session = Depends(get_read_db),
+):
+    items = corr_graph.list_campaigns(limit=limit, min_size=min_size)
+    for c in items:
+        c["alerts"] = _alert_briefs(db, c.get("alert_ids") or [])
+    return items
+
+
+@app.get(
+    "/campaigns/{campaign_id}",
+    tags=["Campaigns"],
+    summary="Get one campaign with member alerts",
+    description="campaign_id may be any node id (e.g. alert:12 or ip:1.2.3.4); it is resolved to the current campaign root.",
+)
+def get_campaign(campaign_id: str, member_limit: int = Query(500, ge=1, le=5000), db: Session = Depends(get_read_db)):
+    c = corr_graph.get_campaign(campaign_id, member_limit=member_limit)
+    if c is None:
+        raise HTTPException(status_code=404, detail="campaign not found")
+    c["alerts"] = _alert_briefs(db, c.get("alert_ids") or [])
+    return c
+
+
 # -----------------------------
 # WS helpers
 # -----------------------------
-async def _xread_threadsafe(key: str, last_id: str, block_ms: int = 2000, count: int = 50):
-    return await asyncio.to_thread(stream_xread, key, last_id, block_ms, count)
-
-
 async def _send_safe(ws: WebSocket, payload: dict) -> bool:
     try:
         await ws.send_json(payload)
@@ -885,99 +1545,150 @@ async def _send_safe(ws: WebSocket, payload: dict) -> bool:
         return False
 
 
-def _stream_latest_id(key: str) -> str:
-    r = get_redis()
+async def _send_frame(ws: WebSocket, wire: WireOptions, frame: dict) -> bool:
+    is_binary, data = wire.encode(frame)
     try:
-        items = r.xrevrange(key, count=1)
-        if not items:
-            return "0-0"
-        latest_id, _ = items[0]
-        return str(latest_id)
+        if is_binary:
+            await ws.send_bytes(data)
+        else:
+            await ws.send_text(data)
+        return True
     except Exception:
-        return "0-0"
+        return False
 
 
-async def _latest_id_threadsafe(key: str) -> str:
-    return await asyncio.to_thread(_stream_latest_id, key)
+async def _send_batched(ws: WebSocket, sub: Subscriber, wire: WireOptions) -> None:
+    """proto=batch：每个 tick 合并成一个 {type: batch, data: [...]} 帧"""
+    while True:
+        first = await sub.queue.get()
+        if first is CLOSE:
+            await _send_frame(ws, wire, {"type": "status", "data": {"ws": "closed", "reason": sub.close_reason}})
+            return
 
+        items, closed = await collect_batch(sub.queue, first, wire.batch_ms, wire.batch_max, CLOSE)
+        items = [it for it in items if not sub.already_sent(it[0])]
+        if items:
+            ok = await _send_frame(ws, wire, {"type": "batch", "data": [payload for _, payload in items]})
+            if not ok:
+                return
+            for entry_id, _ in items:
+                sub.mark_sent(entry_id)
+
+        if closed:
+            await _send_frame(ws, wire, {"type": "status", "data": {"ws": "closed", "reason": sub.close_reason}})
+            return
+
+
+_FILTER_KEYS = ("host", "source", "level", "severity", "alert_type", "q")
 
-# -----------------------------
-# ✅ 实时日志 WS：不回放数据库，但也不漏“刚连接时的消息”
-# -----------------------------
-@app.websocket("/ws/logs")
-async def ws_logs(ws: WebSocket):
-    await ws.accept()
-    last_id = await _latest_id_threadsafe(RAWLOG_STREAM_KEY)
 
+async def _recv_subscriptions(ws: WebSocket, hub: StreamHub, sub: Subscriber) -> None:
+    """
+    客户端 -> 服务端：{"type": "subscribe", "filters": {host, source, level, severity, alert_type, q}, "budget": 200}
+    每次 subscribe 整体替换之前的条件，服务端回 {"type": "subscribed", "data": 生效的条件}。
+    budget 可选：实时日志每秒逐条推送的上限，0 = 不降采样。
+    连接断开时关闭订阅，让发送循环退出。
+    """
     try:
         while True:
+            text = await ws.receive_text()
             try:
-                res = await _xread_threadsafe(RAWLOG_STREAM_KEY, last_id, block_ms=2000, count=50)
+                msg = json.loads(text)
             except Exception:
-                ok = await _send_safe(ws, {"type": "status", "data": {"redis": "down", "stream": "rawlog"}})
-                if not ok:
-                    return
-                await asyncio.sleep(1)
                 continue
-
-            if not res:
-                ok = await _send_safe(ws, {"type": "ping"})
-                if not ok:
-                    return
+            if not isinstance(msg, dict) or msg.get("type") != "subscribe":
                 continue
+            filters = msg.get("filters")
+            sub.filter = SubscriptionFilter.from_dict(filters if isinstance(filters, dict) else {})
+            if "budget" in msg:
+                hub.set_budget(sub, msg.get("budget"))
+            data = sub.filter.to_dict()
+            data["budget"] = sub.sampler.budget if sub.sampler else 0
+            sub.offer((None, {"type": "subscribed", "data": data}))
+    except Exception:
+        sub.close("client_gone")
+
+
+async def _replay_to(ws: WebSocket, hub: StreamHub, sub: Subscriber, wire: WireOptions, last_id: str) -> bool:
+    """?last_id= 续传：先把断线期间的条目补发完，再进入实时循环；返回 False 表示客户端已断开"""
+    async for chunk in hub.replay(sub, last_id, max_entries=WS_REPLAY_MAX, chunk=WS_REPLAY_CHUNK):
+        if wire.batched:
+            for i in range(0, len(chunk), wire.batch_max):
+                part = chunk[i:i + wire.batch_max]
+                if not await _send_frame(ws, wire, {"type": "batch", "data": [p for _, p in part]}):
+                    return False
+                for entry_id, _ in part:
+                    sub.mark_sent(entry_id)
+        else:
+            for entry_id, payload in chunk:
+                if not await _send_safe(ws, payload):
+                    return False
+                sub.mark_sent(entry_id)
+    return True
 
-            for _, entries in res:
-                for entry_id, fields in entries:
-                    last_id = entry_id
-                    ok = await _send_safe(ws, {"type": "log", "data": fields})
-                    if not ok:
-                        return
 
-            await asyncio.sleep(0)
+async def _pump_hub(ws: WebSocket, hub: StreamHub) -> None:
+    """
+    从广播中心订阅，把队列里的消息推给这个客户端。
+    读 Redis 的只有 hub 的一个后台任务；这里只负责发送。
+    订阅条件可以在连接 URL 上带（?host=srv-01&severity=HIGH+），也可以连上后发 subscribe 消息修改。
+    ?proto=batch 切到合并帧协议（见 ws_proto），不带则保持逐条 JSON 帧。
+    ?last_id= 带上客户端最后收到的 stream_id，先从 Stream 重放断线期间的条目。
+    """
+    await ws.accept()
+    sub = await hub.subscribe()
+    sub.filter = SubscriptionFilter.from_dict({k: ws.query_params.get(k) for k in _FILTER_KEYS})
+    if "budget" in ws.query_params:
+        hub.set_budget(sub, ws.query_params.get("budget"))
+    recv_task = asyncio.create_task(_recv_subscriptions(ws, hub, sub))
+    wire = WireOptions.from_query(ws.query_params)
+    last_id = (ws.query_params.get("last_id") or "").strip()
+
+    try:
+        if wire.batched and not await _send_safe(ws, wire.hello()):
+            return
+        if last_id and not await _replay_to(ws, hub, sub, wire, last_id):
+            return
+
+        if wire.batched:
+            await _send_batched(ws, sub, wire)
+            return
+
+        while True:
+            item = await sub.queue.get()
+            if item is CLOSE:
+                # 慢客户端被断开（WS_SLOW_POLICY=disconnect）或客户端已断开
+                await _send_safe(ws, {"type": "status", "data": {"ws": "closed", "reason": sub.close_reason}})
+                return
+
+            entry_id, payload = item
+            if sub.already_sent(entry_id):
+                continue
+            ok = await _send_safe(ws, payload)
+            if not ok:
+                return
+            sub.mark_sent(entry_id)
 
     finally:
+        hub.unsubscribe(sub)
+        recv_task.cancel()
         try:
             await ws.close()
         except Exception:
             pass
 
 
+# -----------------------------
+# ✅ 实时日志 WS：不回放数据库，从连接时刻的最新消息开始（带 last_id 时先从 Stream 续传）
+# -----------------------------
+@app.websocket("/ws/logs")
+async def ws_logs(ws: WebSocket):
+    await _pump_hub(ws, rawlog_hub)
+
+
 # -----------------------------
 # ✅ 实时告警 WS：同理
 # -----------------------------
 @app.websocket("/ws/alerts")
 async def ws_alerts(ws: WebSocket):
-    await ws.accept()
-    last_id = await _latest_id_threadsafe(ALERT_STREAM_KEY)
-
-    try:
-        while True:
-            try:
-                res = await _xread_threadsafe(ALERT_STREAM_KEY, last_id, block_ms=2000, count=50)
-            except Exception:
-                ok = await _send_safe(ws, {"type": "status", "data": {"redis": "down", "stream": "alert"}})
-                if not ok:
-                    return
-                await asyncio.sleep(1)
-                continue
-
-            if not res:
-                ok = await _send_safe(ws, {"type": "ping"})
-                if not ok:
-                    return
-                continue
-
-            for _, entries in res:
-                for entry_id, fields in entries:
-                    last_id = entry_id
-                    ok = await _send_safe(ws, {"type": "alert", "data": fields})
-                    if not ok:
-                        return
-
-            await asyncio.sleep(0)
-
-    finally:
-        try:
-            await ws.close()
-        except Exception:
-            pass
+    await _pump_hub(ws, alert_hub)
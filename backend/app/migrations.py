@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+
+# create_all 只会建“不存在的表”，不会给老表补列/补索引；
+# 这里做最小化的增量升级（幂等，可重复执行），避免引入 alembic。
+# (table, column, DDL 类型)
+_ADD_COLUMNS: List[tuple] = [
+    ("alerts", "case_id", "VARCHAR(32) NULL"),
+]
+
+# (table, index_name, columns)
+_ADD_INDEXES: List[tuple] = [
+    ("alerts", "ix_alerts_case_id", ["case_id"]),
+    ("alerts", "ix_alerts_type_id", ["alert_type", "id"]),
+    ("alerts", "ix_alerts_ip_id", ["attack_ip", "id"]),
+    ("alerts", "ix_alerts_host_id", ["host", "id"]),
+    ("alerts", "ix_alerts_sev_created", ["severity", "created_at"]),
+    ("raw_logs", "ix_raw_logs_source_id", ["source_id"]),
+    ("raw_logs", "ix_raw_logs_host_id", ["host_id"]),
+    ("raw_logs", "ix_raw_logs_level_id", ["level_id"]),
+]
+
+
+# raw_logs.source/host/level 字符串列 -> 维度表 id（见 dims.py）
+# (旧列, 新列, DDL 类型, 维度表)
+_DIM_COLUMNS: List[tuple] = [
+    ("source", "source_id", "SMALLINT NULL", "log_sources"),
+    ("host", "host_id", "INT NULL", "log_hosts"),
+    ("level", "level_id", "SMALLINT NULL", "log_levels"),
+]
+_DIM_BACKFILL_CHUNK = 20000
+
+
+def _migrate_rawlog_dims(engine: Engine) -> Dict[str, Any]:
+    """
+    老库：补 *_id 列 -> 维度表灌入已有取值 -> 按主键分批回填 -> 删旧字符串列（连同它们的索引）。
+    幂等：旧列都删掉以后直接跳过；中途中断再启动会从没回填的行继续。
+    大表上最后的 DROP COLUMN 会重建表，建议低峰期启动。
+    """
+    insp = inspect(engine)
+    if "raw_logs" not in set(insp.get_table_names()):
+        return {}
+    cols = {c["name"] for c in insp.get_columns("raw_logs")}
+    legacy = [d for d in _DIM_COLUMNS if d[0] in cols]
+    if not legacy:
+        return {}
+
+    out: Dict[str, Any] = {"added": [], "backfilled": 0, "dropped": []}
+    with engine.begin() as conn:
+        for old, new, ddl, dim in legacy:
+            if new not in cols:
+                conn.execute(text(f"ALTER TABLE raw_logs ADD COLUMN {new} {ddl}"))
+                out["added"].append(new)
+            have = set(conn.execute(text(f"SELECT name FROM {dim}")).scalars())
+            for (name,) in conn.execute(text(f"SELECT DISTINCT {old} FROM raw_logs WHERE {old} IS NOT NULL")).all():
+                if name not in have:
+                    conn.execute(text(f"INSERT INTO {dim} (name) VALUES (:n)"), {"n": name})
+                    have.add(name)
+
+    sets = ", ".join(f"{new} = (SELECT id FROM {dim} WHERE {dim}.name = raw_logs.{old})" for old, new, _, dim in legacy)
+    pending = " OR ".join(f"{new} IS NULL" for _, new, _, _ in legacy)
+    with engine.connect() as conn:
+        hi = conn.execute(text("SELECT MAX(id) FROM raw_logs")).scalar() or 0
+    lo = 0
+    while lo < hi:
+        with engine.begin() as conn:
+            res = conn.execute(
+                text(f"UPDATE raw_logs SET {sets} WHERE id > :lo AND id <= :hi AND ({pending})"),
+                {"lo": lo, "hi": lo + _DIM_BACKFILL_CHUNK},
+            )
+            out["backfilled"] += res.rowcount or 0
+        lo += _DIM_BACKFILL_CHUNK
+
+    insp = inspect(engine)
+    legacy_names = {d[0] for d in legacy}
+    with engine.begin() as conn:
+        for ix in insp.get_indexes("raw_logs"):
+            if set(ix["column_names"]) & legacy_names:
+                conn.execute(text(f"DROP INDEX {ix['name']} ON raw_logs") if engine.dialect.name == "mysql"
+                             else text(f"DROP INDEX {ix['name']}"))
+        for old in legacy_names:
+            conn.execute(text(f"ALTER TABLE raw_logs DROP COLUMN {old}"))
+            out["dropped"].append(old)
+    return out
+
+
+def upgrade_schema(engine: Engine) -> Dict[str, Any]:
+    """
+    返回本次实际执行的变更，方便启动日志里确认。
+    """
+    done: Dict[str, Any] = {"columns": [], "indexes": []}
+    insp = inspect(engine)
+    tables = set(insp.get_table_names())
+
+    with engine.begin() as conn:
+        for table, col, ddl in _ADD_COLUMNS:
+            if table not in tables:
+                continue
+            cols = {c["name"] for c in insp.get_columns(table)}
+            if col in cols:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {ddl}"))
+            done["columns"].append(f"{table}.{col}")
+
+    done["dims"] = _migrate_rawlog_dims(engine)
+
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, name, cols in _ADD_INDEXES:
+            if table not in tables:
+                continue
+            existing = {ix["name"] for ix in insp.get_indexes(table)}
+            if name in existing:
+                continue
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(cols)})"))
+            done["indexes"].append(f"{table}.{name}")
+
+    return done
@@ -1,7 +1,53 @@
 from datetime import datetime
-from sqlalchemy import String, Text, DateTime, Integer, text
+from typing import Optional
+from sqlalchemy import String, Text, DateTime, Integer, SmallInteger, Float, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
-from .db import Base
+from .db import Base, db_now
+
+
+def _dim_attr(kind: str):
+    """
+    raw_logs 里只存维度 id；对外仍是字符串属性：
+    RawLog(source=..., host=..., level=...) 照旧构造，flush 前由 dims.py 换成 id；读的时候查进程内缓存
+    """
+    pending = f"_pending_{kind}"
+
+    def fget(self):
+        name = self.__dict__.get(pending)
+        if name is not None:
+            return name
+        from .dims import dims
+        return dims[kind].name(getattr(self, f"{kind}_id"))
+
+    def fset(self, value):
+        self.__dict__[pending] = value
+
+    return property(fget, fset)
+
+
+# SQLite 只有 INTEGER PRIMARY KEY 才自增
+_SmallId = SmallInteger().with_variant(Integer, "sqlite")
+
+
+class LogSource(Base):
+    __tablename__ = "log_sources"
+
+    id: Mapped[int] = mapped_column(_SmallId, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), unique=True)
+
+
+class LogHost(Base):
+    __tablename__ = "log_hosts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(128), unique=True)
+
+
+class LogLevel(Base):
+    __tablename__ = "log_levels"
+
+    id: Mapped[int] = mapped_column(_SmallId, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(16), unique=True)
 
 
 class RawLog(Base):
@@ -13,21 +59,19 @@ class RawLog(Base):
         autoincrement=True
     )
 
-    source: Mapped[str] = mapped_column(
-        String(64),
-        default="manual",
+    # ✅ source/host/level 只有几十种取值：存维度表的整数 id（2~4 字节），索引也跟着变小
+    source_id: Mapped[int] = mapped_column(
+        SmallInteger,
         index=True
     )
 
-    host: Mapped[str] = mapped_column(
-        String(128),
-        default="unknown",
+    host_id: Mapped[int] = mapped_column(
+        Integer,
         index=True
     )
 
-    level: Mapped[str] = mapped_column(
-        String(16),
-        default="INFO",
+    level_id: Mapped[int] = mapped_column(
+        SmallInteger,
         index=True
     )
 
@@ -35,16 +79,27 @@ class RawLog(Base):
         Text
     )
 
-    # ✅ 关键：由 MySQL 生成时间（使用 MySQL 当前会话时区）
+    # ✅ 关键：由数据库生成时间（MySQL 当前会话时区；SQLite 见 db_now）
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
-        server_default=text("CURRENT_TIMESTAMP"),
+        server_default=db_now(),
         index=True
     )
 
+    source = _dim_attr("source")
+    host = _dim_attr("host")
+    level = _dim_attr("level")
+
 
 class Alert(Base):
     __tablename__ = "alerts"
+    # ✅ /alerts 过滤 + 按 id 游标翻页：等值列在前、id 在后，一个索引同时完成过滤和排序
+    __table_args__ = (
+        Index("ix_alerts_type_id", "alert_type", "id"),
+        Index("ix_alerts_ip_id", "attack_ip", "id"),
+        Index("ix_alerts_host_id", "host", "id"),
+        Index("ix_alerts_sev_created", "severity", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer,
@@ -87,9 +142,170 @@ class Alert(Base):
         Text
     )  # JSON 字符串（证据链）
 
-    # ✅ 同样由 MySQL 生成时间
+    # ✅ 溯源 case 单独落表（trace_cases），告警只存引用，按需加载
+    case_id: Mapped[Optional[str]] = mapped_column(
+        String(32),
+        nullable=True,
+        index=True
+    )
+
+    # ✅ 同样由数据库生成时间
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        server_default=db_now(),
+        index=True
+    )
+
+
+# -----------------------------
+# ✅ 溯源 case 存储：case 主表 + 时间线步骤 + 原始日志关联
+# -----------------------------
+class TraceCase(Base):
+    __tablename__ = "trace_cases"
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    case_id: Mapped[str] = mapped_column(
+        String(32),
+        unique=True,
+        index=True
+    )
+
+    alert_id: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        nullable=True,
+        index=True
+    )
+
+    trigger_rule: Mapped[str] = mapped_column(
+        String(64),
+        default=""
+    )
+
+    trigger_ts: Mapped[Optional[datetime]] = mapped_column(
+        DateTime,
+        nullable=True
+    )
+
+    src_ip: Mapped[str] = mapped_column(
+        String(64),
+        default="",
+        index=True
+    )
+
+    protocol: Mapped[str] = mapped_column(
+        String(16),
+        default=""
+    )
+
+    dst_host: Mapped[str] = mapped_column(
+        String(128),
+        default=""
+    )
+
+    dst_port: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        nullable=True
+    )
+
+    dst_path: Mapped[str] = mapped_column(
+        String(512),
+        default=""
+    )
+
+    plugin: Mapped[str] = mapped_column(
+        String(32),
+        default=""
+    )
+
+    plugin_score: Mapped[float] = mapped_column(
+        Float,
+        default=0.0
+    )
+
+    fingerprint_hash: Mapped[str] = mapped_column(
+        String(32),
+        default="",
+        index=True
+    )
+
+    step_count: Mapped[int] = mapped_column(
+        Integer,
+        default=0
+    )
+
+    rawlog_count: Mapped[int] = mapped_column(
+        Integer,
+        default=0
+    )
+
+    detail: Mapped[str] = mapped_column(
+        Text
+    )  # JSON：reasons / tactic_chain / fingerprints / infrastructure / link
+
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
-        server_default=text("CURRENT_TIMESTAMP"),
+        server_default=db_now(),
         index=True
     )
+
+
+class TraceCaseStep(Base):
+    __tablename__ = "trace_case_steps"
+
+    id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+
+    case_id: Mapped[str] = mapped_column(
+        String(32),
+        index=True
+    )
+
+    seq: Mapped[int] = mapped_column(
+        Integer,
+        default=0
+    )
+
+    ts: Mapped[Optional[datetime]] = mapped_column(
+        DateTime,
+        nullable=True
+    )
+
+    action: Mapped[str] = mapped_column(
+        String(128),
+        default=""
+    )
+
+    detail: Mapped[str] = mapped_column(
+        Text
+    )  # JSON
+
+    ref_raw_id: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        nullable=True
+    )
+
+
+class TraceCaseRawLog(Base):
+    __tablename__ = "trace_case_rawlogs"
+
+    case_id: Mapped[str] = mapped_column(
+        String(32),
+        primary_key=True
+    )
+
+    raw_id: Mapped[int] = mapped_column(
+        Integer,
+        primary_key=True,
+        index=True
+    )
+
+
+from . import dims  # noqa: E402,F401  注册 RawLog 的 before_flush（维度名 -> id）
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, and_, exists, func, or_, select, text
+from sqlalchemy.engine import Engine
+
+from .archive import ARCHIVE_AFTER_DAYS, ARCHIVE_RETENTION_DAYS, ARCHIVE_SEGMENT_ROWS, cold_archive, write_segment
+from .db import db_now
+from .dims import dims
+from .models import Alert, RawLog, TraceCase, TraceCaseRawLog, TraceCaseStep
+
+
+# -----------------------------
+# 数据保留：raw_logs / alerts 按 created_at 过期删除
+#   DB_PARTITION=day|month（仅 MySQL）：表按 RANGE COLUMNS(created_at) 分区，
+#       过期 = DROP PARTITION（元数据操作，不逐行删、不长时间锁表），并提前建好未来的分区；
+#       /logs/recent?since= 和溯源的时间窗口查询会自动分区裁剪
+#   未分区（默认 / 非 MySQL）：按主键小批量删除，每批一个短事务，批间 sleep
+# 代价：分区表主键变成 (id, created_at)，且 InnoDB 分区表不支持 FULLTEXT，
+#       开分区后 raw_logs 搜索退回 LIKE（见 search.py）
+# *_RETENTION_DAYS=0 表示永久保留（默认）
+# 溯源 case（trace_cases + steps + rawlogs 关联）跟着告警一起过期：trigger_ts（没有则 created_at）
+#   早于 TRACE_RETENTION_DAYS（默认同 ALERT_RETENTION_DAYS），或者关联的告警已经被删掉
+# ARCHIVE_AFTER_DAYS>0 时先把过期 raw_logs 搬进冷归档（archive.py），再做上面的删除；
+#   归档天数应小于 RAWLOG_RETENTION_DAYS，否则分区会在归档前被删掉
+# -----------------------------
+DB_PARTITION = os.getenv("DB_PARTITION", "").strip().lower()
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "3"))
+RAWLOG_RETENTION_DAYS = int(os.getenv("RAWLOG_RETENTION_DAYS", "0"))
+ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "0"))
+TRACE_RETENTION_DAYS = int(os.getenv("TRACE_RETENTION_DAYS", str(ALERT_RETENTION_DAYS)))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_CHUNK = int(os.getenv("RETENTION_CHUNK", "5000"))
+RETENTION_PAUSE_MS = int(os.getenv("RETENTION_PAUSE_MS", "50"))
+
+_TABLES: List[Tuple[Table, int]] = [
+    (RawLog.__table__, RAWLOG_RETENTION_DAYS),
+    (Alert.__table__, ALERT_RETENTION_DAYS),
+]
+
+
+# -----------------------------
+# 分区（MySQL）
+# -----------------------------
+def _period_start(dt: datetime, unit: str) -> datetime:
+    d = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return d.replace(day=1) if unit == "month" else d
+
+
+def _next_period(dt: datetime, unit: str) -> datetime:
+    if unit == "month":
+        return (dt.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return dt + timedelta(days=1)
+
+
+def _partition_name(start: datetime, unit: str) -> str:
+    return start.strftime("p%Y%m" if unit == "month" else "p%Y%m%d")
+
+
+def _partition_def(start: datetime, unit: str) -> str:
+    upper = _next_period(start, unit)
+    return f"PARTITION {_partition_name(start, unit)} VALUES LESS THAN ('{upper:%Y-%m-%d %H:%M:%S}')"
+
+
+def list_partitions(conn, table: str) -> List[Tuple[str, Optional[datetime]]]:
+    """[(name, 上界)]，MAXVALUE 的上界是 None；未分区返回 []"""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"t": table}).all()
+    out: List[Tuple[str, Optional[datetime]]] = []
+    for name, desc in rows:
+        bound = None
+        if desc and desc.upper() != "MAXVALUE":
+            bound = datetime.strptime(desc.strip("'"), "%Y-%m-%d %H:%M:%S")
+        out.append((name, bound))
+    return out
+
+
+def _db_now(conn) -> datetime:
+    # created_at 是库里的当前时间，过期时间也用库的时钟算，避免应用/库时区不一致
+    now = conn.execute(select(db_now())).scalar()
+    return datetime.fromisoformat(now) if isinstance(now, str) else now  # SQLite 返回字符串
+
+
+def setup_partitions(engine: Engine) -> Dict[str, Any]:
+    """启动时调用：DB_PARTITION 打开时把还没分区的表转成分区表（表很大时这一步会重建整表）"""
+    done: Dict[str, Any] = {"mode": DB_PARTITION or "none", "converted": [], "error": None}
+    if DB_PARTITION not in ("day", "month") or engine.dialect.name != "mysql":
+        return done
+    unit = DB_PARTITION
+    try:
+        for table, _ in _TABLES:
+            with engine.begin() as conn:
+                if list_partitions(conn, table.name):
+                    continue
+                now = _db_now(conn)
+                cur = _period_start(now, unit)
+                parts = [f"PARTITION p_hist VALUES LESS THAN ('{cur:%Y-%m-%d %H:%M:%S}')"]
+                start = cur
+                for _ in range(PARTITION_PREMAKE + 1):
+                    parts.append(_partition_def(start, unit))
+                    start = _next_period(start, unit)
+                parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+                # 分区键必须出现在每个唯一键里；分区表不支持 FULLTEXT
+                ft = conn.execute(text(
+                    f"SHOW INDEX FROM {table.name} WHERE Index_type = 'FULLTEXT'"
+                )).all()
+                for name in {r[2] for r in ft}:
+                    conn.execute(text(f"ALTER TABLE {table.name} DROP INDEX {name}"))
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+                    f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+                ))
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} PARTITION BY RANGE COLUMNS(created_at) ({', '.join(parts)})"
+                ))
+                done["converted"].append(table.name)
+    except Exception as e:
+        done["error"] = repr(e)
+    return done
+
+
+def is_partitioned(engine: Engine, table: str) -> bool:
+    if engine.dialect.name != "mysql":
+        return False
+    with engine.connect() as conn:
+        return bool(list_partitions(conn, table))
+
+
+# -----------------------------
+# 后台任务
+# -----------------------------
+class RetentionJob(threading.Thread):
+    def __init__(self, engine: Engine, interval: float = RETENTION_INTERVAL_SECONDS,
+                 chunk: int = RETENTION_CHUNK, pause_ms: int = RETENTION_PAUSE_MS):
+        super().__init__(name="retention", daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.chunk = max(1, chunk)
+        self.pause = pause_ms / 1000.0
+        self._stop_evt = threading.Event()
+
+        self.runs = 0
+        self.last_run_ts: Optional[float] = None
+        self.last_run_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.deleted_rows: Dict[str, int] = {}
+        self.dropped_partitions: List[str] = []
+        self.created_partitions: List[str] = []
+        self.archived_rows = 0
+        self.archived_segments = 0
+        self.dropped_segments: List[str] = []
+        self.corr_pruned = 0
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+    def run(self) -> None:
+        while not self._stop_evt.is_set():
+            self.run_once()
+            self._stop_evt.wait(self.interval)
+
+    def run_once(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            if ARCHIVE_AFTER_DAYS > 0:
+                self._archive_rawlogs()
+            if ARCHIVE_RETENTION_DAYS > 0:
+                with self.engine.connect() as conn:
+                    cutoff = _db_now(conn) - timedelta(days=ARCHIVE_RETENTION_DAYS)
+                self.dropped_segments.extend(cold_archive.drop_older_than(cutoff))
+                self.dropped_segments = self.dropped_segments[-50:]
+            for table, days in _TABLES:
+                with self.engine.connect() as conn:
+                    parts = list_partitions(conn, table.name) if self.engine.dialect.name == "mysql" else []
+                if parts:
+                    self._maintain_partitions(table.name, parts, days)
+                elif days > 0:
+                    self._delete_chunked(table, days)
+            if TRACE_RETENTION_DAYS > 0:
+                self._delete_trace_cases(TRACE_RETENTION_DAYS)
+            if ALERT_RETENTION_DAYS > 0:
+                self._prune_correlation()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = repr(e)
+        self.runs += 1
+        self.last_run_ts = time.time()
+        self.last_run_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    # ---- 分区表：补未来分区 + 删过期分区 ----
+    def _maintain_partitions(self, table: str, parts: List[Tuple[str, Optional[datetime]]], days: int) -> None:
+        unit = DB_PARTITION if DB_PARTITION in ("day", "month") else (
+            "month" if any(len(n) == 7 and n[1:].isdigit() for n, _ in parts) else "day"
+        )
+        with self.engine.begin() as conn:
+            now = _db_now(conn)
+            bounds = [b for _, b in parts if b is not None]
+            last = max(bounds) if bounds else _period_start(now, unit)
+            horizon = _period_start(now, unit)
+            for _ in range(PARTITION_PREMAKE + 1):
+                horizon = _next_period(horizon, unit)
+            new_defs, new_names = [], []
+            start = last
+            while start < horizon:
+                new_defs.append(_partition_def(start, unit))
+                new_names.append(f"{table}.{_partition_name(start, unit)}")
+                start = _next_period(start, unit)
+            if new_defs and any(n == "pmax" for n, _ in parts):
+                # pmax 里正常没有数据，REORGANIZE 基本只是改元数据
+                conn.execute(text(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                    f"({', '.join(new_defs)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+                ))
+                self.created_partitions.extend(new_names)
+
+            if days <= 0:
+                return
+            cutoff = now - timedelta(days=days)
+            expired = [n for n, b in parts if b is not None and b <= cutoff]
+            # 至少留一个有上界的分区，RANGE 分区不能删光
+            if expired and len(expired) < len(bounds):
+                conn.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+                self.dropped_partitions.extend(f"{table}.{n}" for n in expired)
+        self.created_partitions = self.created_partitions[-50:]
+        self.dropped_partitions = self.dropped_partitions[-50:]
+
+    # ---- 未分区：按主键区间小批量删 ----
+    def _delete_chunked(self, table: Table, days: int) -> None:
+        ts_col = table.c.created_at
+        with self.engine.connect() as conn:
+            cutoff = _db_now(conn) - timedelta(days=days)
+            # created_at 索引里带着主键，这一步只扫索引
+            hi = conn.execute(select(func.max(table.c.id)).where(ts_col < cutoff)).scalar()
+        if hi is not None:
+            self._delete_range(table, 0, hi, ts_col < cutoff)
+
+    def _delete_range(self, table: Table, lo: int, hi: int, *extra: Any) -> None:
+        """删 lo < id <= hi，每批最多 chunk 行、一个短事务"""
+        id_col = table.c.id
+        while not self._stop_evt.is_set():
+            with self.engine.begin() as conn:
+                ids = conn.execute(
+                    select(id_col).where(and_(id_col > lo, id_col <= hi)).order_by(id_col.asc()).limit(self.chunk)
+                ).scalars().all()
+                if not ids:
+                    return
+                res = conn.execute(table.delete().where(and_(id_col >= ids[0], id_col <= ids[-1], *extra)))
+            lo = ids[-1]
+            self.deleted_rows[table.name] = self.deleted_rows.get(table.name, 0) + (res.rowcount or 0)
+            if self.pause:
+                time.sleep(self.pause)
+
+    # ---- 溯源 case：主表按 id 分批，同一事务里连带删 steps / rawlogs 关联 ----
+    def _delete_trace_cases(self, days: int) -> None:
+        tc = TraceCase.__table__
+        alerts = Alert.__table__
+        with self.engine.connect() as conn:
+            cutoff = _db_now(conn) - timedelta(days=days)
+        expired = or_(
+            func.coalesce(tc.c.trigger_ts, tc.c.created_at) < cutoff,
+            and_(tc.c.alert_id.isnot(None), ~exists().where(alerts.c.id == tc.c.alert_id)),
+        )
+        lo = 0
+        while not self._stop_evt.is_set():
+            with self.engine.begin() as conn:
+                batch = conn.execute(
+                    select(tc.c.id, tc.c.case_id).where(and_(tc.c.id > lo, expired))
+                    .order_by(tc.c.id.asc()).limit(self.chunk)
+                ).all()
+                if not batch:
+                    return
+                case_ids = [r[1] for r in batch]
+                counts = {
+                    TraceCaseStep.__tablename__: conn.execute(
+                        TraceCaseStep.__table__.delete().where(TraceCaseStep.__table__.c.case_id.in_(case_ids))
+                    ).rowcount,
+                    TraceCaseRawLog.__tablename__: conn.execute(
+                        TraceCaseRawLog.__table__.delete().where(TraceCaseRawLog.__table__.c.case_id.in_(case_ids))
+                    ).rowcount,
+                    tc.name: conn.execute(tc.delete().where(tc.c.id.in_([r[0] for r in batch]))).rowcount,
+                }
+            lo = batch[-1][0]
+            for name, n in counts.items():
+                self.deleted_rows[name] = self.deleted_rows.get(name, 0) + (n or 0)
+            if self.pause:
+                time.sleep(self.pause)
+
+    # ---- 攻击者关联图：去掉已删除的告警（alerts.id 单调递增，最小的存活 id 以下都删掉了）----
+    def _prune_correlation(self) -> None:
+        from .services.correlation.graph import corr_graph
+
+        with self.engine.connect() as conn:
+            lo = conn.execute(select(func.min(Alert.__table__.c.id))).scalar()
+        if lo is not None:
+            self.corr_pruned += corr_graph.forget_alerts_below(lo)
+
+    # ---- 冷归档：热表里过期的 raw_logs 写成列式段文件后再删 ----
+    def _archive_rawlogs(self) -> None:
+        raw = RawLog.__table__
+        done_hi = cold_archive.max_id()
+        # 上次段已写好、热表还没删完（中途退出）：先补删，保证热表 id 都大于归档的 max_id
+        if done_hi:
+            self._delete_range(raw, 0, done_hi)
+        with self.engine.connect() as conn:
+            cutoff = _db_now(conn) - timedelta(days=ARCHIVE_AFTER_DAYS)
+            hi = conn.execute(select(func.max(raw.c.id)).where(raw.c.created_at < cutoff)).scalar()
+        if hi is None:
+            return
+
+        cols = [raw.c.id, raw.c.created_at, raw.c.source_id, raw.c.host_id, raw.c.level_id, raw.c.message]
+        src, host, lvl = dims["source"], dims["host"], dims["level"]
+        lo = done_hi
+        while not self._stop_evt.is_set():
+            with self.engine.connect() as conn:
+                # 段文件里存字符串（段内自己做字典编码），不依赖热库的维度 id
+                rows = [
+                    (r[0], r[1], src.name(r[2]), host.name(r[3]), lvl.name(r[4]), r[5])
+                    for r in conn.execute(
+                        select(*cols).where(and_(raw.c.id > lo, raw.c.id <= hi)).order_by(raw.c.id.asc())
+                        .limit(ARCHIVE_SEGMENT_ROWS)
+                    ).all()
+                ]
+            if not rows:
+                return
+            write_segment(cold_archive.directory, rows)
+            self.archived_rows += len(rows)
+            self.archived_segments += 1
+            self._delete_range(raw, lo, rows[-1][0])
+            lo = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "partition": DB_PARTITION or "none",
+            "retention_days": _retention_days(),
+            "interval_seconds": self.interval,
+            "chunk": self.chunk,
+            "runs": self.runs,
+            "last_run_ts": self.last_run_ts,
+            "last_run_ms": self.last_run_ms,
+            "last_error": self.last_error,
+            "deleted_rows": dict(self.deleted_rows),
+            "created_partitions": list(self.created_partitions[-10:]),
+            "dropped_partitions": list(self.dropped_partitions[-10:]),
+            "archive_after_days": ARCHIVE_AFTER_DAYS,
+            "archived_rows": self.archived_rows,
+            "archived_segments": self.archived_segments,
+            "dropped_segments": list(self.dropped_segments[-10:]),
+            "correlation_pruned": self.corr_pruned,
+        }
+
+
+_job: Optional[RetentionJob] = None
+
+
+def _retention_days() -> Dict[str, int]:
+    out = {t.name: d for t, d in _TABLES}
+    out[TraceCase.__tablename__] = TRACE_RETENTION_DAYS
+    return out
+
+
+def start_retention(engine: Engine) -> None:
+    """分区表需要定期补未来分区，所以开了分区即使不设保留天数也要跑"""
+    global _job
+    if _job is not None:
+        return
+    if not (DB_PARTITION or ARCHIVE_AFTER_DAYS > 0 or TRACE_RETENTION_DAYS > 0 or any(d > 0 for _, d in _TABLES)):
+        return
+    _job = RetentionJob(engine)
+    _job.start()
+
+
+def retention_stats() -> Dict[str, Any]:
+    if _job is None:
+        return {"enabled": False, "partition": DB_PARTITION or "none",
+                "retention_days": _retention_days()}
+    return {"enabled": True, **_job.stats()}
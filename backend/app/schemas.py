@@ -36,7 +36,8 @@ class AlertOut(BaseModel):
     host: str
     count: int
     window_seconds: int
-    evidence: Any
+    evidence: Any = None  # 列表默认不带（摘要投影），include_evidence=true 或 /alerts/{id}/evidence 获取
+    case_id: Optional[str] = None
     created_at: str
 
     if ConfigDict is not None:
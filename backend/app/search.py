@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, column, literal_column, select, table, text
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.engine import Engine
+
+from .models import RawLog
+from .retention import is_partitioned
+
+
+# -----------------------------
+# raw_logs.message 全文检索：
+#   MySQL：FULLTEXT 索引 + ngram parser（中文/IP/路径都能切），查询走 MATCH ... AGAINST 短语模式，
+#          再叠一个 LIKE 做精确复核（只作用在全文索引命中的候选行上，不会回表全扫）
+#   SQLite：FTS5 外部内容表 raw_logs_fts（trigram 分词 = 任意子串，默认不区分大小写），
+#          触发器跟着 raw_logs 的增删改同步；查询 id IN (SELECT rowid ... MATCH 短语)
+#   其他后端 / 索引还没建好 / 关键词短于 ngram_token_size（trigram 固定 3）：退回 LIKE '%kw%'
+# LOG_SEARCH_MODE=auto（默认，有索引就用）| like（强制旧行为）
+# LOG_FULLTEXT_AUTOCREATE=0：启动时不自动建索引（大表建 FULLTEXT 要重建表，可以低峰期手动执行 ddl()）
+# -----------------------------
+LOG_SEARCH_MODE = os.getenv("LOG_SEARCH_MODE", "auto").strip().lower()
+LOG_FULLTEXT_AUTOCREATE = os.getenv("LOG_FULLTEXT_AUTOCREATE", "1") == "1"
+
+FULLTEXT_INDEX = "ft_raw_logs_message"
+FTS5_TABLE = "raw_logs_fts"
+
+_FTS5_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS5_TABLE} USING fts5("
+    f"message, content='raw_logs', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS raw_logs_fts_ai AFTER INSERT ON raw_logs BEGIN "
+    f"INSERT INTO {FTS5_TABLE}(rowid, message) VALUES (new.id, new.message); END",
+    f"CREATE TRIGGER IF NOT EXISTS raw_logs_fts_ad AFTER DELETE ON raw_logs BEGIN "
+    f"INSERT INTO {FTS5_TABLE}({FTS5_TABLE}, rowid, message) VALUES ('delete', old.id, old.message); END",
+    f"CREATE TRIGGER IF NOT EXISTS raw_logs_fts_au AFTER UPDATE OF message ON raw_logs BEGIN "
+    f"INSERT INTO {FTS5_TABLE}({FTS5_TABLE}, rowid, message) VALUES ('delete', old.id, old.message); "
+    f"INSERT INTO {FTS5_TABLE}(rowid, message) VALUES (new.id, new.message); END",
+]
+_fts5 = table(FTS5_TABLE, column("rowid"))
+
+
+class LogSearch:
+    def __init__(self) -> None:
+        self.backend = "like"
+        self.min_token = 2  # ngram_token_size，configure() 时从服务端读
+        self.error: Optional[str] = None
+
+    @staticmethod
+    def ddl() -> str:
+        return f"ALTER TABLE raw_logs ADD FULLTEXT INDEX {FULLTEXT_INDEX} (message) WITH PARSER ngram"
+
+    def configure(self, engine: Engine) -> Dict[str, Any]:
+        """启动时调用：确认（必要时创建）全文索引，决定查询走哪条路径"""
+        self.backend = "like"
+        if LOG_SEARCH_MODE == "like":
+            return self.stats()
+        if engine.dialect.name == "sqlite":
+            return self._configure_fts5(engine)
+        if engine.dialect.name != "mysql":
+            return self.stats()
+        if is_partitioned(engine, "raw_logs"):
+            # InnoDB 分区表不支持 FULLTEXT（DB_PARTITION 打开时）
+            self.error = "raw_logs is partitioned; FULLTEXT unavailable"
+            return self.stats()
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    text("SHOW INDEX FROM raw_logs WHERE Key_name = :n"), {"n": FULLTEXT_INDEX}
+                ).first() is not None
+                if not exists and LOG_FULLTEXT_AUTOCREATE:
+                    conn.execute(text(self.ddl()))
+                    exists = True
+                row = conn.execute(text("SHOW VARIABLES LIKE 'ngram_token_size'")).first()
+                if row is not None:
+                    self.min_token = int(row[1])
+            if exists:
+                self.backend = "fulltext"
+        except Exception as e:
+            self.error = repr(e)
+        return self.stats()
+
+    def _configure_fts5(self, engine: Engine) -> Dict[str, Any]:
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": FTS5_TABLE}
+                ).first() is not None
+                if not exists and not LOG_FULLTEXT_AUTOCREATE:
+                    return self.stats()
+                for sql in _FTS5_DDL:
+                    conn.execute(text(sql))
+                if not exists:
+                    # 新建的索引是空的：从 raw_logs 全量重建一次
+                    conn.execute(text(f"INSERT INTO {FTS5_TABLE}({FTS5_TABLE}) VALUES ('rebuild')"))
+            self.backend = "fts5"
+            self.min_token = 3
+        except Exception as e:  # 编译时没带 FTS5 / trigram（SQLite < 3.34）
+            self.error = repr(e)
+        return self.stats()
+
+    def condition(self, kw: str):
+        """message 包含 kw 的 WHERE 条件"""
+        pattern = f"%{_escape_like(kw)}%"
+        if self.backend == "fts5" and len(kw) >= self.min_token:
+            # trigram 的短语查询就是子串匹配，不需要 LIKE 复核
+            phrase = '"' + kw.replace('"', '""') + '"'
+            hits = select(_fts5.c.rowid).where(literal_column(FTS5_TABLE).op("MATCH")(phrase))
+            return RawLog.id.in_(hits)
+        if self.backend != "fulltext" or len(kw) < self.min_token:
+            return RawLog.message.ilike(pattern, escape="\\")
+        # MySQL 默认 *_ci 排序规则，LIKE 本身不区分大小写，不用 ilike 的 lower() 包一层
+        like = RawLog.message.like(pattern, escape="\\")
+        # 布尔模式下的双引号短语 = ngram 序列连续出现；LIKE 复核去掉标点切分带来的误命中
+        phrase = '"' + kw.replace('"', " ") + '"'
+        return and_(match(RawLog.message, against=phrase).in_boolean_mode(), like)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": LOG_SEARCH_MODE,
+            "backend": self.backend,
+            "index": {"fulltext": FULLTEXT_INDEX, "fts5": FTS5_TABLE}.get(self.backend),
+            "ngram_token_size": self.min_token,
+            "error": self.error,
+        }
+
+
+def _escape_like(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+log_search = LogSearch()
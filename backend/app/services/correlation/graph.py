@@ -0,0 +1,601 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+
+# -----------------------------
+# 攻击者关联图（增量 union-find）
+# 节点：alert:{id} / ip:{src_ip} / fp:{fingerprint_hash} / ua:{hash}
+# 每条新告警只和它的属性节点做 union，合并按节点数（小并大）+ 路径压缩，
+# 均摊 O(α(n))；成员集合也是小并大，不需要任何批量重算。
+# 目标主机只作为 campaign 属性记录，不参与合并（否则同一站点的所有攻击都会连成一片）。
+# 容量：union-find 不支持删单个节点，按整个 campaign（连通分量）回收——
+#   超过 CORRELATION_TTL 没有新告警的整体删掉；节点总数超过 CORRELATION_MAX_NODES 时从最久不活跃的开始删；
+#   数据保留任务删掉告警后调 forget_alerts_below，成员里去掉已删除的告警，成员删空的 campaign 一起回收
+# -----------------------------
+CORR_BACKEND = os.getenv("CORRELATION_BACKEND", "redis").strip().lower()
+CORR_ENABLED = os.getenv("CORRELATION", "1") == "1"
+CORR_TTL_SECONDS = int(os.getenv("CORRELATION_TTL", str(30 * 86400)))  # 0 = 不按时间回收
+CORR_MAX_NODES = int(os.getenv("CORRELATION_MAX_NODES", "500000"))     # 0 = 不限
+CORR_PRUNE_INTERVAL = float(os.getenv("CORRELATION_PRUNE_INTERVAL", "300"))
+# Redis key 前缀：必须带 {hash tag}，Lua 脚本里拼出来的 key 才和 KEYS 在同一个 slot（Redis Cluster / 代理）
+CORR_PREFIX = os.getenv("CORRELATION_PREFIX", "{corr}")
+
+# 这些指纹/UA 太泛，拿来合并会把无关攻击者连成一个 campaign
+_GENERIC_FP_KINDS = {"", "Generic"}
+_BROWSER_UA_PREFIXES = ("mozilla/", "-")
+
+
+def _h(s: str) -> str:
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()[:16]
+
+
+def alert_node(alert_id: int) -> str:
+    return f"alert:{alert_id}"
+
+
+def attribute_nodes(src_ip: str, fp_hash: str, fp_kind: str, ua: str) -> List[str]:
+    nodes = []
+    if src_ip:
+        nodes.append(f"ip:{src_ip}")
+    if fp_hash and fp_kind not in _GENERIC_FP_KINDS:
+        nodes.append(f"fp:{fp_hash}")
+    u = (ua or "").strip().lower()
+    if u and not u.startswith(_BROWSER_UA_PREFIXES):
+        # 去掉版本号：sqlmap/1.5 和 sqlmap/1.6 视为同一工具
+        nodes.append(f"ua:{_h(re.sub(r'[0-9.]+', '', u))}")
+    return nodes
+
+
+class CorrelationGraph:
+    name = "base"
+
+    def add_alert(self, alert_id: int, src_ip: str, host: str, attrs: List[str], ts: Optional[int] = None) -> str:
+        """返回告警所在 campaign_id（= 当前根节点）"""
+        raise NotImplementedError
+
+    def campaign_of(self, node: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def list_campaigns(self, limit: int = 50, min_size: int = 2) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_campaign(self, campaign_id: str, member_limit: int = 500) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """按 TTL / 节点上限回收整个 campaign，返回回收数"""
+        return 0
+
+    def forget_alerts_below(self, min_alert_id: int) -> int:
+        """id < min_alert_id 的告警已被删除：从成员里去掉，成员删空的 campaign 回收；返回回收数"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryCorrelationGraph(CorrelationGraph):
+    name = "memory"
+
+    def __init__(self, ttl_seconds: int = CORR_TTL_SECONDS, max_nodes: int = CORR_MAX_NODES,
+                 prune_interval: float = CORR_PRUNE_INTERVAL):
+        self.ttl_seconds = ttl_seconds
+        self.max_nodes = max_nodes
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._parent: Dict[str, str] = {}
+        self._size: Dict[str, int] = {}
+        self._nodes: Dict[str, Set[str]] = {}  # root -> 分量内全部节点（回收时用）
+        self._members: Dict[str, Set[int]] = {}
+        self._ips: Dict[str, Set[str]] = {}
+        self._hosts: Dict[str, Set[str]] = {}
+        self._first: Dict[str, int] = {}
+        self._last: Dict[str, int] = {}
+        self._last_prune = time.time()
+        self.pruned_total = 0
+
+    def _make(self, x: str) -> None:
+        if x not in self._parent:
+            self._parent[x] = x
+            self._size[x] = 1
+            self._nodes[x] = {x}
+
+    def _find(self, x: str) -> str:
+        root = x
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[x] != root:
+            self._parent[x], x = root, self._parent[x]
+        return root
+
+    def _union(self, a: str, b: str) -> str:
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return ra
+        if self._size[ra] < self._size[rb]:
+            ra, rb = rb, ra
+        self._parent[rb] = ra
+        self._size[ra] += self._size.pop(rb, 0)
+        for store in (self._nodes, self._members, self._ips, self._hosts):
+            small = store.pop(rb, None)
+            if small:
+                store.setdefault(ra, set()).update(small)
+        if rb in self._first:
+            self._first[ra] = min(self._first.get(ra, self._first[rb]), self._first.pop(rb))
+        if rb in self._last:
+            self._last[ra] = max(self._last.get(ra, 0), self._last.pop(rb))
+        return ra
+
+    def add_alert(self, alert_id: int, src_ip: str, host: str, attrs: List[str], ts: Optional[int] = None) -> str:
+        ts = int(ts or time.time())
+        a = alert_node(alert_id)
+        with self._lock:
+            self._make(a)
+            self._members[a] = {int(alert_id)}
+            self._ips[a] = {src_ip} if src_ip else set()
+            self._hosts[a] = {host} if host else set()
+            self._first[a] = ts
+            self._last[a] = ts
+            root = a
+            for n in attrs:
+                self._make(n)
+                root = self._union(root, n)
+            if time.time() - self._last_prune >= self.prune_interval:
+                self._prune_locked(time.time())
+            return root
+
+    def _drop(self, root: str) -> None:
+        for n in self._nodes.pop(root, ()):
+            self._parent.pop(n, None)
+            self._size.pop(n, None)
+        for store in (self._members, self._ips, self._hosts, self._first, self._last):
+            store.pop(root, None)
+        self.pruned_total += 1
+
+    def _prune_locked(self, now: float) -> int:
+        self._last_prune = time.time()
+        roots = [r for r in self._last if self._parent.get(r) == r]
+        dropped = 0
+        if self.ttl_seconds > 0:
+            cutoff = now - self.ttl_seconds
+            for r in [r for r in roots if self._last[r] < cutoff]:
+                self._drop(r)
+                dropped += 1
+        if self.max_nodes > 0 and len(self._parent) > self.max_nodes:
+            for r in sorted((r for r in self._last if self._parent.get(r) == r), key=self._last.__getitem__):
+                if len(self._parent) <= self.max_nodes:
+                    break
+                self._drop(r)
+                dropped += 1
+        return dropped
+
+    def prune(self, now: Optional[float] = None) -> int:
+        with self._lock:
+            return self._prune_locked(now or time.time())
+
+    def forget_alerts_below(self, min_alert_id: int) -> int:
+        dropped = 0
+        with self._lock:
+            for root, members in list(self._members.items()):
+                if self._parent.get(root) != root:
+                    continue
+                kept = {i for i in members if i >= min_alert_id}
+                if kept:
+                    self._members[root] = kept
+                else:
+                    self._drop(root)
+                    dropped += 1
+        return dropped
+
+    def campaign_of(self, node: str) -> Optional[str]:
+        with self._lock:
+            if node not in self._parent:
+                return None
+            return self._find(node)
+
+    def _describe(self, root: str, member_limit: int) -> Dict[str, Any]:
+        members = sorted(self._members.get(root, ()), reverse=True)
+        return {
+            "campaign_id": root,
+            "size": len(members),
+            "src_ips": sorted(self._ips.get(root, ())),
+            "hosts": sorted(self._hosts.get(root, ())),
+            "first_seen": self._first.get(root),
+            "last_seen": self._last.get(root),
+            "alert_ids": members[:member_limit],
+        }
+
+    def list_campaigns(self, limit: int = 50, min_size: int = 2) -> List[Dict[str, Any]]:
+        with self._lock:
+            roots = [r for r, m in self._members.items() if len(m) >= min_size and self._parent.get(r) == r]
+            roots.sort(key=lambda r: self._last.get(r, 0), reverse=True)
+            return [self._describe(r, 50) for r in roots[:limit]]
+
+    def get_campaign(self, campaign_id: str, member_limit: int = 500) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if campaign_id not in self._parent:
+                return None
+            return self._describe(self._find(campaign_id), member_limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "nodes": len(self._parent),
+                "campaigns": sum(1 for r in self._members if self._parent.get(r) == r),
+                "pruned_total": self.pruned_total,
+                "ttl_seconds": self.ttl_seconds,
+                "max_nodes": self.max_nodes,
+            }
+
+
+# 整个 add_alert 在一次 EVAL 里完成：多 worker 并发时 find/union 不会交错
+# 固定的 5 个 key 走 KEYS（RedisCorrelationGraph._keys）；corr:nodes:{root} 这类按节点名拼的 key 只能在脚本里拼，
+# 所以前缀带 hash tag（默认 {corr}），Redis Cluster 下所有 key 落在同一个 slot
+_REDIS_ADD_ALERT_LUA = """
+local p = ARGV[1]
+local parent = KEYS[1]
+local size = KEYS[2]
+local first = KEYS[3]
+local last = KEYS[4]
+local camps = KEYS[5]
+
+local function find(x)
+  local root = x
+  local nxt = redis.call('HGET', parent, root)
+  while nxt and nxt ~= root do
+    root = nxt
+    nxt = redis.call('HGET', parent, root)
+  end
+  local cur = x
+  while cur ~= root do
+    local up = redis.call('HGET', parent, cur)
+    redis.call('HSET', parent, cur, root)
+    cur = up
+  end
+  return root
+end
+
+local function make(x)
+  if redis.call('HSETNX', parent, x, x) == 1 then
+    redis.call('HSET', size, x, 1)
+    redis.call('SADD', p .. ':nodes:' .. x, x)
+  end
+end
+
+local function move_set(kind, from, to)
+  local src = p .. ':' .. kind .. ':' .. from
+  if redis.call('EXISTS', src) == 1 then
+    local dst = p .. ':' .. kind .. ':' .. to
+    -- 只搬小集合的元素（SUNIONSTORE 会把大集合也重写一遍）
+    local m = redis.call('SMEMBERS', src)
+    for i = 1, #m, 1000 do
+      redis.call('SADD', dst, unpack(m, i, math.min(i + 999, #m)))
+    end
+    redis.call('DEL', src)
+  end
+end
+
+-- 成员是 ZSET（score = 告警 id），删除过期告警时按 id 区间裁剪
+local function move_zset(kind, from, to)
+  local src = p .. ':' .. kind .. ':' .. from
+  if redis.call('EXISTS', src) == 1 then
+    local dst = p .. ':' .. kind .. ':' .. to
+    local m = redis.call('ZRANGE', src, 0, -1, 'WITHSCORES')
+    local args = {}
+    for i = 1, #m, 2 do
+      args[#args + 1] = m[i + 1]
+      args[#args + 1] = m[i]
+      if #args >= 2000 then
+        redis.call('ZADD', dst, unpack(args))
+        args = {}
+      end
+    end
+    if #args > 0 then redis.call('ZADD', dst, unpack(args)) end
+    redis.call('DEL', src)
+  end
+end
+
+local function union(a, b)
+  local ra = find(a)
+  local rb = find(b)
+  if ra == rb then return ra end
+  local sa = tonumber(redis.call('HGET', size, ra) or '0')
+  local sb = tonumber(redis.call('HGET', size, rb) or '0')
+  if sa < sb then ra, rb = rb, ra; sa, sb = sb, sa end
+  redis.call('HSET', parent, rb, ra)
+  redis.call('HSET', size, ra, sa + sb)
+  redis.call('HDEL', size, rb)
+  move_set('nodes', rb, ra)
+  move_zset('alerts', rb, ra)
+  move_set('ips', rb, ra)
+  move_set('hosts', rb, ra)
+  local fa = redis.call('HGET', first, ra)
+  local fb = redis.call('HGET', first, rb)
+  if fb and ((not fa) or tonumber(fb) < tonumber(fa)) then redis.call('HSET', first, ra, fb) end
+  redis.call('HDEL', first, rb)
+  local la = tonumber(redis.call('HGET', last, ra) or '0')
+  local lb = tonumber(redis.call('HGET', last, rb) or '0')
+  if lb > la then redis.call('HSET', last, ra, lb) end
+  redis.call('HDEL', last, rb)
+  redis.call('ZREM', camps, rb)
+  return ra
+end
+
+local a = ARGV[2]
+local alert_id = ARGV[3]
+local ts = ARGV[4]
+local ip = ARGV[5]
+local host = ARGV[6]
+
+make(a)
+redis.call('ZADD', p .. ':alerts:' .. a, alert_id, alert_id)
+if ip ~= '' then redis.call('SADD', p .. ':ips:' .. a, ip) end
+if host ~= '' then redis.call('SADD', p .. ':hosts:' .. a, host) end
+redis.call('HSET', first, a, ts)
+redis.call('HSET', last, a, ts)
+
+local root = a
+for i = 7, #ARGV do
+  make(ARGV[i])
+  root = union(root, ARGV[i])
+end
+redis.call('ZADD', camps, tonumber(redis.call('HGET', last, root) or ts), root)
+return root
+"""
+
+# 回收整个 campaign：ARGV = prefix, last_before（'' = 不看时间）, require_empty（'1' = 成员为空才删）, root...
+# 条件在脚本里重新判断：挑选和删除之间有新告警并进来的 campaign 不动
+_REDIS_DROP_LUA = """
+local p = ARGV[1]
+local last_before = tonumber(ARGV[2])
+local require_empty = ARGV[3] == '1'
+local parent = KEYS[1]
+local size = KEYS[2]
+local first = KEYS[3]
+local last = KEYS[4]
+local camps = KEYS[5]
+local dropped = 0
+for i = 4, #ARGV do
+  local root = ARGV[i]
+  local ok = redis.call('HGET', parent, root) == root
+  if not ok then
+    redis.call('ZREM', camps, root)
+  end
+  if ok and last_before then
+    ok = tonumber(redis.call('HGET', last, root) or '0') < last_before
+  end
+  if ok and require_empty then
+    ok = redis.call('ZCARD', p .. ':alerts:' .. root) == 0
+  end
+  if ok then
+    local nk = p .. ':nodes:' .. root
+    local nodes = redis.call('SMEMBERS', nk)
+    for j = 1, #nodes, 1000 do
+      local e = math.min(j + 999, #nodes)
+      redis.call('HDEL', parent, unpack(nodes, j, e))
+      redis.call('HDEL', size, unpack(nodes, j, e))
+    end
+    redis.call('HDEL', parent, root)
+    redis.call('HDEL', size, root)
+    redis.call('HDEL', first, root)
+    redis.call('HDEL', last, root)
+    redis.call('DEL', p .. ':alerts:' .. root, p .. ':ips:' .. root, p .. ':hosts:' .. root, nk)
+    redis.call('ZREM', camps, root)
+    dropped = dropped + 1
+  end
+end
+return dropped
+"""
+
+
+class RedisCorrelationGraph(CorrelationGraph):
+    """
+    Redis 结构（prefix 默认 {corr}，下面简写成 corr；hash tag 保证 Cluster 下同一 slot）：
+      - HASH corr:parent / corr:size（子树节点数，按它小并大）/ corr:first / corr:last
+      - SET  corr:nodes:{root}（分量内全部节点，回收用）/ corr:ips:{root} / corr:hosts:{root}
+      - ZSET corr:alerts:{root}  成员告警 id（score = id）
+      - ZSET corr:campaigns  score=last_seen，列表按最近活跃排序，TTL / 上限回收也按它挑最旧的
+    """
+    name = "redis"
+
+    def __init__(self, prefix: str = CORR_PREFIX, ttl_seconds: int = CORR_TTL_SECONDS, max_nodes: int = CORR_MAX_NODES,
+                 prune_interval: float = CORR_PRUNE_INTERVAL):
+        self.prefix = prefix
+        self._keys = [f"{prefix}:{k}" for k in ("parent", "size", "first", "last", "campaigns")]
+        self.ttl_seconds = ttl_seconds
+        self.max_nodes = max_nodes
+        self.prune_interval = prune_interval
+        self.fallback = MemoryCorrelationGraph(ttl_seconds, max_nodes, prune_interval)
+        self.errors = 0
+        self.pruned_total = 0
+        self._last_prune = time.time()
+
+    def _r(self):
+        from app.stream import get_redis
+        return get_redis()
+
+    def add_alert(self, alert_id: int, src_ip: str, host: str, attrs: List[str], ts: Optional[int] = None) -> str:
+        ts = int(ts or time.time())
+        try:
+            root = self._r().eval(
+                _REDIS_ADD_ALERT_LUA, len(self._keys), *self._keys,
+                self.prefix, alert_node(alert_id), str(alert_id), str(ts), src_ip or "", host or "", *attrs,
+            )
+        except Exception:
+            self.errors += 1
+            return self.fallback.add_alert(alert_id, src_ip, host, attrs, ts)
+        if time.time() - self._last_prune >= self.prune_interval:
+            self.prune()
+        return str(root)
+
+    def _drop(self, r, roots: List[str], last_before: Optional[float] = None, require_empty: bool = False) -> int:
+        if not roots:
+            return 0
+        n = int(r.eval(_REDIS_DROP_LUA, len(self._keys), *self._keys,
+                       self.prefix, "" if last_before is None else str(last_before),
+                       "1" if require_empty else "0", *roots) or 0)
+        self.pruned_total += n
+        return n
+
+    def prune(self, now: Optional[float] = None, page: int = 500) -> int:
+        # 多个 worker 同时跑也没关系：脚本里会重新判断条件，删过的 root 不会重复计数
+        self._last_prune = time.time()
+        now = now or self._last_prune
+        camps = f"{self.prefix}:campaigns"
+        dropped = 0
+        try:
+            r = self._r()
+            if self.ttl_seconds > 0:
+                cutoff = now - self.ttl_seconds
+                while True:
+                    roots = r.zrangebyscore(camps, "-inf", f"({cutoff}", start=0, num=page)
+                    if not roots:
+                        break
+                    n = self._drop(r, roots, last_before=cutoff)
+                    dropped += n
+                    if n == 0:
+                        break
+            while self.max_nodes > 0 and int(r.hlen(f"{self.prefix}:parent")) > self.max_nodes:
+                n = self._drop(r, r.zrange(camps, 0, page // 10))
+                dropped += n
+                if n == 0:
+                    break
+        except Exception:
+            self.errors += 1
+        return dropped
+
+    def forget_alerts_below(self, min_alert_id: int, page: int = 500) -> int:
+        p = self.prefix
+        dropped = 0
+        try:
+            r = self._r()
+            roots = [m for m, _ in r.zscan_iter(f"{p}:campaigns", count=page)]
+            for i in range(0, len(roots), page):
+                chunk = roots[i:i + page]
+                pipe = r.pipeline(transaction=False)
+                for root in chunk:
+                    pipe.zremrangebyscore(f"{p}:alerts:{root}", "-inf", f"({int(min_alert_id)}")
+                    pipe.zcard(f"{p}:alerts:{root}")
+                res = pipe.execute()
+                empty = [root for root, n in zip(chunk, res[1::2]) if int(n or 0) == 0]
+                dropped += self._drop(r, empty, require_empty=True)
+        except Exception:
+            self.errors += 1
+        return dropped + self.fallback.forget_alerts_below(min_alert_id)
+
+    def campaign_of(self, node: str) -> Optional[str]:
+        # 只读查找（不做路径压缩，压缩留给写路径）
+        try:
+            r = self._r()
+            cur = r.hget(f"{self.prefix}:parent", node)
+            if cur is None:
+                return None
+            root = node
+            while cur is not None and cur != root:
+                root = cur
+                cur = r.hget(f"{self.prefix}:parent", root)
+            return root
+        except Exception:
+            self.errors += 1
+            return self.fallback.campaign_of(node)
+
+    def _describe(self, root: str, member_limit: int) -> Dict[str, Any]:
+        r = self._r()
+        p = self.prefix
+        pipe = r.pipeline(transaction=False)
+        pipe.zcard(f"{p}:alerts:{root}")
+        pipe.smembers(f"{p}:ips:{root}")
+        pipe.smembers(f"{p}:hosts:{root}")
+        pipe.hget(f"{p}:first", root)
+        pipe.hget(f"{p}:last", root)
+        pipe.zrevrange(f"{p}:alerts:{root}", 0, member_limit - 1)
+        size, ips, hosts, first, last, members = pipe.execute()
+        ids = [int(x) for x in (members or [])]
+        return {
+            "campaign_id": root,
+            "size": int(size or 0),
+            "src_ips": sorted(ips or []),
+            "hosts": sorted(hosts or []),
+            "first_seen": int(first) if first else None,
+            "last_seen": int(last) if last else None,
+            "alert_ids": ids[:member_limit],
+        }
+
+    def list_campaigns(self, limit: int = 50, min_size: int = 2) -> List[Dict[str, Any]]:
+        try:
+            r = self._r()
+            out: List[Dict[str, Any]] = []
+            offset = 0
+            page = max(limit * 2, 50)
+            # 按最近活跃翻 ZSET，跳过 size 不够的（单条告警的孤立 campaign）
+            while len(out) < limit:
+                roots = r.zrevrange(f"{self.prefix}:campaigns", offset, offset + page - 1)
+                if not roots:
+                    break
+                offset += len(roots)
+                pipe = r.pipeline(transaction=False)
+                for root in roots:
+                    pipe.zcard(f"{self.prefix}:alerts:{root}")
+                sizes = pipe.execute()
+                for root, sz in zip(roots, sizes):
+                    if int(sz or 0) >= min_size:
+                        out.append(self._describe(root, 50))
+                        if len(out) >= limit:
+                            break
+            return out
+        except Exception:
+            self.errors += 1
+            return self.fallback.list_campaigns(limit=limit, min_size=min_size)
+
+    def get_campaign(self, campaign_id: str, member_limit: int = 500) -> Optional[Dict[str, Any]]:
+        root = self.campaign_of(campaign_id)
+        if root is None:
+            return None
+        try:
+            return self._describe(root, member_limit)
+        except Exception:
+            self.errors += 1
+            return self.fallback.get_campaign(campaign_id, member_limit)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"backend": self.name, "errors": self.errors, "pruned_total": self.pruned_total,
+                               "ttl_seconds": self.ttl_seconds, "max_nodes": self.max_nodes}
+        try:
+            r = self._r()
+            out["nodes"] = int(r.hlen(f"{self.prefix}:parent"))
+            out["campaigns"] = int(r.zcard(f"{self.prefix}:campaigns"))
+        except Exception as e:
+            out["error"] = repr(e)
+        return out
+
+
+def build_correlation_graph(backend: str = CORR_BACKEND) -> CorrelationGraph:
+    if backend == "memory":
+        return MemoryCorrelationGraph()
+    return RedisCorrelationGraph()
+
+
+corr_graph: CorrelationGraph = build_correlation_graph()
+
+
+def correlate_alert(
+    alert_id: int,
+    src_ip: str,
+    host: str,
+    fp_hash: str = "",
+    fp_kind: str = "",
+    ua: str = "",
+    graph: Optional[CorrelationGraph] = None,
+) -> Optional[str]:
+    if not CORR_ENABLED:
+        return None
+    g = graph or corr_graph
+    attrs = attribute_nodes((src_ip or "").strip(), fp_hash, fp_kind, ua)
+    return g.add_alert(alert_id, (src_ip or "").strip(), (host or "").strip(), attrs)
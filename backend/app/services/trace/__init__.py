@@ -1,3 +1,4 @@
 from .builder import build_attack_case, build_attack_case_by_alert_id
 from .engine import run_trace
 from .linker import link_case
+from .case_cache import case_cache, trace_attack_case
@@ -6,8 +6,10 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
-from sqlalchemy import and_, select
+from sqlalchemy import and_, func, select
 
+from app.archive import archive_enabled, cold_archive
+from app.db import HAS_READ_REPLICA, ReadSessionLocal, read_stats
 from app.models import RawLog, Alert
 from .case import AttackCase
 
@@ -56,23 +58,74 @@ def build_attack_case(db, alert: Alert, window_seconds: Optional[int] = None, li
     t1 = trigger_ts + timedelta(seconds=win)
 
     src_ip = (alert.attack_ip or "").strip()
-    trigger_rule = (alert.alert_type or "UNKNOWN").strip()
 
-    # 查 raw_logs：你的 RawLog 没有 src_ip 字段，只能从 message LIKE 过滤 + 时间过滤
-    stmt = select(RawLog).where(
-        and_(
-            RawLog.created_at >= t0,
-            RawLog.created_at <= t1,
-        )
-    ).order_by(RawLog.created_at.asc()).limit(limit)
+    raw_rows = query_window_rawlogs(db, t0, t1, src_ip, limit=limit)
+    norm_logs: List[Dict[str, Any]] = [normalize_rawlog(r) for r in raw_rows]
+
+    return assemble_case(alert, norm_logs, window_seconds=win)
+
 
-    raw_rows = list(db.execute(stmt).scalars().all())
+def query_window_rawlogs(
+    db,
+    t0: datetime,
+    t1: datetime,
+    src_ip: str,
+    limit: int = 1500,
+    after_id: Optional[int] = None,
+) -> List[RawLog]:
+    """
+    查时间窗口内的 raw_logs：
+    - 你的 RawLog 没有 src_ip 字段，只能从 message LIKE 过滤 + 时间过滤
+    - after_id：增量模式，只取高水位之后的新日志（case_cache 用）
+    """
+    conds = [
+        RawLog.created_at >= t0,
+        RawLog.created_at <= t1,
+    ]
+    if after_id is not None:
+        conds.append(RawLog.id > after_id)
+
+    stmt = select(RawLog).where(and_(*conds)).order_by(RawLog.created_at.asc()).limit(limit)
+
+    raw_rows = _scan_window(db, stmt, t1, incremental=after_id is not None)
+
+    # 窗口落在已归档的时间段：冷数据更早，放在前面，总数仍受 limit 限制
+    if archive_enabled():
+        cold = cold_archive.query(
+            limit, newest_first=False, after_id=after_id, t0=t0, t1=t1, t1_inclusive=True,
+            q=src_ip or None,
+        )
+        if cold:
+            raw_rows = (cold + raw_rows)[:limit]
 
     # 用 src_ip 再做一次 message 层过滤（更准）
     if src_ip:
         raw_rows = [r for r in raw_rows if src_ip in (r.message or "")]
+    return raw_rows
 
-    norm_logs: List[Dict[str, Any]] = [normalize_rawlog(r) for r in raw_rows]
+
+def _scan_window(db, stmt, t1: datetime, incremental: bool) -> List[RawLog]:
+    """
+    窗口扫描放到只读库上执行，前提是只读库已经复制到窗口结束之后（有晚于 t1 的日志）；
+    刚触发的告警窗口、增量模式（高水位之后的新日志）都还没复制到，留在调用方的主库 session 上
+    """
+    if HAS_READ_REPLICA and not incremental:
+        with ReadSessionLocal() as rdb:
+            hwm = rdb.execute(select(func.max(RawLog.created_at))).scalar()
+            if hwm is not None and hwm > t1:
+                read_stats["window_scans_replica"] += 1
+                return list(rdb.execute(stmt).scalars().all())
+    read_stats["window_scans_primary"] += 1
+    return list(db.execute(stmt).scalars().all())
+
+
+def assemble_case(alert: Alert, norm_logs: List[Dict[str, Any]], window_seconds: int) -> AttackCase:
+    """
+    用已 normalize 的日志组装 AttackCase（全量回溯 / 增量缓存共用）。
+    """
+    trigger_ts = alert.created_at or datetime.utcnow()
+    src_ip = (alert.attack_ip or "").strip()
+    trigger_rule = (alert.alert_type or "UNKNOWN").strip()
 
     # AttackCase
     case = AttackCase(
@@ -100,7 +153,7 @@ def build_attack_case(db, alert: Alert, window_seconds: Optional[int] = None, li
         "alert_type": trigger_rule,
         "severity": getattr(alert, "severity", "") or "",
         "count": getattr(alert, "count", 0) or 0,
-        "window_seconds": win,
+        "window_seconds": int(window_seconds),
         "user_agent": _first(case.rawlogs, "ua") or _first(case.rawlogs, "user_agent") or "",
     }
 
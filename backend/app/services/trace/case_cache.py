@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models import Alert
+from .builder import assemble_case, normalize_rawlog, query_window_rawlogs
+from .case import AttackCase, TraceStep
+from .engine import run_trace, run_trace_incremental
+
+
+# 同一攻击者（src_ip + host）反复告警时（爆破每过一次 cooldown 就再触发），
+# 旧做法每次都从头回溯整个时间窗口；这里缓存“打开中的 case”，
+# 新告警只拉高水位（最大 raw id）之后的新日志，时间线/指纹增量更新。
+CASE_CACHE_ENABLED = os.getenv("TRACE_CASE_CACHE", "1") == "1"
+CASE_CACHE_MAX_ENTRIES = int(os.getenv("TRACE_CASE_CACHE_MAX", "512"))
+CASE_CACHE_TTL_SECONDS = int(os.getenv("TRACE_CASE_CACHE_TTL", "900"))
+
+# 估算内存用：每条 normalize 后 dict 的固定开销（字段名/小对象），message 另算
+_ROW_OVERHEAD_BYTES = 600
+
+
+@dataclass
+class OpenCase:
+    key: Tuple[str, str]
+    rawlogs: List[Dict[str, Any]] = field(default_factory=list)
+    hwm_id: int = 0                      # 已回溯到的最大 raw_logs.id
+    cov_start: Optional[datetime] = None  # 缓存覆盖的最早时间（窗口起点）
+    plugin: str = ""
+    timeline: List[TraceStep] = field(default_factory=list)
+    touched_at: float = 0.0
+    approx_bytes: int = 0
+
+
+def _approx_bytes(rows: List[Dict[str, Any]]) -> int:
+    return sum(_ROW_OVERHEAD_BYTES + len(r.get("message") or "") for r in rows)
+
+
+class CaseCache:
+    """
+    有界 LRU + TTL 的 open case 缓存：
+    - key = (src_ip, host)
+    - 超过 max_entries 淘汰最久未用的；超过 ttl 视为 case 已关闭
+    - 线程安全（/ingest 是 sync 接口，跑在线程池里）
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[str, str], OpenCase]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rows_reused = 0
+        self.rows_fetched = 0
+
+    def get(self, key: Tuple[str, str], t0: datetime) -> Optional[OpenCase]:
+        """
+        命中条件：未过期，且缓存覆盖的起点 <= 本次窗口起点（否则会漏掉更早的日志）
+        """
+        now = time.time()
+        with self._lock:
+            oc = self._items.get(key)
+            if oc is None:
+                self.misses += 1
+                return None
+            if now - oc.touched_at > self.ttl_seconds:
+                self._items.pop(key, None)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if oc.cov_start is None or oc.cov_start > t0:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return oc
+
+    def put(self, oc: OpenCase) -> None:
+        oc.touched_at = time.time()
+        oc.approx_bytes = _approx_bytes(oc.rawlogs)
+        with self._lock:
+            self._items[oc.key] = oc
+            self._items.move_to_end(oc.key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._items)
+            rows = sum(len(oc.rawlogs) for oc in self._items.values())
+            mem = sum(oc.approx_bytes for oc in self._items.values())
+        total = self.hits + self.misses
+        return {
+            "enabled": CASE_CACHE_ENABLED,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rows_cached": rows,
+            "rows_reused": self.rows_reused,
+            "rows_fetched": self.rows_fetched,
+            "approx_memory_bytes": mem,
+        }
+
+
+# ✅ 全局单例
+case_cache = CaseCache(
+    max_entries=CASE_CACHE_MAX_ENTRIES,
+    ttl_seconds=CASE_CACHE_TTL_SECONDS,
+)
+
+
+def trace_attack_case(
+    db,
+    alert: Alert,
+    window_seconds: Optional[int] = None,
+    limit: int = 1500,
+    cache: Optional[CaseCache] = None,
+) -> AttackCase:
+    """
+    回溯 + 溯源（带增量缓存）。
+    没有 src_ip 的告警无法按攻击者归并，直接走全量路径。
+    """
+    cache = cache or case_cache
+    trigger_ts = alert.created_at or datetime.utcnow()
+    win = int(window_seconds if window_seconds is not None else (alert.window_seconds or 60))
+    t0 = trigger_ts - timedelta(seconds=win)
+    t1 = trigger_ts + timedelta(seconds=win)
+
+    src_ip = (alert.attack_ip or "").strip()
+    if not CASE_CACHE_ENABLED or not src_ip:
+        norm_logs = [normalize_rawlog(r) for r in query_window_rawlogs(db, t0, t1, src_ip, limit=limit)]
+        return run_trace(assemble_case(alert, norm_logs, window_seconds=win))
+
+    key = (src_ip, (alert.host or "").strip())
+    oc = cache.get(key, t0)
+
+    if oc is None:
+        new_rows = [normalize_rawlog(r) for r in query_window_rawlogs(db, t0, t1, src_ip, limit=limit)]
+        kept: List[Dict[str, Any]] = []
+        prev_plugin, prev_timeline = "", None
+        hwm = 0
+    else:
+        new_rows = [
+            normalize_rawlog(r)
+            for r in query_window_rawlogs(db, t0, t1, src_ip, limit=limit, after_id=oc.hwm_id)
+        ]
+        # 滑出窗口的旧日志剔除
+        kept = [r for r in oc.rawlogs if r.get("created_at") is None or r["created_at"] >= t0]
+        prev_plugin, prev_timeline = oc.plugin, oc.timeline
+        hwm = oc.hwm_id
+        cache.rows_reused += len(kept)
+
+    cache.rows_fetched += len(new_rows)
+
+    # 和 query_window_rawlogs 一样超出 limit 时保留最早的；截掉的新日志不推进 hwm，窗口滑动后还能取到
+    new_rows = new_rows[:max(0, limit - len(kept))]
+    rows = kept + new_rows
+
+    for r in new_rows:
+        rid = r.get("id")
+        if isinstance(rid, int) and rid > hwm:
+            hwm = rid
+
+    case = assemble_case(alert, rows, window_seconds=win)
+    if prev_timeline is None:
+        case = run_trace(case)
+    else:
+        case = run_trace_incremental(case, new_rows, prev_plugin=prev_plugin, prev_timeline=prev_timeline)
+
+    cache.put(
+        OpenCase(
+            key=key,
+            rawlogs=rows,
+            hwm_id=hwm,
+            cov_start=t0,
+            plugin=case.plugin,
+            timeline=list(case.timeline),
+        )
+    )
+    return case
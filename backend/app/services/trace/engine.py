@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Any, List, Optional, Tuple
 
-from .case import AttackCase
-from .plugins.base import TracePlugin
+from .case import AttackCase, TraceStep
+from .plugins.base import MatchResult, TracePlugin
 
 from .plugins.sqli import SQLiTracePlugin
 from .plugins.rce import RCETracePlugin
@@ -27,9 +27,7 @@ DEFAULT_PLUGINS: List[TracePlugin] = [
 ]
 
 
-def run_trace(case: AttackCase, plugins: List[TracePlugin] = None) -> AttackCase:
-    plugins = plugins or DEFAULT_PLUGINS
-
+def _pick_plugin(case: AttackCase, plugins: List[TracePlugin]) -> Tuple[Optional[TracePlugin], Optional[MatchResult]]:
     best_plugin = None
     best_mr = None
 
@@ -40,6 +38,14 @@ def run_trace(case: AttackCase, plugins: List[TracePlugin] = None) -> AttackCase
         if best_mr is None or mr.score > best_mr.score:
             best_plugin, best_mr = p, mr
 
+    return best_plugin, best_mr
+
+
+def run_trace(case: AttackCase, plugins: List[TracePlugin] = None) -> AttackCase:
+    plugins = plugins or DEFAULT_PLUGINS
+
+    best_plugin, best_mr = _pick_plugin(case, plugins)
+
     # 理论上不会空，因为 Generic 永远 ok
     if best_plugin is None:
         case.plugin = "unknown"
@@ -55,3 +61,35 @@ def run_trace(case: AttackCase, plugins: List[TracePlugin] = None) -> AttackCase
     case.fingerprints = best_plugin.extract_fingerprint(case.rawlogs)
 
     return case
+
+
+def run_trace_incremental(
+    case: AttackCase,
+    new_rawlogs: List[Any],
+    prev_plugin: str = "",
+    prev_timeline: Optional[List[TraceStep]] = None,
+    plugins: List[TracePlugin] = None,
+) -> AttackCase:
+    """
+    增量溯源（case_cache 用）：
+    - case.rawlogs 已经是“缓存 + 新日志”的完整窗口
+    - 命中插件没变：沿用旧时间线（剔除已滑出窗口的步骤），只对 new_rawlogs 生成新步骤
+    - 插件变了（比如新日志让 SQLi 分数反超 generic）：退回全量 run_trace
+    """
+    plugins = plugins or DEFAULT_PLUGINS
+
+    best_plugin, best_mr = _pick_plugin(case, plugins)
+    if best_plugin is None or prev_timeline is None or best_plugin.name != prev_plugin:
+        return run_trace(case, plugins)
+
+    case.plugin = best_plugin.name
+    case.plugin_score = best_mr.score
+    case.reasons = best_mr.reasons
+
+    keep_ids = {r.get("id") for r in case.rawlogs if isinstance(r, dict)}
+    kept = [s for s in prev_timeline if s.ref_raw_id is None or s.ref_raw_id in keep_ids]
+    case.timeline = kept + best_plugin.build_timeline(new_rawlogs)
+    case.tactic_chain = best_plugin.infer_tactic_chain(case.rawlogs)
+    case.fingerprints = best_plugin.extract_fingerprint(case.rawlogs)
+
+    return case
@@ -6,22 +6,23 @@ from typing import Any, Dict
 from sqlalchemy.orm import Session
 
 from app.models import Alert
-from app.services.trace.builder import build_attack_case
-from app.services.trace.engine import run_trace
+from app.services.trace.case_cache import trace_attack_case
 from app.services.trace.linker import link_case
+from app.services.trace.store import case_summary, save_case
+from app.services.correlation.graph import correlate_alert
 
 
 def integrate_trace_into_alert(db: Session, alert_row: Alert) -> Dict[str, Any]:
     """
     在 Alert 已经入库后调用：
-    - 回溯 raw_logs 生成 AttackCase
+    - 回溯 raw_logs 生成 AttackCase（同一 src_ip+host 的 open case 走增量缓存）
     - 跑溯源插件得到 timeline / fingerprints / tactic_chain
-    - 把结果写回 alert_row.evidence（JSON字符串）
-    返回写入的 trace dict，方便你日志打印/调试。
+    - 完整 case 落 trace_cases / trace_case_steps / trace_case_rawlogs
+    - alert_row 只记 case_id，evidence.trace 只写精简摘要（列表/WS 不再背整条时间线）
+    返回写入的 trace 摘要 + link，方便你日志打印/调试。
     """
-    case = build_attack_case(db, alert_row, window_seconds=alert_row.window_seconds or 60)
-    case = run_trace(case)
-    link = link_case(case)
+    case = trace_attack_case(db, alert_row, window_seconds=alert_row.window_seconds or 60)
+    link = link_case(case, db=db)
 
     # 原 evidence 可能已经是 JSON（你目前 evidence 字段存的是 JSON 字符串）
     old_obj: Dict[str, Any] = {}
@@ -33,15 +34,27 @@ def integrate_trace_into_alert(db: Session, alert_row: Alert) -> Dict[str, Any]:
         except Exception:
             old_obj = {"evidence_text": alert_row.evidence}
 
-    trace_obj = {
-        "case": case.to_dict(),
-        "link": link,
-    }
+    save_case(db, case, link, alert_id=alert_row.id)
 
     # 合并：保留你原来的 evidence/events/assessment/human_summary_cn 等
     merged = dict(old_obj)
-    merged["trace"] = trace_obj
+    summary = case_summary(case, link)
 
+    # 增量关联：同 IP 跨主机 / 不同 IP 同指纹或同工具 UA -> 同一 campaign
+    try:
+        summary["campaign_id"] = correlate_alert(
+            alert_row.id,
+            alert_row.attack_ip or "",
+            alert_row.host or "",
+            fp_hash=str(link.get("fingerprint_hash") or ""),
+            fp_kind=str((case.fingerprints or {}).get("kind") or ""),
+            ua=str((case.infrastructure or {}).get("user_agent") or ""),
+        )
+    except Exception:
+        summary["campaign_id"] = None
+    merged["trace"] = summary
+
+    alert_row.case_id = case.case_id
     alert_row.evidence = json.dumps(merged, ensure_ascii=False)
 
     # ✅ 关键：让更新立刻写进当前事务，后续 publish/query 能读到新 evidence
@@ -49,4 +62,4 @@ def integrate_trace_into_alert(db: Session, alert_row: Alert) -> Dict[str, Any]:
     db.flush()
 
     # 注意：不 commit，让调用方决定事务
-    return trace_obj
+    return {"summary": summary, "link": link}
@@ -2,9 +2,15 @@ from __future__ import annotations
 
 import hashlib
 import json
-from typing import Any, Dict, List, Optional
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 
 from .case import AttackCase
+from .similarity import similar_cases
 
 
 def fingerprint_hash(fp: Dict[str, Any]) -> str:
@@ -12,13 +18,206 @@ def fingerprint_hash(fp: Dict[str, Any]) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()[:16]
 
 
-# 先做一个内存级关联（你后续要落库再改）
-_HISTORY: Dict[str, List[str]] = {}  # fp_hash -> [case_id, ...]
+# -----------------------------
+# 指纹索引：fp_hash -> 最近 N 个 case_id
+# 之前是进程内 dict：重启丢失、多 worker 各存一份、hash 个数无上限。
+# 现在可插拔：redis（默认，多 worker 共享）/ db（trace_cases 表）/ memory（单机兜底）
+# -----------------------------
+FP_INDEX_BACKEND = os.getenv("TRACE_FP_INDEX", "redis").strip().lower()
+FP_KEEP_PER_HASH = int(os.getenv("TRACE_FP_KEEP", "50"))
+FP_TTL_SECONDS = int(os.getenv("TRACE_FP_TTL", str(7 * 86400)))
+FP_MAX_HASHES = int(os.getenv("TRACE_FP_MAX_HASHES", "100000"))
 
 
-def link_case(case: AttackCase) -> Dict[str, Any]:
+class FingerprintIndex:
+    name = "base"
+
+    def append(self, h: str, case_id: str, db=None) -> List[str]:
+        """原子追加 case_id，返回追加后该指纹下的 case_id 列表（旧 -> 新）"""
+        raise NotImplementedError
+
+    def get(self, h: str, db=None) -> List[str]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryFingerprintIndex(FingerprintIndex):
+    """进程内 LRU + TTL，有界（单 worker / Redis 不可用时兜底）"""
+    name = "memory"
+
+    def __init__(self, keep: int = 50, ttl_seconds: int = 7 * 86400, max_hashes: int = 100000):
+        self.keep = keep
+        self.ttl_seconds = ttl_seconds
+        self.max_hashes = max_hashes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+
+    def append(self, h: str, case_id: str, db=None) -> List[str]:
+        now = time.time()
+        with self._lock:
+            ts, chain = self._items.get(h, (now, []))
+            if now - ts > self.ttl_seconds:
+                chain = []
+            chain = (chain + [case_id])[-self.keep:]
+            self._items[h] = (now, chain)
+            self._items.move_to_end(h)
+            while len(self._items) > self.max_hashes:
+                self._items.popitem(last=False)
+            return list(chain)
+
+    def get(self, h: str, db=None) -> List[str]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(h)
+            if item is None or now - item[0] > self.ttl_seconds:
+                return []
+            return list(item[1])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self._items)
+        return {"backend": self.name, "hashes": n, "max_hashes": self.max_hashes}
+
+
+# RPUSH + LTRIM + EXPIRE + LRU ZSET 淘汰，一次 EVAL 完成（多 worker 并发下也是原子的）
+_REDIS_APPEND_LUA = """
+local keep = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local max_hashes = tonumber(ARGV[5])
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], -keep, -1)
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('ZADD', KEYS[2], now, ARGV[7])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - ttl)
+local n = redis.call('ZCARD', KEYS[2])
+if n > max_hashes then
+  local old = redis.call('ZPOPMIN', KEYS[2], n - max_hashes)
+  for i = 1, #old, 2 do
+    redis.call('DEL', ARGV[6] .. old[i])
+  end
+end
+return redis.call('LRANGE', KEYS[1], 0, -1)
+"""
+
+
+class RedisFingerprintIndex(FingerprintIndex):
+    """
+    Redis 结构：
+      - LIST: trace:fp:{hash}   最近 keep 个 case_id，带 TTL
+      - ZSET: trace:fp:lru      score=最近写入时间，超过 max_hashes 淘汰最旧的 hash
+    """
+    name = "redis"
+
+    def __init__(self, prefix: str = "trace:fp", keep: int = 50, ttl_seconds: int = 7 * 86400,
+                 max_hashes: int = 100000):
+        self.prefix = prefix
+        self.keep = keep
+        self.ttl_seconds = ttl_seconds
+        self.max_hashes = max_hashes
+        self.fallback = MemoryFingerprintIndex(keep=keep, ttl_seconds=ttl_seconds, max_hashes=max_hashes)
+        self.errors = 0
+
+    def _r(self):
+        from app.stream import get_redis  # 延迟导入，避免 trace 包依赖启动顺序
+        return get_redis()
+
+    def _key(self, h: str) -> str:
+        return f"{self.prefix}:{h}"
+
+    def append(self, h: str, case_id: str, db=None) -> List[str]:
+        try:
+            res = self._r().eval(
+                _REDIS_APPEND_LUA,
+                2,
+                self._key(h),
+                f"{self.prefix}:lru",
+                case_id,
+                self.keep,
+                self.ttl_seconds,
+                int(time.time()),
+                self.max_hashes,
+                f"{self.prefix}:",
+                h,
+            )
+            return [str(x) for x in (res or [])]
+        except Exception:
+            self.errors += 1
+            return self.fallback.append(h, case_id)
+
+    def get(self, h: str, db=None) -> List[str]:
+        try:
+            return [str(x) for x in (self._r().lrange(self._key(h), 0, -1) or [])]
+        except Exception:
+            self.errors += 1
+            return self.fallback.get(h)
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"backend": self.name, "max_hashes": self.max_hashes, "errors": self.errors}
+        try:
+            out["hashes"] = int(self._r().zcard(f"{self.prefix}:lru"))
+        except Exception as e:
+            out["error"] = repr(e)
+        return out
+
+
+class DbFingerprintIndex(FingerprintIndex):
+    """
+    直接复用 trace_cases.fingerprint_hash（有索引）：
+    - case 行由 save_case 写入，这里 append 只负责把“当前 case”拼在结果末尾
+    - TTL 用 created_at 过滤；容量靠表的保留策略
+    """
+    name = "db"
+
+    def __init__(self, keep: int = 50, ttl_seconds: int = 7 * 86400):
+        self.keep = keep
+        self.ttl_seconds = ttl_seconds
+        self.fallback = MemoryFingerprintIndex(keep=keep, ttl_seconds=ttl_seconds)
+
+    def append(self, h: str, case_id: str, db=None) -> List[str]:
+        if db is None:
+            return self.fallback.append(h, case_id)
+        prev = [x for x in self.get(h, db=db) if x != case_id]
+        return (prev + [case_id])[-self.keep:]
+
+    def get(self, h: str, db=None) -> List[str]:
+        if db is None:
+            return self.fallback.get(h)
+        from sqlalchemy import select
+        from app.models import TraceCase
+
+        since = datetime.now() - timedelta(seconds=self.ttl_seconds)
+        stmt = (
+            select(TraceCase.case_id)
+            .where(TraceCase.fingerprint_hash == h, TraceCase.created_at >= since)
+            .order_by(TraceCase.id.desc())
+            .limit(self.keep)
+        )
+        ids = list(db.execute(stmt).scalars().all())
+        ids.reverse()
+        return ids
+
+
+def build_fingerprint_index(backend: str = FP_INDEX_BACKEND) -> FingerprintIndex:
+    if backend == "memory":
+        return MemoryFingerprintIndex(keep=FP_KEEP_PER_HASH, ttl_seconds=FP_TTL_SECONDS, max_hashes=FP_MAX_HASHES)
+    if backend == "db":
+        return DbFingerprintIndex(keep=FP_KEEP_PER_HASH, ttl_seconds=FP_TTL_SECONDS)
+    return RedisFingerprintIndex(keep=FP_KEEP_PER_HASH, ttl_seconds=FP_TTL_SECONDS, max_hashes=FP_MAX_HASHES)
+
+
+fp_index: FingerprintIndex = build_fingerprint_index()
+
+
+def link_case(case: AttackCase, db=None, index: Optional[FingerprintIndex] = None) -> Dict[str, Any]:
+    idx = index or fp_index
     h = fingerprint_hash(case.fingerprints)
-    chain = _HISTORY.get(h, [])
-    chain.append(case.case_id)
-    _HISTORY[h] = chain[-50:]  # 只保留最近 50 个
-    return {"fingerprint_hash": h, "linked_case_ids": list(_HISTORY[h])}
+    chain = idx.append(h, case.case_id, db=db)
+    # 精确同指纹之外，再给出近似重复（MinHash/LSH）的历史 case 及相似度
+    try:
+        similar = similar_cases(case)
+    except Exception:
+        similar = []
+    return {"fingerprint_hash": h, "linked_case_ids": chain, "similar_cases": similar}
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .case import AttackCase
+
+
+# -----------------------------
+# 近似重复关联：MinHash 签名 + LSH 分桶
+# fingerprint_hash 只能关联“指纹 JSON 完全一致”的 case；
+# 扫描器轮换几个路径/参数就断链。这里对指纹特征集合做 MinHash，
+# 相似度 = 估计的 Jaccard；LSH 分桶保证查找只看少量候选（与历史总量无关）。
+# -----------------------------
+LSH_BACKEND = os.getenv("TRACE_LSH_INDEX", "redis").strip().lower()
+LSH_NUM_PERM = int(os.getenv("TRACE_LSH_NUM_PERM", "64"))
+LSH_BANDS = int(os.getenv("TRACE_LSH_BANDS", "16"))          # rows = num_perm / bands
+LSH_BUCKET_CAP = int(os.getenv("TRACE_LSH_BUCKET_CAP", "20"))  # 每个桶只保留最近 N 个 case
+LSH_THRESHOLD = float(os.getenv("TRACE_LSH_THRESHOLD", "0.5"))
+LSH_TOP_K = int(os.getenv("TRACE_LSH_TOP_K", "10"))
+LSH_TTL_SECONDS = int(os.getenv("TRACE_LSH_TTL", str(7 * 86400)))
+LSH_MAX_CASES = int(os.getenv("TRACE_LSH_MAX_CASES", "200000"))  # 仅 memory 后端
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子：不同 worker / 重启后签名一致，才能共用 Redis 里的桶
+_rng = random.Random(20240601)
+_PERMS: List[Tuple[int, int]] = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(LSH_NUM_PERM)
+]
+
+
+# 只有这些特征的 case 信息量不够，不做近似关联（同 correlation 的 _GENERIC_FP_KINDS）
+_GENERIC_FEATURE_PREFIXES = ("kind:", "proto:")
+
+
+def _norm_ua(ua: str) -> str:
+    # 版本号去掉：同一扫描器小版本升级仍算同一家族
+    return re.sub(r"[\d.]+", "", (ua or "").strip().lower())[:80]
+
+
+def case_features(case: AttackCase) -> Set[str]:
+    """
+    特征集合：指纹里的 endpoints_top / param_names / top_path / kind + 路径分段 + UA 家族
+    只有 kind / proto 这种泛特征时返回空集（不进索引）：否则同协议的无关 case 签名完全相同，互相判成近似重复
+    """
+    fp = case.fingerprints or {}
+    feats: Set[str] = set()
+
+    kind = str(fp.get("kind") or "")
+    if kind:
+        feats.add(f"kind:{kind}")
+    if case.protocol:
+        feats.add(f"proto:{case.protocol}")
+
+    endpoints: List[str] = []
+    for k in ("endpoints_top", "top_path"):
+        v = fp.get(k)
+        if isinstance(v, list):
+            endpoints.extend(str(x) for x in v if x)
+        elif v:
+            endpoints.append(str(v))
+    if case.dst_path:
+        endpoints.append(case.dst_path)
+
+    for ep in endpoints:
+        feats.add(f"ep:{ep}")
+        for seg in ep.strip("/").split("/"):
+            if seg:
+                feats.add(f"seg:{seg.lower()}")
+
+    for k in ("param_names", "resource_id_keys", "content_types"):
+        v = fp.get(k)
+        if isinstance(v, list):
+            for x in v:
+                if x:
+                    feats.add(f"{k}:{x}")
+
+    ua = _norm_ua(str((case.infrastructure or {}).get("user_agent") or ""))
+    if ua:
+        feats.add(f"ua:{ua}")
+
+    if all(f.startswith(_GENERIC_FEATURE_PREFIXES) for f in feats):
+        return set()
+    return feats
+
+
+def minhash(features: Set[str]) -> List[int]:
+    if not features:
+        return []
+    base = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=4).digest(), "big") for f in features]
+    sig = []
+    for a, b in _PERMS:
+        sig.append(min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in base))
+    return sig
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / len(sig_a)
+
+
+def band_keys(sig: List[int], bands: int = LSH_BANDS) -> List[str]:
+    if not sig:
+        return []
+    rows = max(1, len(sig) // bands)
+    out = []
+    for i in range(bands):
+        chunk = sig[i * rows:(i + 1) * rows]
+        if not chunk:
+            break
+        h = hashlib.blake2b(",".join(map(str, chunk)).encode("ascii"), digest_size=8).hexdigest()
+        out.append(f"{i}:{h}")
+    return out
+
+
+def _pack(sig: List[int]) -> str:
+    return ",".join(format(x, "x") for x in sig)
+
+
+def _unpack(s: Optional[str]) -> List[int]:
+    if not s:
+        return []
+    try:
+        return [int(x, 16) for x in s.split(",")]
+    except Exception:
+        return []
+
+
+def _rank(sig: List[int], cands: Dict[str, List[int]], threshold: float, top_k: int) -> List[Dict[str, Any]]:
+    scored = []
+    for cid, other in cands.items():
+        sim = similarity(sig, other)
+        if sim >= threshold:
+            scored.append({"case_id": cid, "similarity": round(sim, 3)})
+    scored.sort(key=lambda x: x["similarity"], reverse=True)
+    return scored[:top_k]
+
+
+class SimilarityIndex:
+    name = "base"
+
+    def query_and_add(self, case_id: str, sig: List[int]) -> List[Dict[str, Any]]:
+        """先查近似 case（不含自己），再把当前 case 写入索引"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryLshIndex(SimilarityIndex):
+    name = "memory"
+
+    def __init__(self, bucket_cap: int = 20, max_cases: int = 200000, ttl_seconds: int = 7 * 86400,
+                 threshold: float = 0.5, top_k: int = 10):
+        self.bucket_cap = bucket_cap
+        self.max_cases = max_cases
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._sigs: "OrderedDict[str, Tuple[float, List[int]]]" = OrderedDict()
+        self._buckets: Dict[str, List[str]] = {}
+
+    def query_and_add(self, case_id: str, sig: List[int]) -> List[Dict[str, Any]]:
+        if not sig:
+            return []
+        now = time.time()
+        keys = band_keys(sig)
+        with self._lock:
+            cands: Dict[str, List[int]] = {}
+            for k in keys:
+                for cid in self._buckets.get(k, ()):
+                    item = self._sigs.get(cid)
+                    if cid == case_id or item is None or now - item[0] > self.ttl_seconds:
+                        continue
+                    cands[cid] = item[1]
+
+            for k in keys:
+                b = self._buckets.setdefault(k, [])
+                b.append(case_id)
+                if len(b) > self.bucket_cap:
+                    del b[: len(b) - self.bucket_cap]
+            self._sigs[case_id] = (now, sig)
+            self._sigs.move_to_end(case_id)
+            while len(self._sigs) > self.max_cases:
+                old_id, (_, old_sig) = self._sigs.popitem(last=False)
+                for k in band_keys(old_sig):
+                    b = self._buckets.get(k)
+                    if b is None:
+                        continue
+                    try:
+                        b.remove(old_id)
+                    except ValueError:
+                        pass
+                    if not b:
+                        self._buckets.pop(k, None)
+
+        return _rank(sig, cands, self.threshold, self.top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, "cases": len(self._sigs), "buckets": len(self._buckets)}
+
+
+class RedisLshIndex(SimilarityIndex):
+    """
+    Redis 结构：
+      - LIST: trace:lsh:b:{band}:{hash}   桶内最近 bucket_cap 个 case_id（TTL）
+      - STRING: trace:lsh:sig:{case_id}   签名（TTL）
+    查找成本上限 = bands * bucket_cap 个候选，两次 pipeline 往返。
+    """
+    name = "redis"
+
+    def __init__(self, prefix: str = "trace:lsh", bucket_cap: int = 20, ttl_seconds: int = 7 * 86400,
+                 threshold: float = 0.5, top_k: int = 10):
+        self.prefix = prefix
+        self.bucket_cap = bucket_cap
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.top_k = top_k
+        self.fallback = MemoryLshIndex(bucket_cap=bucket_cap, ttl_seconds=ttl_seconds,
+                                       threshold=threshold, top_k=top_k)
+        self.errors = 0
+
+    def _r(self):
+        from app.stream import get_redis
+        return get_redis()
+
+    def query_and_add(self, case_id: str, sig: List[int]) -> List[Dict[str, Any]]:
+        if not sig:
+            return []
+        keys = [f"{self.prefix}:b:{k}" for k in band_keys(sig)]
+        try:
+            r = self._r()
+            pipe = r.pipeline(transaction=False)
+            for k in keys:
+                pipe.lrange(k, 0, -1)
+            buckets = pipe.execute()
+
+            cand_ids = sorted({str(c) for b in buckets for c in (b or []) if str(c) != case_id})
+            cands: Dict[str, List[int]] = {}
+            if cand_ids:
+                packed = r.mget([f"{self.prefix}:sig:{c}" for c in cand_ids])
+                for cid, p in zip(cand_ids, packed):
+                    s = _unpack(p)
+                    if s:
+                        cands[cid] = s
+
+            pipe = r.pipeline(transaction=False)
+            pipe.set(f"{self.prefix}:sig:{case_id}", _pack(sig), ex=self.ttl_seconds)
+            for k in keys:
+                pipe.rpush(k, case_id)
+                pipe.ltrim(k, -self.bucket_cap, -1)
+                pipe.expire(k, self.ttl_seconds)
+            pipe.execute()
+        except Exception:
+            self.errors += 1
+            return self.fallback.query_and_add(case_id, sig)
+
+        return _rank(sig, cands, self.threshold, self.top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "errors": self.errors, "fallback": self.fallback.stats()}
+
+
+def build_similarity_index(backend: str = LSH_BACKEND) -> SimilarityIndex:
+    if backend == "memory":
+        return MemoryLshIndex(bucket_cap=LSH_BUCKET_CAP, max_cases=LSH_MAX_CASES, ttl_seconds=LSH_TTL_SECONDS,
+                              threshold=LSH_THRESHOLD, top_k=LSH_TOP_K)
+    return RedisLshIndex(bucket_cap=LSH_BUCKET_CAP, ttl_seconds=LSH_TTL_SECONDS,
+                         threshold=LSH_THRESHOLD, top_k=LSH_TOP_K)
+
+
+lsh_index: SimilarityIndex = build_similarity_index()
+
+
+def similar_cases(case: AttackCase, index: Optional[SimilarityIndex] = None) -> List[Dict[str, Any]]:
+    idx = index or lsh_index
+    return idx.query_and_add(case.case_id, minhash(case_features(case)))
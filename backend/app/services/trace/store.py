@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.models import Alert, TraceCase, TraceCaseRawLog, TraceCaseStep
+from .case import AttackCase, _safe_get
+
+
+# -----------------------------
+# 落库：case 主表 + 时间线 + raw_log 关联（批量 insert，不走 ORM 单条对象）
+# -----------------------------
+def save_case(db: Session, case: AttackCase, link: Dict[str, Any], alert_id: Optional[int] = None) -> TraceCase:
+    detail = {
+        "reasons": case.reasons,
+        "tactic_chain": case.tactic_chain,
+        "fingerprints": case.fingerprints,
+        "infrastructure": case.infrastructure,
+        "link": link,
+    }
+
+    row = TraceCase(
+        case_id=case.case_id,
+        alert_id=alert_id,
+        trigger_rule=(case.trigger_rule or "")[:64],
+        trigger_ts=case.trigger_ts,
+        src_ip=case.src_ip or "",
+        protocol=(case.protocol or "")[:16],
+        dst_host=(case.dst_host or "")[:128],
+        dst_port=case.dst_port,
+        dst_path=(case.dst_path or "")[:512],
+        plugin=case.plugin or "",
+        plugin_score=float(case.plugin_score or 0.0),
+        fingerprint_hash=str((link or {}).get("fingerprint_hash") or ""),
+        step_count=len(case.timeline),
+        rawlog_count=len(case.rawlogs),
+        detail=json.dumps(detail, ensure_ascii=False, default=str),
+    )
+    db.add(row)
+
+    steps = [
+        {
+            "case_id": case.case_id,
+            "seq": i,
+            "ts": s.ts,
+            "action": (s.action or "")[:128],
+            "detail": json.dumps(s.detail or {}, ensure_ascii=False, default=str),
+            "ref_raw_id": s.ref_raw_id,
+        }
+        for i, s in enumerate(case.timeline)
+    ]
+    if steps:
+        db.execute(insert(TraceCaseStep), steps)
+
+    raw_ids = []
+    seen = set()
+    for r in case.rawlogs:
+        rid = _safe_get(r, "id")
+        if isinstance(rid, int) and rid not in seen:
+            seen.add(rid)
+            raw_ids.append({"case_id": case.case_id, "raw_id": rid})
+    if raw_ids:
+        db.execute(insert(TraceCaseRawLog), raw_ids)
+
+    db.flush()
+    return row
+
+
+def case_summary(case: AttackCase, link: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    写进 alert.evidence.trace 的精简摘要：列表/WS 只需要这些，
+    完整时间线走 /trace/cases/{case_id} 按需加载。
+    """
+    return {
+        "case_id": case.case_id,
+        "plugin": case.plugin,
+        "plugin_score": case.plugin_score,
+        "protocol": case.protocol,
+        "dst_path": case.dst_path,
+        "fingerprint_hash": (link or {}).get("fingerprint_hash"),
+        "linked_count": len((link or {}).get("linked_case_ids") or []),
+        "similar_count": len((link or {}).get("similar_cases") or []),
+        "step_count": len(case.timeline),
+        "rawlog_count": len(case.rawlogs),
+    }
+
+
+# -----------------------------
+# 读取：还原成和 AttackCase.to_dict() 一致的结构（前端无感）
+# -----------------------------
+def load_case(db: Session, case_id: str) -> Optional[Dict[str, Any]]:
+    row = db.execute(select(TraceCase).where(TraceCase.case_id == case_id)).scalar_one_or_none()
+    if row is None:
+        return None
+
+    try:
+        detail = json.loads(row.detail or "{}")
+    except Exception:
+        detail = {}
+
+    step_rows = db.execute(
+        select(TraceCaseStep).where(TraceCaseStep.case_id == case_id).order_by(TraceCaseStep.seq.asc())
+    ).scalars().all()
+
+    timeline: List[Dict[str, Any]] = []
+    for s in step_rows:
+        try:
+            d = json.loads(s.detail or "{}")
+        except Exception:
+            d = {}
+        timeline.append({
+            "ts": s.ts.isoformat() if s.ts else None,
+            "action": s.action,
+            "detail": d,
+            "ref_raw_id": s.ref_raw_id,
+        })
+
+    raw_ids = db.execute(
+        select(TraceCaseRawLog.raw_id).where(TraceCaseRawLog.case_id == case_id).order_by(TraceCaseRawLog.raw_id.asc())
+    ).scalars().all()
+
+    case = {
+        "case_id": row.case_id,
+        "trigger_rule": row.trigger_rule,
+        "trigger_ts": row.trigger_ts.isoformat() if row.trigger_ts else None,
+        "src_ip": row.src_ip,
+        "protocol": row.protocol,
+        "dst_host": row.dst_host,
+        "dst_port": row.dst_port,
+        "dst_path": row.dst_path,
+        "plugin": row.plugin,
+        "plugin_score": row.plugin_score,
+        "reasons": detail.get("reasons") or [],
+        "tactic_chain": detail.get("tactic_chain") or [],
+        "fingerprints": detail.get("fingerprints") or {},
+        "infrastructure": detail.get("infrastructure") or {},
+        "timeline": timeline,
+        "evidence_rawlog_ids": list(raw_ids),
+    }
+    return {"alert_id": row.alert_id, "case": case, "link": detail.get("link") or {}}
+
+
+def load_case_by_alert(db: Session, alert_id: int) -> Optional[Dict[str, Any]]:
+    case_id = db.execute(select(Alert.case_id).where(Alert.id == alert_id)).scalar_one_or_none()
+    if not case_id:
+        return None
+    return load_case(db, case_id)
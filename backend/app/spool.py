@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# -----------------------------
+# 本地磁盘缓冲：Redis 不可用时 publish 先落盘，恢复后由后台线程按顺序补发。
+# 目录下是按序号滚动的段文件 seg-0000000001.log，每条记录：
+#   [4 字节 length][4 字节 crc32(payload)][payload = JSON {"k": stream key, "f": fields, "ts": 秒}]
+# 读位置 (seq, offset) 写在 spool.pos（tmp + replace 原子替换），补发成功才推进；
+# 进程崩溃后从 pos 继续，最多重复补发最后一批（至少一次）。
+# -----------------------------
+_HEADER = struct.Struct(">II")
+_POS_FILE = "spool.pos"
+
+
+def claim_dir(base: str, max_slots: int = 64) -> Tuple[str, Any]:
+    """
+    多 worker（uvicorn --workers N）各用一个子目录 slot-K：按序号抢 flock，拿到第一个空闲的。
+    进程退出锁自动释放，重启后的 worker 会重新认领同一批 slot，把上一轮留下的积压补发掉。
+    返回 (目录, 锁文件句柄)；句柄要一直持有。没有 fcntl（Windows）时按 pid 分目录。
+    """
+    os.makedirs(base, exist_ok=True)
+    if fcntl is None:
+        return os.path.join(base, f"pid-{os.getpid()}"), None
+    for k in range(max_slots):
+        d = os.path.join(base, f"slot-{k}")
+        os.makedirs(d, exist_ok=True)
+        f = open(os.path.join(d, ".lock"), "a+b")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        return d, f
+    raise RuntimeError(f"no free spool slot under {base}")
+
+
+def _seg_name(seq: int) -> str:
+    return f"seg-{seq:010d}.log"
+
+
+class Spool:
+    def __init__(self, directory: str, segment_bytes: int = 8 * 1024 * 1024,
+                 max_bytes: int = 512 * 1024 * 1024, fsync: bool = False, dir_lock: Any = None):
+        self.directory = directory
+        self._dir_lock = dir_lock  # claim_dir() 拿到的 flock 句柄，随对象存活
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._read_pos: Tuple[int, int] = (0, 0)
+        self._writer = None
+        self._writer_seq = 0
+        self._writer_seq_hint = 0  # 本进程写过的段；只有它没写满时才续写
+        self._last_seq = 0
+        self._pending = 0
+
+        self.spooled_total = 0
+        self.drained_total = 0
+        self.dropped_total = 0
+        self.corrupt_total = 0
+        self.last_error: Optional[str] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ---------- 启动恢复 ----------
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, _seg_name(seq))
+
+    def _load(self) -> None:
+        segs = []
+        for name in os.listdir(self.directory):
+            if name.startswith("seg-") and name.endswith(".log"):
+                try:
+                    segs.append(int(name[4:-4]))
+                except ValueError:
+                    continue
+        self._segments = sorted(segs)
+        # 崩溃时写了一半的尾部记录：截掉，否则重启后追加的记录全部错位、永远读不出来
+        for seq in self._segments:
+            self._truncate_torn_tail(seq)
+
+        saved: Optional[Tuple[int, int]] = None
+        try:
+            with open(os.path.join(self.directory, _POS_FILE), "r", encoding="ascii") as f:
+                seq, off = f.read().split()
+                saved = (int(seq), int(off))
+        except Exception:
+            pass
+        self._last_seq = max(self._segments + [saved[0] if saved else 0])
+
+        if saved and saved[0] in self._segments:
+            pos = saved
+        elif self._segments:
+            pos = (self._segments[0], 0)
+        else:
+            pos = (self._last_seq + 1, 0)
+        # pos 之前的段已经补发完
+        for seq in [s for s in self._segments if s < pos[0]]:
+            self._remove_segment(seq)
+        self._read_pos = pos
+
+        self._pending = self._count_readable()
+
+    def _count_readable(self) -> int:
+        """pending 以实际能读回来的记录为准（不是 append 次数）"""
+        pos = self._read_pos
+        n = 0
+        for seq in self._segments:
+            if seq < pos[0]:
+                continue
+            n += sum(1 for _ in self._iter_segment(seq, pos[1] if seq == pos[0] else 0))
+        return n
+
+    def _truncate_torn_tail(self, seq: int) -> None:
+        path = self._path(seq)
+        end = 0
+        with open(path, "rb") as f:
+            while True:
+                head = f.read(_HEADER.size)
+                if len(head) < _HEADER.size:
+                    break
+                length, _ = _HEADER.unpack(head)
+                if len(f.read(length)) < length:
+                    break
+                end += _HEADER.size + length
+        if os.path.getsize(path) > end:
+            with open(path, "r+b") as f:
+                f.truncate(end)
+            self.corrupt_total += 1
+
+    def _iter_segment(self, seq: int, offset: int, count_corrupt: bool = False):
+        """逐条读记录：yield (record, next_offset)；CRC 不对的跳过，尾部半条（崩溃时写了一半）停止"""
+        try:
+            f = open(self._path(seq), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            while True:
+                head = f.read(_HEADER.size)
+                if len(head) < _HEADER.size:
+                    return
+                length, crc = _HEADER.unpack(head)
+                body = f.read(length)
+                if len(body) < length:
+                    return
+                offset += _HEADER.size + length
+                if zlib.crc32(body) & 0xFFFFFFFF != crc:
+                    self.corrupt_total += int(count_corrupt)
+                    continue
+                try:
+                    rec = json.loads(body.decode("utf-8"))
+                except Exception:
+                    self.corrupt_total += int(count_corrupt)
+                    continue
+                yield rec, offset
+
+    def _remove_segment(self, seq: int) -> None:
+        if seq == self._writer_seq and self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._writer_seq = 0
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+        if seq in self._segments:
+            self._segments.remove(seq)
+
+    def _save_pos(self) -> None:
+        tmp = os.path.join(self.directory, _POS_FILE + ".tmp")
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(f"{self._read_pos[0]} {self._read_pos[1]}")
+        os.replace(tmp, os.path.join(self.directory, _POS_FILE))
+
+    # ---------- 写 ----------
+    def _open_writer(self) -> None:
+        if (self._writer is not None and self._writer_seq in self._segments
+                and self._writer.tell() < self.segment_bytes):
+            return
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+        # 启动后第一次写总是开新段：不往上一个进程留下的段后面接
+        last = self._segments[-1] if self._segments else 0
+        if last and last == self._writer_seq_hint and os.path.getsize(self._path(last)) < self.segment_bytes:
+            seq = last
+        else:
+            # 段号单调递增，删掉的段号不复用（spool.pos 里可能还指着它）
+            self._last_seq += 1
+            seq = self._last_seq
+            self._segments.append(seq)
+        self._writer = open(self._path(seq), "ab")
+        self._writer_seq = seq
+        self._writer_seq_hint = seq
+
+    def _total_bytes(self) -> int:
+        total = 0
+        for seq in self._segments:
+            try:
+                total += os.path.getsize(self._path(seq))
+            except OSError:
+                pass
+        return total
+
+    def _enforce_cap(self) -> None:
+        # 超过总上限：丢最旧的段（不丢正在写的段）
+        while len(self._segments) > 1 and self._total_bytes() > self.max_bytes:
+            seq = self._segments[0]
+            start = self._read_pos[1] if seq == self._read_pos[0] else 0
+            n = sum(1 for _ in self._iter_segment(seq, start))
+            self._remove_segment(seq)
+            self._pending -= n
+            self.dropped_total += n
+            if self._read_pos[0] <= seq:
+                self._read_pos = (self._segments[0], 0)
+                self._save_pos()
+
+    def append(self, key: str, fields: Dict[str, str]) -> bool:
+        body = json.dumps({"k": key, "f": fields, "ts": time.time()}, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+        rec = _HEADER.pack(len(body), zlib.crc32(body) & 0xFFFFFFFF) + body
+        with self._lock:
+            try:
+                self._open_writer()
+                self._writer.write(rec)
+                self._writer.flush()
+                if self.fsync:
+                    os.fsync(self._writer.fileno())
+                self._pending += 1
+                self.spooled_total += 1
+                if self._writer.tell() >= self.segment_bytes:
+                    self._enforce_cap()
+                return True
+            except Exception as e:
+                self.last_error = repr(e)
+                return False
+
+    # ---------- 读 / 确认 ----------
+    def pending(self) -> int:
+        return self._pending
+
+    def read_batch(self, limit: int) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """从读位置开始最多取 limit 条；返回 (records, 新读位置)。调用方补发成功后再 commit。"""
+        with self._lock:
+            seq, off = self._read_pos
+            out: List[Dict[str, Any]] = []
+            if seq not in self._segments:
+                later = [s for s in self._segments if s > seq]
+                if not later:
+                    return out, (seq, off)
+                seq, off = later[0], 0
+            while len(out) < limit and seq in self._segments:
+                for rec, nxt in self._iter_segment(seq, off, count_corrupt=True):
+                    out.append(rec)
+                    off = nxt
+                    if len(out) >= limit:
+                        break
+                if len(out) >= limit:
+                    break
+                later = [s for s in self._segments if s > seq]
+                if not later:
+                    break
+                seq, off = later[0], 0
+            return out, (seq, off)
+
+    def commit(self, pos: Tuple[int, int], n: int) -> None:
+        with self._lock:
+            for seq in [s for s in self._segments if s < pos[0]]:
+                self._remove_segment(seq)
+            self._read_pos = pos
+            self._pending = max(0, self._pending - n)
+            self.drained_total += n
+            self._save_pos()
+            # 全部补发完且当前段已写满：删掉它，下一次写新段
+            if self._pending == 0 and len(self._segments) == 1:
+                seq = self._segments[0]
+                if os.path.getsize(self._path(seq)) >= self.segment_bytes:
+                    self._remove_segment(seq)
+
+    def quarantine_stalled(self) -> int:
+        """
+        pending > 0 但 read_batch 读不出任何记录：读位置之后的数据无法解析（损坏 / 错位）。
+        把读位置所在的段改名成 .bad 隔离，读位置移到下一段，pending 按实际可读的记录重算。
+        返回隔离的段数（加锁后重新确认一次，期间有新记录写入就不动）
+        """
+        with self._lock:
+            seq, off = self._read_pos
+            if seq not in self._segments:
+                later = [x for x in self._segments if x > seq]
+                if not later:
+                    self._pending = 0
+                    return 0
+                seq, off = later[0], 0
+            if next(self._iter_segment(seq, off), None) is not None:
+                return 0
+            if seq == self._writer_seq and self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._writer_seq = 0
+            path = self._path(seq)
+            try:
+                os.replace(path, path + ".bad")
+            except FileNotFoundError:
+                pass
+            self._segments.remove(seq)
+            later = [x for x in self._segments if x > seq]
+            self._read_pos = (later[0], 0) if later else (self._last_seq + 1, 0)
+            self._save_pos()
+            self._pending = self._count_readable()
+            self.corrupt_total += 1
+            return 1
+
+    def oldest_age(self) -> Optional[float]:
+        with self._lock:
+            seq, off = self._read_pos
+            for rec, _ in self._iter_segment(seq, off):
+                return max(0.0, time.time() - float(rec.get("ts") or 0))
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        age = self.oldest_age() if self._pending else None
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "pending": self._pending,
+                "bytes": self._total_bytes(),
+                "segments": len(self._segments),
+                "oldest_age_seconds": round(age, 1) if age is not None else None,
+                "spooled_total": self.spooled_total,
+                "drained_total": self.drained_total,
+                "dropped_total": self.dropped_total,
+                "corrupt_total": self.corrupt_total,
+                "last_error": self.last_error,
+            }
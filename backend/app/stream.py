@@ -1,10 +1,14 @@
 import os
 import json
 import time
+import threading
 import redis
+import redis.asyncio as aioredis
 from typing import Dict, Any, Optional, List, Tuple
 from dotenv import load_dotenv
 
+from .spool import Spool, claim_dir
+
 load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "").strip()
@@ -12,9 +16,53 @@ REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 
+# 同步连接池 + 熔断（stream / StateStore / classic detector 共用）
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1"))
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", "5"))
+REDIS_BREAKER_OPEN_SECONDS = float(os.getenv("REDIS_BREAKER_OPEN_SECONDS", "5"))
+
+# async 连接池（WS/异步任务用）：XREAD 会阻塞 block_ms，socket 超时要比它大
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", "32"))
+REDIS_ASYNC_SOCKET_TIMEOUT = float(os.getenv("REDIS_ASYNC_SOCKET_TIMEOUT", "10"))
+REDIS_ASYNC_CONNECT_TIMEOUT = float(os.getenv("REDIS_ASYNC_CONNECT_TIMEOUT", "3"))
+
 RAWLOG_STREAM_KEY = "ids:rawlog"
 ALERT_STREAM_KEY = "ids:alert"
 
+# 每个 Stream 的保留策略：retention_seconds > 0 时用 MINID 按时间裁剪，maxlen 作为硬上限
+RAWLOG_STREAM_MAXLEN = int(os.getenv("RAWLOG_STREAM_MAXLEN", "5000"))
+RAWLOG_STREAM_RETENTION = int(os.getenv("RAWLOG_STREAM_RETENTION_SECONDS", "0"))
+ALERT_STREAM_MAXLEN = int(os.getenv("ALERT_STREAM_MAXLEN", "2000"))
+ALERT_STREAM_RETENTION = int(os.getenv("ALERT_STREAM_RETENTION_SECONDS", "0"))
+# MINID 模式下每写多少条补一次 XTRIM MAXLEN（防突发把内存顶爆）
+STREAM_CAP_EVERY = int(os.getenv("STREAM_CAP_EVERY", "200"))
+
+# rawlog 发布门控：always = 每条都写；auto = 只有在线 WS 订阅者 / 消费组时才写
+RAWLOG_PUBLISH = os.getenv("RAWLOG_PUBLISH", "auto").strip().lower()
+# slim：只写 id + source + host + level + 截断的 message（+ parsed 标记）；source 留着给 /ws/logs 过滤和采样摘要分组
+RAWLOG_SLIM = os.getenv("RAWLOG_SLIM", "0") == "1"
+RAWLOG_SLIM_MAX_CHARS = int(os.getenv("RAWLOG_SLIM_MAX_CHARS", "256"))
+
+# Redis 不可用时 publish 落本地磁盘，恢复后后台线程按顺序补发
+# 多 worker 共用 REDIS_SPOOL_DIR：每个进程用 flock 认领其中一个 slot-K 子目录（见 spool.claim_dir）
+REDIS_SPOOL = os.getenv("REDIS_SPOOL", "1") == "1"
+REDIS_SPOOL_DIR = os.getenv(
+    "REDIS_SPOOL_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "spool")
+)
+REDIS_SPOOL_SEGMENT_MB = int(os.getenv("REDIS_SPOOL_SEGMENT_MB", "8"))
+REDIS_SPOOL_MAX_MB = int(os.getenv("REDIS_SPOOL_MAX_MB", "512"))
+REDIS_SPOOL_FSYNC = os.getenv("REDIS_SPOOL_FSYNC", "0") == "1"
+SPOOL_DRAIN_BATCH = int(os.getenv("SPOOL_DRAIN_BATCH", "200"))
+SPOOL_DRAIN_RATE = int(os.getenv("SPOOL_DRAIN_RATE", "2000"))  # 条/秒，防止恢复瞬间把 Redis 打满
+
+# 在线心跳：WS hub 有订阅者时定期刷新 ids:live:{stream}；TTL 留出重连余量，让 last_id 续传不断档
+LIVE_KEY_PREFIX = "ids:live:"
+LIVE_HEARTBEAT_TTL = int(os.getenv("LIVE_HEARTBEAT_TTL", "60"))
+LIVE_GATE_CACHE_SECONDS = float(os.getenv("LIVE_GATE_CACHE_SECONDS", "2"))
+
 
 def _to_str(v: Any) -> str:
     if v is None:
@@ -28,16 +76,192 @@ def _normalize(data: Dict[str, Any]) -> Dict[str, str]:
     return {str(k): _to_str(v) for k, v in (data or {}).items()}
 
 
+class CircuitOpenError(redis.ConnectionError):
+    """熔断打开期间直接失败，不去碰网络"""
+
+
+class CircuitBreaker:
+    """
+    closed -> 连续 failure_threshold 次连接/超时错误 -> open
+    open   -> open_seconds 内所有调用直接抛 CircuitOpenError
+           -> 到期后放行一个线程试探（half_open），其他线程仍然快速失败
+    half_open -> 试探成功 closed / 失败重新 open
+              -> 试探线程 trial_seconds 内没有结论（线程挂了 / 异常没经过连接层），换下一个线程试探
+    只统计连接类错误（ConnectionError / TimeoutError）；ResponseError 说明服务端有应答，算成功。
+    """
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 5.0, trial_seconds: float = 10.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.trial_seconds = trial_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_owner: Optional[int] = None
+        self._trial_started = 0.0
+        self.opened_total = 0
+        self.rejected_total = 0
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            me = threading.get_ident()
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected_total += 1
+                    return False
+                self.state = "half_open"
+                self._trial_owner = me
+                self._trial_started = time.monotonic()
+                return True
+            # half_open：只有试探线程能过（它自己的 health check / 重试也要放行）
+            if self._trial_owner == me:
+                return True
+            if time.monotonic() - self._trial_started >= self.trial_seconds:
+                self._trial_owner = me
+                self._trial_started = time.monotonic()
+                return True
+            self.rejected_total += 1
+            return False
+
+    def record_success(self) -> None:
+        if self.state == "closed" and self.failures == 0:
+            return
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_owner = None
+
+    def record_failure(self, err: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.failures += 1
+            if err is not None:
+                self.last_error = repr(err)
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_owner = None
+                self.opened_total += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 2)
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "open_seconds": self.open_seconds,
+                "retry_in_seconds": retry_in,
+                "opened_total": self.opened_total,
+                "rejected_total": self.rejected_total,
+                "last_error": self.last_error,
+            }
+
+
+# 试探最长会卡在 connect + 一次读超时上，超过这个时间还没结论就换线程
+breaker = CircuitBreaker(REDIS_BREAKER_FAILURES, REDIS_BREAKER_OPEN_SECONDS,
+                         trial_seconds=REDIS_CONNECT_TIMEOUT + REDIS_SOCKET_TIMEOUT + 1.0)
+
+_CONN_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError)
+
+
+class _BreakerMixin:
+    """所有同步 Redis 调用（stream / StateStore / classic detector）都走这里，熔断在连接层生效"""
+
+    def connect(self):
+        # 连接池取连接时先 connect()，熔断要在这里就拦住，否则每次都要等 connect timeout
+        if self._sock is not None:
+            return
+        if not breaker.allow():
+            raise CircuitOpenError("redis circuit open")
+        try:
+            super().connect()
+        except _CONN_ERRORS as e:
+            breaker.record_failure(e)
+            raise
+
+    def send_packed_command(self, command, check_health=True):
+        if not breaker.allow():
+            raise CircuitOpenError("redis circuit open")
+        try:
+            return super().send_packed_command(command, check_health)
+        except CircuitOpenError:
+            raise
+        except _CONN_ERRORS as e:
+            breaker.record_failure(e)
+            raise
+
+    def read_response(self, *args, **kwargs):
+        try:
+            resp = super().read_response(*args, **kwargs)
+        except _CONN_ERRORS as e:
+            breaker.record_failure(e)
+            raise
+        except Exception:
+            # ResponseError 等：连接是通的，half_open 试探也要据此关闭熔断
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return resp
+
+
+class BreakerConnection(_BreakerMixin, redis.Connection):
+    pass
+
+
+class BreakerSSLConnection(_BreakerMixin, redis.SSLConnection):
+    pass
+
+
+class BreakerUnixConnection(_BreakerMixin, redis.UnixDomainSocketConnection):
+    pass
+
+
+# REDIS_URL 的 scheme -> 带熔断的连接类（from_url 传了 connection_class 就不再按 scheme 选）
+_BREAKER_CONNECTIONS = {
+    "redis": BreakerConnection,
+    "rediss": BreakerSSLConnection,
+    "unix": BreakerUnixConnection,
+}
+
+
 class RedisClientManager:
-    """懒连接 + 自动重建"""
+    """
+    单个 client + 有界阻塞连接池（BlockingConnectionPool）+ 熔断：
+    - client 建一次长期复用（StateStore 等持有的引用不会失效），断线由连接池自己重连
+    - 池满时最多等 REDIS_POOL_TIMEOUT 秒；连接/读写都有超时
+    - 熔断打开时调用立刻失败，不会每个请求都卡在 connect timeout 上
+    """
     def __init__(self) -> None:
         self._client: Optional[redis.Redis] = None
         self._last_fail_ts: float = 0.0
 
     def _build_client(self) -> redis.Redis:
+        kwargs = dict(
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            health_check_interval=30,
+        )
         if REDIS_URL:
-            return redis.Redis.from_url(REDIS_URL, decode_responses=True)
-        return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+            conn_cls = _BREAKER_CONNECTIONS.get(REDIS_URL.split("://", 1)[0].lower())
+            if conn_cls is not None:
+                kwargs["connection_class"] = conn_cls
+            else:
+                print("[REDIS] circuit breaker disabled for", REDIS_URL.split("://", 1)[0] + "://")
+            pool = redis.BlockingConnectionPool.from_url(REDIS_URL, **kwargs)
+        else:
+            pool = redis.BlockingConnectionPool(
+                host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, connection_class=BreakerConnection, **kwargs
+            )
+        return redis.Redis(connection_pool=pool)
 
     def get(self) -> redis.Redis:
         if self._client is None:
@@ -45,20 +269,97 @@ class RedisClientManager:
         return self._client
 
     def reset(self) -> None:
-        self._client = None
+        # 连接池会丢弃出错的连接并自动重连，这里只记录失败时间，不再重建 client
+        self._last_fail_ts = time.time()
 
     def ping(self) -> bool:
         try:
             return bool(self.get().ping())
         except Exception:
-            self._last_fail_ts = time.time()
             self.reset()
             return False
 
+    def pool_stats(self) -> Dict[str, Any]:
+        c = self._client
+        if c is None:
+            return {"connected": False}
+        pool = c.connection_pool
+        return {
+            "connected": True,
+            "max_connections": pool.max_connections,
+            "created": len(getattr(pool, "_connections", ()) or ()),
+            "last_fail_ts": self._last_fail_ts or None,
+        }
+
 
 _mgr = RedisClientManager()
 
 
+class AsyncRedisClientManager:
+    """
+    redis.asyncio 版本：懒连接 + 连接池
+    - 原生 async XREAD，不再每个阻塞读占一个线程（asyncio.to_thread）
+    - 连接池绑定当前事件循环，所以第一次 get() 必须在 loop 里调用
+    - client 由所有 WS hub / 心跳共用：出错时连接池自己断开并丢弃那条坏连接，不关闭 client
+      （否则一次心跳失败会把其他 hub 正在 XREAD 的连接一起断掉）
+    """
+    def __init__(self) -> None:
+        self._client: Optional[aioredis.Redis] = None
+        self._last_fail_ts: float = 0.0
+        self.failures: int = 0
+
+    def _build_client(self) -> aioredis.Redis:
+        kwargs = dict(
+            decode_responses=True,
+            max_connections=REDIS_ASYNC_MAX_CONNECTIONS,
+            socket_timeout=REDIS_ASYNC_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_ASYNC_CONNECT_TIMEOUT,
+            health_check_interval=30,
+        )
+        if REDIS_URL:
+            pool = aioredis.ConnectionPool.from_url(REDIS_URL, **kwargs)
+        else:
+            pool = aioredis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, **kwargs)
+        return aioredis.Redis(connection_pool=pool)
+
+    def get(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    async def reset(self) -> None:
+        # 和同步版一样只记录失败；坏连接已经在 execute_command 里 disconnect，下次从池里拿会重连
+        self._last_fail_ts = time.time()
+        self.failures += 1
+
+    async def ping(self) -> bool:
+        try:
+            return bool(await self.get().ping())
+        except Exception:
+            await self.reset()
+            return False
+
+    def pool_stats(self) -> Dict[str, Any]:
+        c = self._client
+        if c is None:
+            return {"connected": False, "failures": self.failures}
+        pool = c.connection_pool
+        return {
+            "connected": True,
+            "failures": self.failures,
+            "max_connections": pool.max_connections,
+            "in_use": len(getattr(pool, "_in_use_connections", ()) or ()),
+            "idle": len(getattr(pool, "_available_connections", ()) or ()),
+        }
+
+
+_amgr = AsyncRedisClientManager()
+
+
+def get_async_redis() -> aioredis.Redis:
+    return _amgr.get()
+
+
 # ✅✅✅ 兼容你 main.py 里可能写的：from .stream import get_redis
 def get_redis() -> redis.Redis:
     """
@@ -80,22 +381,247 @@ r = _RedisProxy()
 # -----------------------
 # 发布（写 Stream）
 # -----------------------
-def publish_rawlog(data: Dict[str, Any]) -> Optional[str]:
-    payload = _normalize(data)
+class StreamPolicy:
+    """单个 Stream 的 XADD 裁剪策略"""
+
+    def __init__(self, key: str, maxlen: int, retention_seconds: int = 0):
+        self.key = key
+        self.maxlen = maxlen
+        self.retention_seconds = retention_seconds
+        self._since_cap = 0
+
+    def xadd(self, c: redis.Redis, payload: Dict[str, str]) -> Optional[str]:
+        if self.retention_seconds <= 0:
+            return c.xadd(self.key, payload, maxlen=self.maxlen, approximate=True)
+
+        minid = f"{int((time.time() - self.retention_seconds) * 1000)}-0"
+        entry_id = c.xadd(self.key, payload, minid=minid, approximate=True)
+        self._since_cap += 1
+        if self.maxlen > 0 and self._since_cap >= STREAM_CAP_EVERY:
+            self._since_cap = 0
+            c.xtrim(self.key, maxlen=self.maxlen, approximate=True)
+        return entry_id
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "trim": "minid" if self.retention_seconds > 0 else "maxlen",
+            "maxlen": self.maxlen,
+            "retention_seconds": self.retention_seconds,
+        }
+
+
+RAWLOG_POLICY = StreamPolicy(RAWLOG_STREAM_KEY, RAWLOG_STREAM_MAXLEN, RAWLOG_STREAM_RETENTION)
+ALERT_POLICY = StreamPolicy(ALERT_STREAM_KEY, ALERT_STREAM_MAXLEN, ALERT_STREAM_RETENTION)
+
+
+class LiveGate:
+    """
+    rawlog 要不要写：有在线 WS 订阅者（心跳 key 还在）或有消费组（XINFO GROUPS）就写。
+    结果进程内缓存 LIVE_GATE_CACHE_SECONDS 秒，ingest 热路径上不是每条都查 Redis。
+    """
+
+    def __init__(self, stream_key: str, live_name: str):
+        self.stream_key = stream_key
+        self.live_key = LIVE_KEY_PREFIX + live_name
+        self._open = True
+        self._checked_at = 0.0
+        self.published = 0
+        self.skipped = 0
+
+    def is_open(self, c: redis.Redis) -> bool:
+        if RAWLOG_PUBLISH == "always":
+            return True
+        now = time.time()
+        if now - self._checked_at < LIVE_GATE_CACHE_SECONDS:
+            return self._open
+        self._checked_at = now
+        try:
+            if c.exists(self.live_key):
+                self._open = True
+            else:
+                groups = c.xinfo_groups(self.stream_key) if c.exists(self.stream_key) else []
+                self._open = bool(groups)
+        except Exception:
+            # 查不到就按“需要”处理，宁可多写
+            self._open = True
+        return self._open
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": RAWLOG_PUBLISH,
+            "open": self._open,
+            "live_key": self.live_key,
+            "published": self.published,
+            "skipped": self.skipped,
+        }
+
+
+_rawlog_gate = LiveGate(RAWLOG_STREAM_KEY, "rawlog")
+
+
+def _slim_rawlog(data: Dict[str, Any]) -> Dict[str, Any]:
+    msg = str(data.get("message") or "")
+    out = {
+        "id": data.get("id"),
+        "source": data.get("source"),
+        "host": data.get("host"),
+        "level": data.get("level"),
+        "message": msg[:RAWLOG_SLIM_MAX_CHARS],
+    }
+    if data.get("parsed"):
+        out["parsed"] = data.get("parsed")
+    if len(msg) > RAWLOG_SLIM_MAX_CHARS:
+        out["truncated"] = "1"
+    return out
+
+
+_POLICIES = {RAWLOG_STREAM_KEY: RAWLOG_POLICY, ALERT_STREAM_KEY: ALERT_POLICY}
+
+
+def _build_spool() -> Optional[Spool]:
+    if not REDIS_SPOOL:
+        return None
+    try:
+        directory, dir_lock = claim_dir(REDIS_SPOOL_DIR)
+        return Spool(
+            directory,
+            segment_bytes=REDIS_SPOOL_SEGMENT_MB * 1024 * 1024,
+            max_bytes=REDIS_SPOOL_MAX_MB * 1024 * 1024,
+            fsync=REDIS_SPOOL_FSYNC,
+            dir_lock=dir_lock,
+        )
+    except Exception as e:
+        print("[SPOOL] disabled:", repr(e))
+        return None
+
+
+_spool = _build_spool()
+
+
+def _publish(policy: StreamPolicy, payload: Dict[str, str]) -> Optional[str]:
+    """
+    XADD；失败就落盘。
+    有积压时实时消息照样直接写 Redis，积压由 SpoolDrainer 在后台补发（补发的那部分晚于实时消息到达）。
+    """
     try:
-        return _mgr.get().xadd(RAWLOG_STREAM_KEY, payload, maxlen=5000, approximate=True)
+        return policy.xadd(_mgr.get(), payload)
     except Exception:
         _mgr.reset()
+        if _spool is not None:
+            _spool.append(policy.key, payload)
         return None
 
 
-def publish_alert(data: Dict[str, Any]) -> Optional[str]:
-    payload = _normalize(data)
+def publish_rawlog(data: Dict[str, Any]) -> Optional[str]:
     try:
-        return _mgr.get().xadd(ALERT_STREAM_KEY, payload, maxlen=2000, approximate=True)
+        gate_open = _rawlog_gate.is_open(_mgr.get())
     except Exception:
-        _mgr.reset()
+        gate_open = True
+    if not gate_open:
+        _rawlog_gate.skipped += 1
         return None
+    _rawlog_gate.published += 1
+    return _publish(RAWLOG_POLICY, _normalize(_slim_rawlog(data) if RAWLOG_SLIM else data))
+
+
+def publish_alert(data: Dict[str, Any]) -> Optional[str]:
+    return _publish(ALERT_POLICY, _normalize(data))
+
+
+class SpoolDrainer(threading.Thread):
+    """
+    后台补发：spool 有积压且 ping 恢复后，按批 pipeline XADD，按 SPOOL_DRAIN_RATE 限速。
+    一批成功才推进读位置；失败等下一轮（记录不会丢，最多重复一批）。
+    """
+
+    def __init__(self, spool: Spool, batch: int = 200, rate: int = 2000):
+        super().__init__(name="redis-spool-drainer", daemon=True)
+        self.spool = spool
+        self.batch = max(1, batch)
+        self.rate = max(1, rate)
+        self._stop_evt = threading.Event()
+        self.errors = 0
+        self.quarantined = 0
+        self.last_drain_ts: Optional[float] = None
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+    def run(self) -> None:
+        backoff = 1.0
+        while not self._stop_evt.is_set():
+            if self.spool.pending() == 0:
+                self._stop_evt.wait(1.0)
+                continue
+            if not _mgr.ping():
+                self._stop_evt.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+
+            started = time.monotonic()
+            records, pos = self.spool.read_batch(self.batch)
+            if not records:
+                # pending > 0 却一条都读不出来：读位置之后的数据坏了，隔离该段、按实际可读重算 pending
+                self.quarantined += self.spool.quarantine_stalled()
+                self._stop_evt.wait(1.0)
+                continue
+            try:
+                pipe = _mgr.get().pipeline(transaction=False)
+                for rec in records:
+                    policy = _POLICIES.get(rec.get("k")) or StreamPolicy(str(rec.get("k")), RAWLOG_STREAM_MAXLEN)
+                    policy.xadd(pipe, rec.get("f") or {})
+                pipe.execute()
+            except Exception:
+                self.errors += 1
+                _mgr.reset()
+                continue
+            self.spool.commit(pos, len(records))
+            self.last_drain_ts = time.time()
+
+            budget = len(records) / float(self.rate)
+            elapsed = time.monotonic() - started
+            if budget > elapsed:
+                self._stop_evt.wait(budget - elapsed)
+
+
+_drainer: Optional[SpoolDrainer] = None
+
+
+def start_spool_drainer() -> None:
+    global _drainer
+    if _spool is None or (_drainer is not None and _drainer.is_alive()):
+        return
+    _drainer = SpoolDrainer(_spool, batch=SPOOL_DRAIN_BATCH, rate=SPOOL_DRAIN_RATE)
+    _drainer.start()
+
+
+def spool_stats() -> Dict[str, Any]:
+    if _spool is None:
+        return {"enabled": False}
+    out: Dict[str, Any] = {"enabled": True, **_spool.stats()}
+    out["drainer_running"] = _drainer is not None and _drainer.is_alive()
+    out["drain_errors"] = _drainer.errors if _drainer else 0
+    out["quarantined_segments"] = _drainer.quarantined if _drainer else 0
+    out["last_drain_ts"] = _drainer.last_drain_ts if _drainer else None
+    return out
+
+
+async def alive_heartbeat(live_name: str, ttl: int = LIVE_HEARTBEAT_TTL) -> None:
+    """WS hub 有订阅者时调用：告诉所有 ingest worker 这个 Stream 有人在看"""
+    try:
+        await _amgr.get().set(LIVE_KEY_PREFIX + live_name, str(int(time.time())), ex=ttl)
+    except Exception:
+        await _amgr.reset()
+
+
+def publish_stats() -> Dict[str, Any]:
+    return {
+        "rawlog_gate": _rawlog_gate.stats(),
+        "rawlog_slim": RAWLOG_SLIM,
+        "policies": [RAWLOG_POLICY.to_dict(), ALERT_POLICY.to_dict()],
+    }
 
 
 # -----------------------
@@ -118,9 +644,73 @@ def stream_xread(key: str, last_id: str, block_ms: int = 2000, count: int = 50)
         raise
 
 
+async def astream_xread(key: str, last_id: str, block_ms: int = 2000, count: int = 50) -> XReadResult:
+    """stream_xread 的 async 版本：异常 reset 连接池后抛给上层重试"""
+    try:
+        return await _amgr.get().xread({key: last_id}, block=block_ms, count=count)  # type: ignore
+    except Exception:
+        await _amgr.reset()
+        raise
+
+
+async def astream_latest_id(key: str) -> str:
+    try:
+        items = await _amgr.get().xrevrange(key, count=1)
+        if not items:
+            return "0-0"
+        latest_id, _ = items[0]
+        return str(latest_id)
+    except Exception:
+        await _amgr.reset()
+        return "0-0"
+
+
+async def astream_range(key: str, start: str, count: int = 500) -> List[Tuple[str, Dict[str, Any]]]:
+    """XRANGE key start + COUNT count（start 含本身）；断线重放用"""
+    try:
+        return await _amgr.get().xrange(key, min=start, max="+", count=count)  # type: ignore
+    except Exception:
+        await _amgr.reset()
+        raise
+
+
+async def astream_first_id(key: str) -> str:
+    """Stream 里还保留着的最旧 id；空 Stream 返回 "0-0" """
+    try:
+        items = await _amgr.get().xrange(key, count=1)
+        if not items:
+            return "0-0"
+        first_id, _ = items[0]
+        return str(first_id)
+    except Exception:
+        await _amgr.reset()
+        raise
+
+
+def async_pool_stats() -> Dict[str, Any]:
+    return _amgr.pool_stats()
+
+
+def stream_latest_id(key: str) -> str:
+    """Stream 当前最新 ID（WS 从这里开始读，不回放旧数据）；读不到就从 0-0 开始"""
+    try:
+        items = _mgr.get().xrevrange(key, count=1)
+        if not items:
+            return "0-0"
+        latest_id, _ = items[0]
+        return str(latest_id)
+    except Exception:
+        _mgr.reset()
+        return "0-0"
+
+
 # -----------------------
 # 诊断
 # -----------------------
+def redis_breaker_stats() -> Dict[str, Any]:
+    return {"breaker": breaker.stats(), "pool": _mgr.pool_stats()}
+
+
 def redis_info() -> Dict[str, Any]:
     try:
         info = _mgr.get().info("server")
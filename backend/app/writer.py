@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+
+from .dims import dims
+from .models import RawLog
+
+
+# -----------------------------
+# raw_logs 组提交：/ingest 并发写入时，多条日志合并成一个事务提交
+#   SQLite 同一时刻只有一个写事务，每条日志单独 commit 会在写锁上排队，
+#   合并之后一次提交写一批，提交次数从 N 降到 N / batch
+#   调用方（ingest，本来就跑在线程池里）提交后阻塞等结果，拿到带 id / created_at 的 RawLog，
+#   后续流程和逐条 commit 时完全一样；写入失败原样抛给每个调用方
+# DB_WRITE_BATCH=auto（默认：SQLite 开、MySQL 关）| 1 | 0
+# DB_WRITE_BATCH_MAX：一批最多多少条；DB_WRITE_BATCH_MS：第一条到达后最多再等多久凑批
+# -----------------------------
+DB_WRITE_BATCH = os.getenv("DB_WRITE_BATCH", "auto").strip().lower()
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "256"))
+DB_WRITE_BATCH_MS = float(os.getenv("DB_WRITE_BATCH_MS", "5"))
+DB_WRITE_TIMEOUT = float(os.getenv("DB_WRITE_TIMEOUT", "30"))
+
+_KINDS = ("source", "host", "level")
+
+
+class RawLogBatcher(threading.Thread):
+    def __init__(self, engine: Engine, max_batch: int = DB_WRITE_BATCH_MAX, wait_ms: float = DB_WRITE_BATCH_MS):
+        super().__init__(name="rawlog-writer", daemon=True)
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.wait = wait_ms / 1000.0
+        self._q: "queue.Queue[Tuple[Dict[str, Any], Future]]" = queue.Queue()
+
+        self.rows_total = 0
+        self.batches_total = 0
+        self.max_batch_seen = 0
+        self.errors_total = 0
+        self.last_error: Optional[str] = None
+        self.last_commit_ms: Optional[float] = None
+
+    def write(self, source: Optional[str], host: Optional[str], level: Optional[str], message: str) -> RawLog:
+        fut: Future = Future()
+        self._q.put(({"source": source, "host": host, "level": level, "message": message}, fut))
+        return fut.result(timeout=DB_WRITE_TIMEOUT)
+
+    def run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                left = deadline - time.monotonic()
+                try:
+                    batch.append(self._q.get(timeout=left) if left > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[Dict[str, Any], Future]]) -> None:
+        t0 = time.perf_counter()
+        try:
+            # 维度 id 先解析（新名字走 dims 自己的短事务），不夹在批量写事务里抢写锁
+            values = []
+            for v, _ in batch:
+                row = {f"{k}_id": dims[k].id_for(self.engine, v[k]) for k in _KINDS}
+                row["message"] = v["message"]
+                values.append(row)
+            with self.engine.begin() as conn:
+                ids = [conn.execute(insert(RawLog), row).inserted_primary_key[0] for row in values]
+                created = dict(conn.execute(select(RawLog.id, RawLog.created_at).where(RawLog.id.in_(ids))).all())
+        except Exception as e:
+            self.errors_total += 1
+            self.last_error = repr(e)
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.rows_total += len(batch)
+        self.batches_total += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.last_commit_ms = round((time.perf_counter() - t0) * 1000, 2)
+        for (v, fut), row, i in zip(batch, values, ids):
+            fut.set_result(RawLog(id=i, created_at=created.get(i), **row))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "queued": self._q.qsize(),
+            "rows_total": self.rows_total,
+            "batches_total": self.batches_total,
+            "avg_batch": round(self.rows_total / self.batches_total, 2) if self.batches_total else None,
+            "max_batch_seen": self.max_batch_seen,
+            "last_commit_ms": self.last_commit_ms,
+            "errors_total": self.errors_total,
+            "last_error": self.last_error,
+        }
+
+
+_writer: Optional[RawLogBatcher] = None
+
+
+def start_rawlog_writer(engine: Engine) -> Optional[RawLogBatcher]:
+    global _writer
+    if _writer is not None:
+        return _writer
+    on = DB_WRITE_BATCH == "1" or (DB_WRITE_BATCH == "auto" and engine.dialect.name == "sqlite")
+    if not on:
+        return None
+    _writer = RawLogBatcher(engine)
+    _writer.start()
+    return _writer
+
+
+def rawlog_writer() -> Optional[RawLogBatcher]:
+    return _writer
+
+
+def writer_stats() -> Dict[str, Any]:
+    if _writer is None:
+        return {"enabled": False, "mode": DB_WRITE_BATCH}
+    return {"mode": DB_WRITE_BATCH, **_writer.stats()}
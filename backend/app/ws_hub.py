@@ -0,0 +1,576 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from .stream import (
+    RAWLOG_STREAM_KEY,
+    ALERT_STREAM_KEY,
+    astream_xread,
+    astream_latest_id,
+    astream_range,
+    astream_first_id,
+    alive_heartbeat,
+    LIVE_HEARTBEAT_TTL,
+)
+
+
+# -----------------------------
+# WS 广播中心：每个 Stream 每个进程只有一个 XREAD 读者，
+# 读到的条目分发到每个客户端自己的有界 asyncio.Queue。
+# 之前每条 WS 连接各跑一个阻塞 XREAD（各占一个线程 + 一个 Redis 连接），
+# 200 个大屏就是 200 个线程；现在只和 Stream 个数有关，
+# 且读者直接用 redis.asyncio 的原生 async XREAD，不占线程池。
+# -----------------------------
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "1000"))
+# 慢客户端策略：drop = 丢最旧的消息继续推；disconnect = 队列满直接断开
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop").strip().lower()
+WS_XREAD_BLOCK_MS = int(os.getenv("WS_XREAD_BLOCK_MS", "2000"))
+WS_XREAD_COUNT = int(os.getenv("WS_XREAD_COUNT", "200"))
+# 断线重连 ?last_id= 时最多重放多少条（Stream 本身还受 maxlen 限制）
+WS_REPLAY_MAX = int(os.getenv("WS_REPLAY_MAX", "10000"))
+WS_REPLAY_CHUNK = int(os.getenv("WS_REPLAY_CHUNK", "500"))
+# 实时日志降采样：每个订阅每秒最多逐条推多少行（0 = 关闭，永远逐条）
+WS_RATE_BUDGET = int(os.getenv("WS_RATE_BUDGET", "200"))
+WS_SUMMARY_INTERVAL_MS = int(os.getenv("WS_SUMMARY_INTERVAL_MS", "1000"))
+WS_SUMMARY_TOP = int(os.getenv("WS_SUMMARY_TOP", "10"))
+
+# 队列里的关闭信号
+CLOSE = object()
+
+SEVERITY_RANK = {"LOW": 1, "MEDIUM": 2, "HIGH": 3, "CRITICAL": 4}
+
+
+def _id_ms(entry_id: str) -> int:
+    try:
+        return int(str(entry_id).split("-", 1)[0])
+    except Exception:
+        return 0
+
+
+def parse_stream_id(entry_id: Any) -> Optional[Tuple[int, int]]:
+    """"1700000000000-3" -> (1700000000000, 3)；格式不对返回 None"""
+    try:
+        ms, _, seq = str(entry_id).strip().partition("-")
+        return int(ms), int(seq or 0)
+    except Exception:
+        return None
+
+
+def _as_set(v: Any) -> Optional[FrozenSet[str]]:
+    """"a,b" / ["a","b"] -> {"A","B"}；空值表示不过滤"""
+    if v is None:
+        return None
+    items = v if isinstance(v, (list, tuple, set)) else str(v).split(",")
+    out = frozenset(str(x).strip().upper() for x in items if str(x).strip())
+    return out or None
+
+
+class SubscriptionFilter:
+    """
+    客户端订阅条件，订阅时预编译一次，之后每条消息只做 set 查找 / 子串查找：
+      host / source / level / alert_type：精确匹配（不区分大小写，多值 = 任一）
+      severity：["HIGH","CRITICAL"] 精确匹配，或 "HIGH+" 表示该级别及以上
+      q：子串（不区分大小写），匹配 hub.text_fields 里的字段
+    没有设置的条件不参与判断；全部为空时等价于不过滤。
+    """
+
+    def __init__(self, host: Any = None, source: Any = None, level: Any = None,
+                 severity: Any = None, alert_type: Any = None, q: Any = None):
+        self.host = _as_set(host)
+        self.source = _as_set(source)
+        self.level = _as_set(level)
+        self.alert_type = _as_set(alert_type)
+
+        self.severity: Optional[FrozenSet[str]] = None
+        self.min_severity = 0
+        sev = str(severity).strip().upper() if isinstance(severity, str) else None
+        if sev and sev.endswith("+"):
+            self.min_severity = SEVERITY_RANK.get(sev[:-1], 0)
+        else:
+            self.severity = _as_set(severity)
+
+        self.q = str(q).strip().lower() if q else ""
+
+        self._checks: List[Tuple[str, FrozenSet[str]]] = [
+            (k, v) for k, v in (
+                ("host", self.host), ("source", self.source), ("level", self.level),
+                ("alert_type", self.alert_type), ("severity", self.severity),
+            ) if v
+        ]
+        self.empty = not (self._checks or self.min_severity or self.q)
+
+    @classmethod
+    def from_dict(cls, d: Optional[Dict[str, Any]]) -> "SubscriptionFilter":
+        d = d or {}
+        return cls(
+            host=d.get("host"),
+            source=d.get("source"),
+            level=d.get("level"),
+            severity=d.get("severity"),
+            alert_type=d.get("alert_type"),
+            q=d.get("q") or d.get("substring"),
+        )
+
+    def match(self, fields: Dict[str, Any], text_fields: Tuple[str, ...] = ()) -> bool:
+        if self.empty:
+            return True
+        for k, allowed in self._checks:
+            if str(fields.get(k) or "").upper() not in allowed:
+                return False
+        if self.min_severity and SEVERITY_RANK.get(str(fields.get("severity") or "").upper(), 0) < self.min_severity:
+            return False
+        if self.q:
+            return any(self.q in str(fields.get(k) or "").lower() for k in text_fields)
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        def _l(v: Optional[FrozenSet[str]]) -> Optional[List[str]]:
+            return sorted(v) if v else None
+
+        sev: Any = _l(self.severity)
+        if self.min_severity:
+            sev = next(k for k, r in SEVERITY_RANK.items() if r == self.min_severity) + "+"
+        return {
+            "host": _l(self.host),
+            "source": _l(self.source),
+            "level": _l(self.level),
+            "severity": sev,
+            "alert_type": _l(self.alert_type),
+            "q": self.q or None,
+        }
+
+
+_NUM_RE = re.compile(r"\d+")
+_SUMMARY_MAX_KEYS = 1000
+
+
+class RateSampler:
+    """
+    单个订阅的速率预算（行/秒）：
+    - 窗口内没超预算：逐条推送（精确模式）
+    - 超预算：进入采样模式，每 k 行放行 1 行，k 按上个窗口的速率算，保证样本量 ≈ budget/2；
+      没放行的行只计入摘要，窗口结束时发一帧 {type: summary}
+    - parser 命中的行（payload 里 parsed 非空）永远放行
+    - 速率回落到预算以内，下个窗口自动回到精确模式
+    """
+
+    def __init__(self, budget: int, interval_ms: int = 1000, top: int = 10):
+        self.budget = max(0, int(budget))
+        self.interval = max(0.1, interval_ms / 1000.0)
+        self.top = top
+        self.window_start = time.monotonic()
+        self.count = 0
+        self.every = 0  # 0 = 精确模式
+        self._skip = 0
+        self._reset_summary()
+        self.summaries_sent = 0
+        self.suppressed_total = 0
+
+    @property
+    def sampling(self) -> bool:
+        return self.every > 0
+
+    def _reset_summary(self) -> None:
+        self.passed = 0
+        self.suppressed = 0
+        self.by_host: Counter = Counter()
+        self.by_source: Counter = Counter()
+        self.by_level: Counter = Counter()
+        self.messages: Counter = Counter()
+
+    def _every_for(self, rate: float) -> int:
+        target = max(1.0, self.budget / 2.0)
+        return max(2, int(rate / target + 0.999))
+
+    def roll(self, now: float) -> Optional[Dict[str, Any]]:
+        """窗口到期：按本窗口速率决定下个窗口的模式；采样过就返回摘要帧"""
+        elapsed = now - self.window_start
+        if elapsed < self.interval:
+            return None
+
+        rate = self.count / elapsed
+        frame = None
+        if self.sampling or self.suppressed:
+            frame = self._summary(elapsed, rate)
+        self.every = self._every_for(rate) if rate > self.budget else 0
+        self._skip = 0
+        self.window_start = now
+        self.count = 0
+        self._reset_summary()
+        return frame
+
+    def admit(self, fields: Dict[str, Any]) -> bool:
+        self.count += 1
+        # 窗口内突发：已经用完本窗口的配额就立刻切到采样，不等窗口结束
+        if not self.sampling and self.count > self.budget * self.interval:
+            elapsed = max(1e-3, time.monotonic() - self.window_start)
+            self.every = self._every_for(self.count / elapsed)
+
+        if not self.sampling or fields.get("parsed"):
+            self.passed += 1
+            return True
+
+        self._skip += 1
+        if self._skip >= self.every:
+            self._skip = 0
+            self.passed += 1
+            return True
+
+        self.suppressed += 1
+        self.suppressed_total += 1
+        for counter, key in ((self.by_host, "host"), (self.by_source, "source"), (self.by_level, "level")):
+            k = str(fields.get(key) or "-")
+            if k in counter or len(counter) < _SUMMARY_MAX_KEYS:
+                counter[k] += 1
+        msg = _NUM_RE.sub("#", str(fields.get("message") or ""))[:160]
+        if msg in self.messages or len(self.messages) < _SUMMARY_MAX_KEYS:
+            self.messages[msg] += 1
+        return False
+
+    def _summary(self, elapsed: float, rate: float) -> Dict[str, Any]:
+        self.summaries_sent += 1
+        return {
+            "type": "summary",
+            "data": {
+                "window_ms": int(elapsed * 1000),
+                "rate": round(rate, 1),
+                "budget": self.budget,
+                "sample_every": self.every,
+                "total": self.passed + self.suppressed,
+                "passed": self.passed,
+                "suppressed": self.suppressed,
+                "by_host": dict(self.by_host.most_common(self.top)),
+                "by_source": dict(self.by_source.most_common(self.top)),
+                "by_level": dict(self.by_level.most_common(self.top)),
+                "top_messages": [{"message": m, "count": c} for m, c in self.messages.most_common(self.top)],
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "sampling": self.sampling,
+            "sample_every": self.every,
+            "suppressed_total": self.suppressed_total,
+            "summaries_sent": self.summaries_sent,
+        }
+
+
+class Subscriber:
+    def __init__(self, maxsize: int = 1000, policy: str = "drop"):
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=maxsize)
+        self.policy = policy
+        self.filter = SubscriptionFilter()
+        self.filtered = 0
+        self.sampler: Optional[RateSampler] = None
+        self.connected_at = time.time()
+        self.dropped = 0
+        self.delivered = 0
+        self.last_id = ""
+        self.sent_id: Optional[Tuple[int, int]] = None  # 已推给客户端的最大 stream id（重放去重用）
+        self.closed = False
+        self.close_reason = ""
+
+    def offer(self, msg: Any) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(msg)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == "disconnect":
+            self.close("slow_consumer")
+            return
+
+        # drop：丢掉最旧的一条，给新消息腾位置
+        try:
+            self.queue.get_nowait()
+            self.dropped += 1
+        except asyncio.QueueEmpty:
+            pass
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def close(self, reason: str = "") -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.close_reason = reason
+        # 清空后放关闭信号，保证消费方能立刻拿到
+        while True:
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+        self.queue.put_nowait(CLOSE)
+
+    def mark_sent(self, entry_id: Optional[str]) -> None:
+        self.delivered += 1
+        if entry_id:
+            self.last_id = entry_id
+            sid = parse_stream_id(entry_id)
+            if sid is not None and (self.sent_id is None or sid > self.sent_id):
+                self.sent_id = sid
+
+    def already_sent(self, entry_id: Optional[str]) -> bool:
+        """重放期间实时队列里也会积压同一批条目，这里按 stream id 去重"""
+        if not entry_id or self.sent_id is None:
+            return False
+        sid = parse_stream_id(entry_id)
+        return sid is not None and sid <= self.sent_id
+
+    def stats(self, head_id: str) -> Dict[str, Any]:
+        lag_ms = 0
+        if head_id and self.last_id:
+            lag_ms = max(0, _id_ms(head_id) - _id_ms(self.last_id))
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "filtered": self.filtered,
+            "delivered": self.delivered,
+            "lag_ms": lag_ms,
+            "last_id": self.last_id,
+            "connected_sec": int(time.time() - self.connected_at),
+            "filter": None if self.filter.empty else self.filter.to_dict(),
+            "sampler": self.sampler.stats() if self.sampler else None,
+        }
+
+
+class StreamHub:
+    """
+    单 Stream 的广播器：
+    - 第一个订阅者到来时启动读者任务，没有订阅者时自动退出
+    - 队列元素：(entry_id, payload)；ping/status 的 entry_id 为 None
+    - payload 所有订阅者共用同一个 dict（只读）
+    - 订阅过滤在入队前做：不匹配的条目不进队列、不序列化、不上线
+    - 每条消息带 stream_id，客户端重连时用 ?last_id= 续传（见 replay）
+    """
+
+    def __init__(self, key: str, msg_type: str, status_name: str,
+                 queue_size: int = 1000, policy: str = "drop",
+                 block_ms: int = 2000, count: int = 200,
+                 text_fields: Tuple[str, ...] = (), rate_budget: int = 0):
+        self.key = key
+        self.msg_type = msg_type
+        self.status_name = status_name
+        self.text_fields = text_fields
+        self.rate_budget = rate_budget  # 0 = 这个 Stream 不降采样（告警永远逐条）
+        self.queue_size = queue_size
+        self.policy = policy
+        self.block_ms = block_ms
+        self.count = count
+
+        self._subs: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.head_id = ""
+        self.entries_read = 0
+        self.read_errors = 0
+
+    async def subscribe(self) -> Subscriber:
+        sub = Subscriber(maxsize=self.queue_size, policy=self.policy)
+        self.set_budget(sub, self.rate_budget)
+        self._subs.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subs.discard(sub)
+
+    def set_budget(self, sub: Subscriber, budget: Any) -> None:
+        """客户端可以调整自己的预算（?budget= / subscribe 消息），0 = 关闭；只对开了降采样的 Stream 生效"""
+        if not self.rate_budget:
+            return
+        try:
+            b = max(0, int(budget))
+        except Exception:
+            return
+        sub.sampler = RateSampler(b, WS_SUMMARY_INTERVAL_MS, WS_SUMMARY_TOP) if b else None
+
+    def _roll(self, sub: Subscriber, now: float) -> None:
+        if sub.sampler is not None:
+            summary = sub.sampler.roll(now)
+            if summary is not None:
+                sub.offer((None, summary))
+
+    def _roll_samplers(self) -> int:
+        """
+        读者循环每轮调用：突发结束后没有新条目也要按时发出最后一帧摘要、回到精确模式。
+        返回离最近一个窗口到期还有多少毫秒（XREAD 最多阻塞这么久）；没有采样器时返回 block_ms
+        """
+        now = time.monotonic()
+        wait = float(self.block_ms)
+        for sub in list(self._subs):
+            self._roll(sub, now)
+            if sub.closed:
+                self._subs.discard(sub)
+            elif sub.sampler is not None:
+                s = sub.sampler
+                wait = min(wait, (s.window_start + s.interval - now) * 1000)
+        # BLOCK 0 在 Redis 里是永久阻塞，至少 1ms
+        return max(1, int(wait + 0.999))
+
+    def _broadcast(self, entry_id: Optional[str], payload: Dict[str, Any]) -> None:
+        msg = (entry_id, payload)
+        fields = payload.get("data") if entry_id is not None else None
+        now = time.monotonic()
+        for sub in list(self._subs):
+            sampler = sub.sampler
+            self._roll(sub, now)
+            # ping/status 不过滤；被过滤掉的条目也推进 last_id，lag 只反映真正积压
+            if fields is not None and not sub.filter.match(fields, self.text_fields):
+                sub.filtered += 1
+                sub.last_id = entry_id
+                continue
+            if fields is not None and sampler is not None and not sampler.admit(fields):
+                sub.last_id = entry_id
+                continue
+            sub.offer(msg)
+            if sub.closed:
+                self._subs.discard(sub)
+
+    async def _run(self) -> None:
+        last_id = await astream_latest_id(self.key)
+        self.head_id = last_id
+        beat_at = 0.0
+        idle_since = time.monotonic()
+
+        while self._subs:
+            # 有人在看就续心跳，ingest 侧据此决定要不要写 Stream（RAWLOG_PUBLISH=auto）
+            now = time.monotonic()
+            if now - beat_at >= LIVE_HEARTBEAT_TTL / 4:
+                beat_at = now
+                await alive_heartbeat(self.status_name)
+
+            block_ms = self._roll_samplers()
+            try:
+                res = await astream_xread(self.key, last_id, block_ms, self.count)
+            except Exception:
+                self.read_errors += 1
+                self._broadcast(None, {"type": "status", "data": {"redis": "down", "stream": self.status_name}})
+                await asyncio.sleep(1)
+                continue
+
+            if not res:
+                # 为了按时滚动采样窗口提前醒来的空读不算：累计空闲满 block_ms 才发 ping
+                if (time.monotonic() - idle_since) * 1000 >= self.block_ms:
+                    idle_since = time.monotonic()
+                    self._broadcast(None, {"type": "ping"})
+                continue
+            idle_since = time.monotonic()
+
+            for _, entries in res:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    self.entries_read += 1
+                    self._broadcast(entry_id, self._message(entry_id, fields))
+            self.head_id = last_id
+
+            await asyncio.sleep(0)
+
+    def _message(self, entry_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return {"type": self.msg_type, "stream_id": entry_id, "data": fields}
+
+    async def replay(self, sub: Subscriber, last_id: str, max_entries: int = 10000,
+                     chunk: int = 500) -> AsyncIterator[List[Tuple[Optional[str], Dict[str, Any]]]]:
+        """
+        断线续传：从 last_id 之后开始按块 XRANGE，直到追上 Stream 末尾。
+        调用前 sub 已经订阅，所以期间的实时条目在队列里排着，发送端用 already_sent 去重。
+        - last_id 早于 Stream 里最旧的条目（已被 maxlen 裁掉）：先发一条 gap，再从最旧的开始
+        - 超过 max_entries：发 gap(reason=replay_limit)，剩下的交给实时流
+        """
+        start = parse_stream_id(last_id)
+        if start is None:
+            return
+
+        try:
+            first_id = await astream_first_id(self.key)
+        except Exception:
+            yield [(None, {"type": "status", "data": {"redis": "down", "stream": self.status_name}})]
+            return
+
+        first = parse_stream_id(first_id)
+        cursor = f"{start[0]}-{start[1]}"
+        if first is not None and first != (0, 0) and start < first:
+            yield [(None, {"type": "gap", "data": {
+                "stream": self.status_name, "last_id": last_id, "first_id": first_id, "reason": "trimmed",
+            }})]
+            cursor = first_id
+
+        sent = 0
+        while sent < max_entries:
+            try:
+                raw = await astream_range(self.key, cursor, count=chunk + 1)
+            except Exception:
+                yield [(None, {"type": "status", "data": {"redis": "down", "stream": self.status_name}})]
+                return
+
+            # XRANGE 的起点是闭区间：去掉客户端已经有的那条
+            rows = [(eid, f) for eid, f in raw if parse_stream_id(eid) > start]
+            if not rows:
+                return
+            take = min(chunk, max_entries - sent)
+            more = len(raw) > chunk or len(rows) > take
+            rows = rows[:take]
+
+            out: List[Tuple[Optional[str], Dict[str, Any]]] = []
+            for eid, fields in rows:
+                if sub.filter.match(fields, self.text_fields):
+                    out.append((eid, self._message(eid, fields)))
+                else:
+                    sub.filtered += 1
+            sent += len(rows)
+            if out:
+                yield out
+
+            last = rows[-1][0]
+            start = parse_stream_id(last)
+            cursor = last
+            if not more:
+                return
+
+        yield [(None, {"type": "gap", "data": {
+            "stream": self.status_name, "last_id": cursor, "first_id": None, "reason": "replay_limit",
+        }})]
+
+    def stats(self) -> Dict[str, Any]:
+        subs: List[Dict[str, Any]] = [s.stats(self.head_id) for s in self._subs]
+        return {
+            "stream": self.key,
+            "reader_running": self._task is not None and not self._task.done(),
+            "head_id": self.head_id,
+            "entries_read": self.entries_read,
+            "read_errors": self.read_errors,
+            "subscribers": len(subs),
+            "max_lag_ms": max((s["lag_ms"] for s in subs), default=0),
+            "dropped_total": sum(s["dropped"] for s in subs),
+            "filtered_total": sum(s["filtered"] for s in subs),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "clients": subs,
+        }
+
+
+rawlog_hub = StreamHub(
+    RAWLOG_STREAM_KEY, "log", "rawlog",
+    queue_size=WS_QUEUE_SIZE, policy=WS_SLOW_POLICY, block_ms=WS_XREAD_BLOCK_MS, count=WS_XREAD_COUNT,
+    text_fields=("message",), rate_budget=WS_RATE_BUDGET,
+)
+alert_hub = StreamHub(
+    ALERT_STREAM_KEY, "alert", "alert",
+    queue_size=WS_QUEUE_SIZE, policy=WS_SLOW_POLICY, block_ms=WS_XREAD_BLOCK_MS, count=WS_XREAD_COUNT,
+    text_fields=("alert_type", "attack_ip", "host", "summary", "evidence"),
+)
+
+
+def hub_stats() -> Dict[str, Any]:
+    return {"rawlog": rawlog_hub.stats(), "alert": alert_hub.stats()}
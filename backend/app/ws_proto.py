@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+try:
+    import msgpack  # 可选依赖：没装时 enc=msgpack 自动退回 json
+except ImportError:
+    msgpack = None
+
+
+# -----------------------------
+# WS 线上协议：
+#   v1（默认）：每条 Stream 条目一个 JSON 文本帧，/docs/ws 里的格式不变
+#   batch（opt-in，?proto=batch）：每个 tick 把队列里的消息合并成一个帧
+#       {"type": "batch", "data": [msg, msg, ...]}
+#     tick 结束条件：攒够 batch_max 条，或第一条消息等待超过 batch_ms
+#     编码：enc=json -> 文本帧（配合握手时协商的 permessage-deflate，大帧压缩率高得多）
+#           enc=msgpack -> 二进制帧
+# -----------------------------
+WS_BATCH_MAX_MS = int(os.getenv("WS_BATCH_MAX_MS", "100"))
+WS_BATCH_MAX = int(os.getenv("WS_BATCH_MAX", "500"))
+WS_BATCH_MAX_MS_LIMIT = 2000
+WS_BATCH_MAX_LIMIT = 5000
+
+
+def _int_param(v: Optional[str], default: int, lo: int, hi: int) -> int:
+    try:
+        return max(lo, min(hi, int(v))) if v not in (None, "") else default
+    except Exception:
+        return default
+
+
+class WireOptions:
+    def __init__(self, proto: str = "v1", enc: str = "json",
+                 batch_ms: int = WS_BATCH_MAX_MS, batch_max: int = WS_BATCH_MAX):
+        self.proto = proto
+        self.enc = enc
+        self.batch_ms = batch_ms
+        self.batch_max = batch_max
+
+    @property
+    def batched(self) -> bool:
+        return self.proto == "batch"
+
+    @classmethod
+    def from_query(cls, qp: Mapping[str, Any]) -> "WireOptions":
+        proto = str(qp.get("proto") or "v1").strip().lower()
+        if proto != "batch":
+            return cls()
+        enc = str(qp.get("enc") or "json").strip().lower()
+        if enc != "msgpack" or msgpack is None:
+            enc = "json"
+        return cls(
+            proto="batch",
+            enc=enc,
+            batch_ms=_int_param(qp.get("batch_ms"), WS_BATCH_MAX_MS, 1, WS_BATCH_MAX_MS_LIMIT),
+            batch_max=_int_param(qp.get("batch_max"), WS_BATCH_MAX, 1, WS_BATCH_MAX_LIMIT),
+        )
+
+    def hello(self) -> Dict[str, Any]:
+        """batch 模式连上后的第一帧（总是 JSON 文本），告诉客户端实际生效的参数"""
+        return {
+            "type": "hello",
+            "data": {
+                "proto": self.proto,
+                "enc": self.enc,
+                "batch_ms": self.batch_ms,
+                "batch_max": self.batch_max,
+                "msgpack_available": msgpack is not None,
+            },
+        }
+
+    def encode(self, frame: Dict[str, Any]) -> Tuple[bool, Any]:
+        """返回 (is_binary, data)"""
+        if self.enc == "msgpack":
+            return True, msgpack.packb(frame, use_bin_type=True)
+        return False, json.dumps(frame, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+async def collect_batch(queue: "asyncio.Queue[Any]", first: Any, batch_ms: int, batch_max: int,
+                        close_marker: Any) -> Tuple[List[Any], bool]:
+    """
+    已经拿到第一条 first，再在 batch_ms 内尽量多取，最多 batch_max 条。
+    返回 (items, closed)；遇到 close_marker 立刻结束，closed=True（marker 本身不放进 items）。
+    """
+    items: List[Any] = [first]
+    deadline = time.monotonic() + batch_ms / 1000.0
+
+    while len(items) < batch_max:
+        # 先把已经在队列里的一口气取完，不用每条都走一次 wait_for
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+        if item is close_marker:
+            return items, True
+        items.append(item)
+
+    return items, False
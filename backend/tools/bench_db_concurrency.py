@@ -0,0 +1,94 @@
+"""
+历史查询并发基准：同步 Session + 线程池 vs AsyncSession（aiomysql）
+
+用法（在 backend/ 下，连 .env 里的 MySQL 或 DATABASE_URL 指定的库；异步部分需要 pip install aiomysql / aiosqlite）：
+    python -m tools.bench_db_concurrency --concurrency 10,50,200 --requests 2000
+
+同步组模拟 FastAPI 对 def 接口的处理：请求先排队等 anyio 线程池（默认 40 个线程），
+拿到线程后再用同步 Session 查库；异步组在事件循环里直接 await，只受连接池大小限制。
+两组跑的都是 /logs/recent 默认参数下的同一条 SQL，打印吞吐和 p50 / p95 / p99 延迟。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anyio  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.db import AsyncSessionLocal, SessionLocal, async_engine_error  # noqa: E402
+from app.models import RawLog  # noqa: E402
+
+
+def _stmt(limit: int):
+    return select(RawLog).order_by(RawLog.id.desc()).limit(limit)
+
+
+def _sync_query(limit: int) -> int:
+    db = SessionLocal()
+    try:
+        return len(db.execute(_stmt(limit)).scalars().all())
+    finally:
+        db.close()
+
+
+async def _async_query(limit: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return len((await db.execute(_stmt(limit))).scalars().all())
+
+
+async def _run(kind: str, concurrency: int, total: int, limit: int, threads: int) -> dict:
+    limiter = anyio.CapacityLimiter(threads)
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            if kind == "sync":
+                await anyio.to_thread.run_sync(_sync_query, limit, limiter=limiter)
+            else:
+                await _async_query(limit)
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    q = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))]  # noqa: E731
+    return {"rps": total / wall, "p50": statistics.median(lat), "p95": q(0.95), "p99": q(0.99)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="10,50,200")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--limit", type=int, default=200)
+    ap.add_argument("--threads", type=int, default=40, help="模拟 anyio 默认线程池大小")
+    args = ap.parse_args()
+
+    kinds = ["sync"]
+    if AsyncSessionLocal is not None:
+        kinds.append("async")
+    else:
+        print(f"[async skipped] {async_engine_error}")
+
+    # 整个基准跑在同一个事件循环里：异步连接池里的连接绑定在创建它的 loop 上
+    async def bench():
+        print(f"{'kind':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for c in [int(x) for x in args.concurrency.split(",") if x.strip()]:
+            for kind in kinds:
+                r = await _run(kind, c, args.requests, args.limit, args.threads)
+                print(f"{kind:<6} {c:>5} {r['rps']:>9.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f}")
+
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
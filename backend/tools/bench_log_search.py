@@ -0,0 +1,149 @@
+"""
+raw_logs 搜索延迟基准：LIKE '%kw%' vs FULLTEXT(ngram) / FTS5(trigram)
+
+用法（在 backend/ 下）：
+    python -m tools.bench_log_search --sizes 10000,100000,1000000
+    python -m tools.bench_log_search --url sqlite:///bench.db --sizes 10000,100000
+
+按 sizes 逐级往一张独立的表 bench_raw_logs 里灌合成日志（不碰线上 raw_logs），
+每一级对同一组关键词分别用两种方式查 /logs/recent 同款 SQL（ORDER BY id DESC LIMIT），
+打印 p50 / p95 毫秒。MySQL 的 ft 列是 FULLTEXT，SQLite 的 ft 列是 FTS5（不需要任何外部服务）；
+其他后端只有 like 一列。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from app.db import DATABASE_URL  # noqa: E402
+
+TABLE = "bench_raw_logs"
+HOSTS = [f"srv-{i:02d}" for i in range(20)]
+LEVELS = ["INFO", "INFO", "INFO", "WARN", "ERROR"]
+TEMPLATES = [
+    "Failed password for invalid user {u} from 10.{a}.{b}.{c} port {p} ssh2",
+    "Accepted password for {u} from 10.{a}.{b}.{c} port {p} ssh2",
+    '10.{a}.{b}.{c} - - "GET /api/v1/items/{p} HTTP/1.1" 200 {p}',
+    '10.{a}.{b}.{c} - - "POST /login HTTP/1.1" 401 {p}',
+    "session opened for user {u} by (uid=0)",
+    "kernel: TCP: request_sock_TCP: Possible SYN flooding on port {p}",
+]
+USERS = ["root", "admin", "test", "ubuntu", "oracle", "deploy", "git"]
+KEYWORDS = ["Failed password", "SYN flooding", "/login", "oracle", "10.7.3.", "uid=0"]
+
+
+def _msg(rnd: random.Random) -> str:
+    return rnd.choice(TEMPLATES).format(
+        u=rnd.choice(USERS), a=rnd.randint(0, 255), b=rnd.randint(0, 255), c=rnd.randint(0, 255),
+        p=rnd.randint(1, 65535),
+    )
+
+
+def setup(engine) -> str:
+    dialect = engine.dialect.name
+    mysql = dialect == "mysql"
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}_fts"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        if mysql:
+            conn.execute(text(
+                f"CREATE TABLE {TABLE} (id INT AUTO_INCREMENT PRIMARY KEY, host VARCHAR(128), "
+                f"level VARCHAR(16), message TEXT, FULLTEXT KEY ft_msg (message) WITH PARSER ngram) "
+                f"DEFAULT CHARSET=utf8mb4"
+            ))
+        else:
+            conn.execute(text(
+                f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY AUTOINCREMENT, host VARCHAR(128), "
+                f"level VARCHAR(16), message TEXT)"
+            ))
+        if dialect == "sqlite":
+            # 和 search.py 的 raw_logs_fts 同样的外部内容表 + 插入触发器，写入开销也算进去
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {TABLE}_fts USING fts5(message, content='{TABLE}', "
+                f"content_rowid='id', tokenize='trigram')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+                f"INSERT INTO {TABLE}_fts(rowid, message) VALUES (new.id, new.message); END"
+            ))
+    return dialect
+
+
+def fill(engine, upto: int, have: int, rnd: random.Random, batch: int = 5000) -> None:
+    sql = text(f"INSERT INTO {TABLE} (host, level, message) VALUES (:host, :level, :message)")
+    while have < upto:
+        n = min(batch, upto - have)
+        rows = [{"host": rnd.choice(HOSTS), "level": rnd.choice(LEVELS), "message": _msg(rnd)} for _ in range(n)]
+        with engine.begin() as conn:
+            conn.execute(sql, rows)
+        have += n
+
+
+def timed(engine, sql: str, params: dict, repeat: int) -> list:
+    out = []
+    with engine.connect() as conn:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default=DATABASE_URL)
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--limit", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--keep", action="store_true", help="结束后保留 bench 表")
+    args = ap.parse_args()
+
+    engine = create_engine(args.url)
+    dialect = setup(engine)
+    rnd = random.Random(42)
+    like_sql = f"SELECT id, message FROM {TABLE} WHERE message LIKE :pat ORDER BY id DESC LIMIT {args.limit}"
+    ft_sql = (
+        f"SELECT id, message FROM {TABLE} WHERE MATCH(message) AGAINST (:phrase IN BOOLEAN MODE) "
+        f"AND message LIKE :pat ORDER BY id DESC LIMIT {args.limit}"
+    ) if dialect == "mysql" else (
+        f"SELECT id, message FROM {TABLE} WHERE id IN "
+        f"(SELECT rowid FROM {TABLE}_fts WHERE {TABLE}_fts MATCH :phrase) ORDER BY id DESC LIMIT {args.limit}"
+    )
+    has_ft = dialect in ("mysql", "sqlite")
+
+    print(f"{'rows':>10} {'keyword':<18} {'like p50':>9} {'like p95':>9} {'ft p50':>9} {'ft p95':>9}")
+    have = 0
+    try:
+        for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+            fill(engine, size, have, rnd)
+            have = size
+            if dialect == "mysql":
+                with engine.begin() as conn:
+                    conn.execute(text(f"ANALYZE TABLE {TABLE}"))
+            for kw in KEYWORDS:
+                params = {"pat": f"%{kw}%", "phrase": f'"{kw}"'}
+                lk = sorted(timed(engine, like_sql, params, args.repeat))
+                row = f"{size:>10} {kw:<18} {statistics.median(lk):>9.1f} {lk[int(len(lk) * 0.95) - 1]:>9.1f}"
+                if has_ft:
+                    ft = sorted(timed(engine, ft_sql, params, args.repeat))
+                    row += f" {statistics.median(ft):>9.1f} {ft[int(len(ft) * 0.95) - 1]:>9.1f}"
+                print(row)
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                if dialect == "sqlite":
+                    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}_fts"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+历史接口序列化基准：Pydantic response_model（旧） vs Core 元组 + orjson（快路径）
+
+用法（在 backend/ 下）：
+    python -m tools.bench_serialize                      # 临时 SQLite 库，不需要任何外部服务
+    python -m tools.bench_serialize --url "$DATABASE_URL" --limit 2000 --repeat 30
+
+旧路径按改造前的接口逐步复现：ORM 实体查询 -> 每行 RawLogOut / AlertOut -> FastAPI serialize_response
+（逐行按 response_model 校验）-> JSONResponse 渲染；快路径就是接口现在用的 rawlog_items / alert_items + dumps。
+两边都包含查库，打印 p50 / p95 毫秒和响应字节数，并校验两边输出的 JSON 完全一致。
+表里不足 limit 行时先补齐合成数据（--url 指向线上库时请加 --no-seed）。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default=None, help="默认临时 SQLite 文件")
+    ap.add_argument("--limit", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--no-seed", action="store_true")
+    args = ap.parse_args()
+    # app.db 在 import 时读取 DATABASE_URL
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{tempfile.mkdtemp(prefix='bench-ser-')}/bench.db"
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from sqlalchemy import func, select
+
+    from app import main as m
+    from app.db import Base, SessionLocal, engine
+    from app.fastjson import dumps, encoder_name
+    from app.models import Alert, RawLog
+    from app.schemas import AlertOut, RawLogOut
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if not args.no_seed:
+        _seed(db, RawLog, Alert, func, select, args.limit)
+
+    routes = {r.path: r for r in m.app.routes if hasattr(r, "response_field")}
+    loop = asyncio.new_event_loop()
+    alert_stmt = select(*m._ALERT_SUMMARY_COLS, Alert.evidence).order_by(Alert.id.desc()).limit(args.limit)
+
+    def old_logs() -> bytes:
+        rows = db.execute(select(RawLog).order_by(RawLog.id.desc()).limit(args.limit)).scalars().all()
+        out = [
+            RawLogOut(id=x.id, source=x.source, host=x.host, level=x.level, message=x.message,
+                      created_at=m.fmt_cn(x.created_at) if x.created_at else None)
+            for x in reversed(rows)
+        ]
+        r = routes["/logs/recent"]
+        content = loop.run_until_complete(serialize_response(field=r.response_field, response_content=out,
+                                                             is_coroutine=True))
+        return JSONResponse(content).body
+
+    def new_logs() -> bytes:
+        rows = db.execute(select(*m._RAWLOG_LIST_COLS).order_by(RawLog.id.desc()).limit(args.limit)).all()
+        items = m.rawlog_items(rows)
+        items.reverse()
+        return dumps(items)
+
+    def old_alerts() -> bytes:
+        rows = db.execute(alert_stmt).all()
+        out = []
+        for a in rows:
+            item = AlertOut(id=a.id, alert_type=a.alert_type, severity=a.severity, attack_ip=a.attack_ip, host=a.host,
+                            count=a.count, window_seconds=a.window_seconds, case_id=a.case_id,
+                            created_at=m.fmt_cn(a.created_at))
+            item.evidence = json.loads(a.evidence)
+            out.append(item)
+        r = routes["/alerts"]
+        content = loop.run_until_complete(serialize_response(field=r.response_field, response_content=out,
+                                                             exclude_unset=True, is_coroutine=True))
+        return JSONResponse(content).body
+
+    def new_alerts() -> bytes:
+        rows = db.execute(alert_stmt).all()
+        return dumps(m.alert_items(rows, include_evidence=True))
+
+    print(f"encoder={encoder_name()} limit={args.limit} url={engine.url.render_as_string(hide_password=True)}")
+    print(f"{'case':<32} {'p50 ms':>8} {'p95 ms':>8} {'bytes':>10}")
+    for name, old, new in (("logs", old_logs, new_logs), ("alerts+evidence", old_alerts, new_alerts)):
+        a, b = old(), new()
+        if json.loads(a) != json.loads(b):
+            raise SystemExit(f"{name}: fast path output differs from response_model output")
+        for tag, fn in (("response_model", old), ("fast path", new)):
+            lat = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                body = fn()
+                lat.append((time.perf_counter() - t0) * 1000)
+            lat.sort()
+            p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            print(f"{name + ' / ' + tag:<32} {statistics.median(lat):>8.1f} {p95:>8.1f} {len(body):>10}")
+    db.close()
+    loop.close()
+
+
+def _seed(db, RawLog, Alert, func, select, n: int) -> None:
+    have = db.execute(select(func.count()).select_from(RawLog)).scalar() or 0
+    if have < n:
+        db.add_all([
+            RawLog(source="nginx", host=f"web-{i % 8}", level="WARN" if i % 5 else "ERROR",
+                   message=f'10.1.{i % 256}.{i % 97} - - "GET /api/v1/items/{i}?q=测试 HTTP/1.1" 404 {i % 9000} "-" "curl/8.0"')
+            for i in range(n - have)
+        ])
+        db.commit()
+    have = db.execute(select(func.count()).select_from(Alert)).scalar() or 0
+    if have < n:
+        ev = {"events": [{"ts": 1700000000 + k, "path": f"/admin/{k}", "status": 404} for k in range(10)],
+              "assessment": {"score": 0.8, "note": "路径爆破"}}
+        db.add_all([
+            Alert(alert_type="HTTP_PATH_BRUTEFORCE", severity="HIGH", attack_ip=f"10.9.{i % 256}.{i % 13}",
+                  host="web-1", count=10 + i % 50, window_seconds=60, evidence=json.dumps(ev, ensure_ascii=False))
+            for i in range(n - have)
+        ])
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,9 @@ class Channel {
   private backoffMs = 500; // 初始 0.5s
   private maxBackoffMs = 8000;
 
+  // ✅ 断线续传：记住最后一条消息的 stream_id，重连时带 ?last_id=，服务端从 Redis Stream 补发
+  private lastStreamId = "";
+
   // ✅ 防止 CONNECTING 卡死
   private connectStartedAt = 0;
   private connectingGuardTimer: number | null = null;
@@ -93,6 +96,12 @@ class Channel {
     }
   }
 
+  private resumeUrl() {
+    if (!this.lastStreamId) return this.url;
+    const sep = this.url.includes("?") ? "&" : "?";
+    return `${this.url}${sep}last_id=${encodeURIComponent(this.lastStreamId)}`;
+  }
+
   connect() {
     // 已经有连接或正在连接：正常情况下直接复用
     if (this.ws && (this.ws.readyState === WebSocket.OPEN)) return;
@@ -111,7 +120,7 @@ class Channel {
 
     this.connectStartedAt = Date.now();
 
-    const ws = new WebSocket(this.url);
+    const ws = new WebSocket(this.resumeUrl());
     this.ws = ws;
 
     // ✅ CONNECTING 守护：10s 还没 open，则重建并走重连
@@ -136,6 +145,7 @@ class Channel {
       try {
         const msg = JSON.parse(ev.data as any);
         if (msg?.type === "ping") return;
+        if (msg?.stream_id) this.lastStreamId = String(msg.stream_id);
         this.onJsonSet.forEach((fn) => { try { fn(msg); } catch {} });
       } catch {
         // 非 JSON 忽略
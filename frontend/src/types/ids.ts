@@ -17,6 +17,9 @@ export type AlertRow = {
   host: string;
   count: number;
   window_seconds: number;
-  evidence: any; // 后端可能是 list/str，都兼容
+  evidence?: any; // 后端可能是 list/str，都兼容；WS 推送的精简通知不带，按需拉 /alerts/{id}/evidence
+  summary?: string;
+  evidence_size?: number | string;
+  case_id?: string | null;
   created_at: string;
 };